@@ -1,5 +1,6 @@
 DEPS = [
     'depot_tools/depot_tools',
+    'flutter/os_utils',
     'flutter/retry',
     'flutter/test_utils',
     'recipe_engine/cipd',
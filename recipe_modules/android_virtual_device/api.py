@@ -230,11 +230,7 @@ class AndroidVirtualDeviceApi(recipe_api.RecipeApi):
     """
     assert self.m.platform.is_linux
     with self.m.step.nest('kill and cleanup avd'):
-      self.m.step('List processes before cleaning up', ['ps', 'aux'])
-      # Accepting any return code because when the emulator dies the pid is no longer
-      # available causing an exception.
-      self.m.step(
-          'Kill emulator cleanup', ['pkill', '-9', '-e', '-f', 'emulator'],
-          ok_ret='any'
+      # The report lists the killed emulator and QEMU processes.
+      self.m.os_utils.reap_processes(
+          'Kill emulator cleanup', cmdline_patterns=['emulator']
       )
-      self.m.step('List processes after cleaning up', ['ps', 'aux'])
@@ -9,6 +9,8 @@ DEPS = [
     'flutter/repo_util',
     'recipe_engine/buildbucket',
     'recipe_engine/file',
+    'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/properties',
+    'recipe_engine/step',
 ]
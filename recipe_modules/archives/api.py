@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 import attr
+import collections
 import re
 
 from recipe_engine import recipe_api
@@ -169,6 +170,73 @@ class ArchivesApi(recipe_api.RecipeApi):
         metadata=metadata,
     )
 
+  def upload_artifacts(self, paths, metadata=None):
+    """Uploads a list of local objects to their gcs destinations.
+
+    Files are grouped by destination bucket and mirrored into one upload tree
+    per bucket using hardlinks, then each bucket is uploaded with a single
+    multithreaded gsutil invocation.
+
+    Args:
+      paths: (list) a list of ArchivePaths with the local and remote locations.
+      metadata: (dict) a dictionary with the header as key and its content as value.
+
+    Returns:
+      The list of ArchivePaths that were uploaded, in the input order, with
+      the gs:// url each object was uploaded to as remote.
+
+    Raises:
+      StepFailure: if a local object does not exist, nothing is uploaded.
+    """
+    if not paths:
+      return []
+    files = []
+    for path in paths:
+      bucket, object_path = self._split_dst_parts(path.remote)
+      files.append([str(path.local), bucket, object_path])
+    archive_dir = self.m.path.mkdtemp()
+    step = self.m.step(
+        'Stage %d artifacts' % len(files),
+        ['python3', self.resource('stage_artifacts.py')],
+        stdin=self.m.json.input({
+            'root': str(archive_dir),
+            'files': files,
+        }),
+        stdout=self.m.json.output(),
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            'files': [{
+                'local': local,
+                'url': 'gs://%s/%s' % (bucket, object_path),
+                'status': 'linked',
+            } for local, bucket, object_path in files]
+        }),
+    )
+    staged = step.stdout['files']
+    missing = [f['local'] for f in staged if f['status'] == 'missing']
+    if missing:
+      step.presentation.status = self.m.step.FAILURE
+      step.presentation.logs['missing'] = missing
+      raise self.m.step.StepFailure(
+          'Missing %d artifacts: %s' % (len(missing), ', '.join(missing))
+      )
+    buckets = collections.OrderedDict()
+    for _, bucket, _ in files:
+      buckets[bucket] = buckets.get(bucket, 0) + 1
+    for bucket, count in buckets.items():
+      self.m.gsutil.upload(
+          name='Upload %d artifacts to %s' % (count, bucket),
+          source='%s/*' % (archive_dir / bucket),
+          bucket=bucket,
+          dest='',
+          args=['-r'],
+          metadata=metadata,
+          multithreaded=True,
+      )
+    return [
+        ArchivePaths(path.local, result['url'])
+        for path, result in zip(paths, staged)
+    ]
+
   def download(self, src, dst):
     """Downloads a file from GCS.
 
@@ -9,6 +9,7 @@ DEPS = [
     'flutter/archives',
     'flutter/monorepo',
     'recipe_engine/buildbucket',
+    'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/properties',
     'recipe_engine/raw_io',
@@ -26,7 +27,13 @@ def RunSteps(api):
   for result in results:
     found = result.remote in expected_destinations
     assert found, 'Unexpected file generated %s' % result.remote
-  if results:
+  if api.properties.get('batch_upload'):
+    uploaded = api.archives.upload_artifacts(results)
+    # Destinations are normalized to gs:// urls.
+    assert [u.local for u in uploaded] == [r.local for r in results], uploaded
+    assert all(u.remote.startswith('gs://') for u in uploaded), uploaded
+    assert api.archives.upload_artifacts([]) == []
+  elif results:
     api.archives.upload_artifact(results[0].local, results[0].remote)
     api.archives.download(results[0].remote, results[0].local)
 
@@ -193,6 +200,62 @@ def GenTests(api):
       )
   )
 
+  yield api.test(
+      'batch_upload',
+      api.properties(
+          config=archive_config,
+          expected_destinations=prod_pool_production_realm,
+          batch_upload=True,
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          build_id=98765
+      ),
+      api.step_data(
+          'git rev-parse',
+          stdout=api.raw_io
+          .output_text('12345abcde12345abcde12345abcde12345abcde\n')
+      )
+  )
+
+  yield api.test(
+      'batch_upload_missing_artifact',
+      api.properties(
+          config=archive_config,
+          expected_destinations=prod_pool_production_realm,
+          batch_upload=True,
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          build_id=98765
+      ),
+      api.step_data(
+          'git rev-parse',
+          stdout=api.raw_io
+          .output_text('12345abcde12345abcde12345abcde12345abcde\n')
+      ),
+      api.step_data(
+          'Stage 5 artifacts',
+          stdout=api.json.output({
+              'files': [{
+                  'local': '[START_DIR]/out/android_profile/zip_archives/'
+                           'android-arm-profile/artifacts.zip',
+                  'url': 'gs://flutter_archives_v2/flutter_infra_release/'
+                         'flutter/12345abcde12345abcde12345abcde12345abcde/'
+                         'android-arm-profile/artifacts.zip',
+                  'status': 'missing',
+              }]
+          })
+      ),
+      status='FAILURE',
+  )
+
   # Prod LUCI pool with "experimental" realm in build configuration file.
   prod_pool_experimental_realm = try_pool_production_realm
   prod_pool_experimental_realm_config = copy.deepcopy(archive_config)
@@ -0,0 +1,65 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Mirrors artifacts into per-bucket upload trees using hardlinks.
+
+The input is read as JSON from stdin with the following format:
+
+  {
+    "root": "/path/to/staging/root",
+    "files": [["/local/artifact.zip", "bucket", "path/in/bucket.zip"], ...]
+  }
+
+Every file is linked to root/bucket/path/in/bucket.zip so each bucket can be
+uploaded with a single recursive copy. File contents are only copied when a
+hardlink can not be created (e.g. across devices).
+
+Prints the status of every file as JSON, in the input order:
+
+  {
+    "files": [
+      {
+        "local": "/local/artifact.zip",
+        "url": "gs://bucket/path/in/bucket.zip",
+        "status": "linked" | "copied" | "missing"
+      },
+      ...
+    ]
+  }
+"""
+
+import json
+import os
+import shutil
+import sys
+
+
+def stage(root, src, bucket, path):
+  """Stages |src| under |root| and returns its status."""
+  if not os.path.isfile(src):
+    return 'missing'
+  dst = os.path.join(root, bucket, *path.split('/'))
+  os.makedirs(os.path.dirname(dst), exist_ok=True)
+  try:
+    os.link(src, dst)
+    return 'linked'
+  except OSError:
+    shutil.copy2(src, dst)
+    return 'copied'
+
+
+def main():
+  data = json.load(sys.stdin)
+  files = []
+  for src, bucket, path in data['files']:
+    files.append({
+        'local': src,
+        'url': 'gs://%s/%s' % (bucket, path),
+        'status': stage(data['root'], src, bucket, path),
+    })
+  json.dump({'files': files}, sys.stdout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
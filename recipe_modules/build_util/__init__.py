@@ -7,8 +7,10 @@ DEPS = [
     'flutter/goma',
     'flutter/logs_util',
     'flutter/rbe',
+    'recipe_engine/buildbucket',
     'recipe_engine/context',
     'recipe_engine/file',
+    'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/platform',
     'recipe_engine/properties',
@@ -9,6 +9,17 @@ from recipe_engine import recipe_api
 # The default latency (seconds) to collect RBE logs.
 COLLECT_RBE_LOGS_LATENCY_SECS = 1800
 
+# Concurrent jobs per core of goma/rbe builds.
+DEFAULT_CORE_MULTIPLIER = 80
+# The most concurrent jobs the adaptive mode may try, per core on Linux.
+MAX_CORE_MULTIPLIER = 160
+# On windows, j value higher than 1000 does not improve build
+# performance.
+MAX_JOBS_WIN = 1000
+# On macOS, j value higher than 800 causes 'Too many open files' error
+# (crbug.com/936864).
+MAX_JOBS_MAC = 800
+
 
 class BuildUtilApi(recipe_api.RecipeApi):
   """Gn and Ninja wrapper functions."""
@@ -49,18 +60,94 @@ class BuildUtilApi(recipe_api.RecipeApi):
     if not self.use_goma and not self.use_rbe:
       return 5 if self._test_data.enabled else cores
 
-    default_core_multiplier = 80
-    j_value = cores * default_core_multiplier
-    if self.m.platform.is_win:
-      # On windows, j value higher than 1000 does not improve build
-      # performance.
-      j_value = min(j_value, 1000)
-    elif self.m.platform.is_mac:
-      # On macOS, j value higher than 800 causes 'Too many open files' error
-      # (crbug.com/936864).
-      j_value = min(j_value, 800)
+    j_value = min(cores * DEFAULT_CORE_MULTIPLIER, self._max_j_value(cores))
     return 200 if self._test_data.enabled else j_value
 
+  def _max_j_value(self, cores):
+    """Returns the upper bound of concurrent jobs for the current machine."""
+    if self.m.platform.is_win:
+      return MAX_JOBS_WIN
+    if self.m.platform.is_mac:
+      return MAX_JOBS_MAC
+    return cores * MAX_CORE_MULTIPLIER
+
+  def _ninja_jobs_step(self, name, command, data, test_data):
+    """Runs resources/ninja_jobs.py |command| with |data| as input."""
+    return self.m.step(
+        name,
+        ['python3', self.resource('ninja_jobs.py'), command],
+        stdin=self.m.json.input(data),
+        stdout=self.m.json.output(),
+        infra_step=True,
+        step_test_data=lambda: self.m.json.test_api.output_stream(test_data),
+    )
+
+  def _ninja_jobs_data(self, config):
+    """Returns where the adaptive -j values of |config| are persisted."""
+    return {
+        'state_file':
+            str(self.m.path.cache_dir / 'builder' / 'ninja_jobs.json'),
+        'key': f'{self.m.buildbucket.builder_name}/{config}',
+    }
+
+  def _adaptive_j_value(self, config):
+    """Chooses the concurrent jobs of an rbe build from the previous builds.
+
+    Args:
+      config(str): A string with the configuration to build.
+
+    Returns:
+      A dict with the ninja -j and -l values.
+    """
+    cores = multiprocessing.cpu_count()
+    data = self._ninja_jobs_data(config)
+    data.update({
+        'default_jobs': self._calculate_j_value(),
+        'max_jobs': self._max_j_value(cores),
+    })
+    step = self._ninja_jobs_step(
+        'calculate ninja jobs', 'choose', data, {
+            'jobs': 200,
+            'load_limit': 16,
+            'source': 'default',
+        }
+    )
+    choice = step.stdout
+    step.presentation.step_text = f"-j {choice['jobs']} ({choice['source']})"
+    step.presentation.properties['ninja_jobs'] = choice['jobs']
+    return choice
+
+  def _record_j_value(self, config, jobs, stats_file):
+    """Persists the throughput of a build for the next adaptive -j choice.
+
+    Args:
+      config(str): A string with the configuration to build.
+      jobs(int): The ninja -j value of the build.
+      stats_file(Path): The duration and load samples of the build, written
+        by `ninja_jobs.py run`.
+    """
+    summary = self.m.rbe.summary or {}
+    data = self._ninja_jobs_data(config)
+    data.update({
+        'jobs': jobs,
+        'stats_file': str(stats_file),
+        'actions': summary.get('actions', 0),
+        'cache_hits': summary.get('completion_status', {}).get('CACHE_HIT', 0),
+        'local_fallbacks': summary.get('local_fallbacks', 0),
+    })
+    step = self._ninja_jobs_step(
+        'record ninja jobs', 'record', data, {
+            'best_jobs': jobs,
+            'next_jobs': jobs,
+            'last': {'jobs': jobs, 'actions_per_second': 1.0},
+        }
+    )
+    last = (step.stdout or {}).get('last', {})
+    if 'actions_per_second' in last:
+      step.presentation.properties['rbe_actions_per_second'] = (
+          last['actions_per_second']
+      )
+
   def _build_rbe(
       self, config, checkout_path, targets, tool, rbe_working_path, env
   ):
@@ -75,8 +162,28 @@ class BuildUtilApi(recipe_api.RecipeApi):
     """
     assert rbe_working_path
     build_dir = checkout_path / f'out/{config}'
-    rbe_jobs = self._calculate_j_value()
-    ninja_args = [tool, '-j', rbe_jobs, '-C', build_dir]
+    adaptive = self.m.properties.get('adaptive_ninja_jobs', False)
+    if adaptive:
+      choice = self._adaptive_j_value(config)
+      rbe_jobs = choice['jobs']
+      stats_file = self.m.path.mkdtemp('ninja-stats') / 'stats.json'
+      # The wrapper raises the open-file limit ninja runs with, and samples
+      # the load average during the build.
+      ninja_args = [
+          'python3',
+          self.resource('ninja_jobs.py'),
+          'run',
+          stats_file,
+          tool,
+          '-j',
+          rbe_jobs,
+          '-l',
+          choice['load_limit'],
+      ]
+    else:
+      rbe_jobs = self._calculate_j_value()
+      ninja_args = [tool, '-j', rbe_jobs]
+    ninja_args.extend(['-C', build_dir])
     ninja_args.extend(targets)
     with self.m.rbe(
         working_path=rbe_working_path,
@@ -89,6 +196,9 @@ class BuildUtilApi(recipe_api.RecipeApi):
       except self.m.step.StepFailure:
         self._upload_crash_reproducer(env)
         raise
+    # The rbe summary is only available once reproxy has been stopped.
+    if adaptive:
+      self._record_j_value(config, rbe_jobs, stats_file)
 
   def _build_goma(self, config, checkout_path, targets, tool, env):
     """Builds using ninja and goma.
@@ -2,7 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-from recipe_engine.post_process import DoesNotRun, Filter, StatusFailure
+from recipe_engine.post_process import DoesNotRun, Filter, MustRun, StatusFailure
 
 DEPS = [
     'flutter/build_util',
@@ -82,3 +82,9 @@ def GenTests(api):
       ),
       status='FAILURE',
   )
+  yield api.test(
+      'adaptive_ninja_jobs',
+      api.properties(no_lto=True, adaptive_ninja_jobs=True),
+      api.post_process(MustRun, 'calculate ninja jobs'),
+      api.post_process(MustRun, 'record ninja jobs'),
+  )
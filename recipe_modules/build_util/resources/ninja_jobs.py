@@ -0,0 +1,230 @@
+# Copyright 2024 The Flutter Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Chooses the ninja -j value of a remote build and learns from each build.
+
+Usage:
+  ninja_jobs.py choose|record, with a json dict on stdin.
+  ninja_jobs.py run <stats file> <ninja command>...
+
+choose reads:
+  state_file: json file in the builder cache with the state of each key.
+  key: the builder and config the value is for.
+  default_jobs: the calibrated value of the platform, used on the first run.
+  max_jobs: the upper bound of the platform.
+and prints {jobs, load_limit, source, ...}. The value is capped by the
+open-file limit ninja runs with, see run, and load_limit is passed to
+ninja -l so it stops starting jobs while the local load average is too high.
+
+run raises the open-file soft limit, runs the ninja command and samples the
+load average while it runs. The duration and the load samples of the build
+are written to the stats file, the exit code of ninja is returned.
+
+record reads state_file, key, jobs, stats_file, and the actions and
+cache_hits and local_fallbacks of the build. The throughput is the number of
+cache misses per second, cache hits cost close to nothing and would make a
+cache-heavy build look best forever. The best throughput decays on each
+build so an old outlier does not pin the value. The next value to try is
+lower when reproxy fell back to local execution or the build was throttled
+by the load limit, higher when the current value is the best one seen so
+far. Prints the updated state.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# File descriptors used by ninja and rewrapper for each running action.
+FDS_PER_JOB = 4
+# File descriptors kept for everything else ninja opens.
+FD_RESERVE = 512
+# Highest open-file limit tried when the hard limit is unlimited, macOS
+# refuses values above kern.maxfilesperproc.
+MAX_OPEN_FILES = 10240
+# Share of actions falling back to local execution above which the remote
+# backend is considered saturated.
+MAX_LOCAL_FALLBACK_RATIO = 0.05
+# Step of each adjustment of the next value.
+STEP = 0.1
+# The load limit given to ninja -l, per core.
+LOAD_PER_CORE = 2
+# Share of the load limit above which the build is considered throttled by
+# ninja -l, so more jobs would not run more actions.
+THROTTLED_LOAD_RATIO = 0.9
+# Factor applied to the best throughput on each build.
+BEST_THROUGHPUT_DECAY = 0.9
+# Seconds between two load average samples while ninja runs.
+LOAD_SAMPLE_INTERVAL = 30
+
+
+def raise_open_files_limit():
+  """Raises the open-file soft limit as far as allowed.
+
+  The limit is inherited by the processes started afterwards, e.g. ninja.
+
+  Returns:
+    The soft limit, None if there is no limit to worry about.
+  """
+  try:
+    import resource  # pylint: disable=import-outside-toplevel
+  except ImportError:
+    # Windows has no per process open-file limit worth checking.
+    return None
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  if hard == resource.RLIM_INFINITY:
+    candidates = [MAX_OPEN_FILES]
+  else:
+    candidates = [hard, min(hard, MAX_OPEN_FILES)]
+  for candidate in candidates:
+    if soft != resource.RLIM_INFINITY and candidate <= soft:
+      break
+    try:
+      resource.setrlimit(resource.RLIMIT_NOFILE, (candidate, hard))
+      break
+    except (ValueError, OSError):
+      continue
+  soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+  return None if soft == resource.RLIM_INFINITY else soft
+
+
+def open_files_cap(cores):
+  """Returns the most jobs the open-file limit of ninja allows, or None."""
+  limit = raise_open_files_limit()
+  if limit is None:
+    return None
+  return max(cores, (limit - FD_RESERVE) // FDS_PER_JOB)
+
+
+def load_average():
+  try:
+    return os.getloadavg()[0]
+  except (AttributeError, OSError):
+    return None
+
+
+def read_json(path, default):
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    # First run on this bot, or a corrupted cache.
+    return default
+
+
+def write_state(path, state):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp = path + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(state, f, indent=2, sort_keys=True)
+  os.replace(tmp, path)
+
+
+def choose(data):
+  cores = os.cpu_count() or 1
+  entry = read_json(data['state_file'], {}).get(data['key'], {})
+  jobs = entry.get('next_jobs') or entry.get('best_jobs')
+  source = 'cache' if jobs else 'default'
+  jobs = jobs or data['default_jobs']
+  if jobs > data['max_jobs']:
+    jobs = data['max_jobs']
+    source = 'platform'
+  fd_cap = open_files_cap(cores)
+  if fd_cap and jobs > fd_cap:
+    jobs = fd_cap
+    source = 'open files'
+  return {
+      'jobs': max(cores, jobs),
+      'load_limit': cores * LOAD_PER_CORE,
+      'source': source,
+      'open_files_cap': fd_cap,
+  }
+
+
+def run(stats_file, command):
+  raise_open_files_limit()
+  samples = []
+  done = threading.Event()
+
+  def sample():
+    while not done.wait(LOAD_SAMPLE_INTERVAL):
+      load = load_average()
+      if load is not None:
+        samples.append(load)
+
+  sampler = threading.Thread(target=sample, daemon=True)
+  sampler.start()
+  start = time.time()
+  try:
+    exit_code = subprocess.call(command)
+  finally:
+    done.set()
+    seconds = time.time() - start
+    with open(stats_file, 'w') as f:
+      json.dump({'seconds': seconds, 'load_samples': samples}, f)
+  return exit_code
+
+
+def record(data):
+  cores = os.cpu_count() or 1
+  state = read_json(data['state_file'], {})
+  entry = state.setdefault(data['key'], {})
+  stats = read_json(data['stats_file'], {})
+  jobs = data['jobs']
+  actions = data.get('actions') or 0
+  misses = actions - (data.get('cache_hits') or 0)
+  seconds = stats.get('seconds') or 0
+  if seconds <= 0:
+    return entry
+  last = {
+      'jobs': jobs,
+      'actions_per_second': round(actions / float(seconds), 3),
+  }
+  if misses <= 0:
+    # Nothing was executed remotely, e.g. a fully cached build.
+    return dict(entry, last=last)
+
+  throughput = misses / float(seconds)
+  best_throughput = entry.get('best_throughput', 0) * BEST_THROUGHPUT_DECAY
+  if throughput >= best_throughput:
+    entry['best_jobs'] = jobs
+    best_throughput = throughput
+  entry['best_throughput'] = round(best_throughput, 3)
+
+  samples = stats.get('load_samples') or []
+  load = sum(samples) / len(samples) if samples else None
+  throttled = load is not None and load >= (
+      cores * LOAD_PER_CORE * THROTTLED_LOAD_RATIO
+  )
+  fallback_ratio = (data.get('local_fallbacks') or 0) / float(actions)
+  if fallback_ratio > MAX_LOCAL_FALLBACK_RATIO or throttled:
+    next_jobs = jobs * (1 - STEP)
+  elif jobs == entry['best_jobs']:
+    next_jobs = jobs * (1 + STEP)
+  else:
+    # The exploration did not pay off, go back to the best value.
+    next_jobs = entry['best_jobs']
+  entry['next_jobs'] = max(cores, int(next_jobs))
+  entry['last'] = dict(
+      last,
+      throughput=round(throughput, 3),
+      local_fallback_ratio=round(fallback_ratio, 4),
+      load_average=load,
+  )
+  write_state(data['state_file'], state)
+  return entry
+
+
+def main():
+  if sys.argv[1] == 'run':
+    return run(sys.argv[2], sys.argv[3:])
+  data = json.load(sys.stdin)
+  result = {'choose': choose, 'record': record}[sys.argv[1]](data)
+  json.dump(result, sys.stdout, sort_keys=True)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Copyright 2024 The Flutter Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Tests for ninja_jobs.py, run with python3 ninja_jobs_test.py."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ninja_jobs  # pylint: disable=wrong-import-position
+
+CORES = 8
+
+
+class FakeResource(object):
+  RLIMIT_NOFILE = 7
+  RLIM_INFINITY = -1
+
+  def __init__(self, soft, hard, max_allowed=None):
+    self.limits = (soft, hard)
+    self.max_allowed = max_allowed
+
+  def getrlimit(self, _):
+    return self.limits
+
+  def setrlimit(self, _, limits):
+    if self.max_allowed and limits[0] > self.max_allowed:
+      raise ValueError('not allowed')
+    self.limits = limits
+
+
+class NinjaJobsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.state_file = os.path.join(self.tmp, 'cache', 'ninja_jobs.json')
+    self.stats_file = os.path.join(self.tmp, 'stats.json')
+    patcher = mock.patch.object(os, 'cpu_count', return_value=CORES)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def write_state(self, entry):
+    ninja_jobs.write_state(self.state_file, {'b/c': entry})
+
+  def write_stats(self, seconds, load_samples=()):
+    with open(self.stats_file, 'w') as f:
+      json.dump({'seconds': seconds, 'load_samples': list(load_samples)}, f)
+
+  def choose(self, open_files=None, **kwargs):
+    data = {
+        'state_file': self.state_file,
+        'key': 'b/c',
+        'default_jobs': 640,
+        'max_jobs': 1000,
+    }
+    data.update(kwargs)
+    with mock.patch.object(
+        ninja_jobs, 'raise_open_files_limit', return_value=open_files):
+      return ninja_jobs.choose(data)
+
+  def record(self, jobs, actions=1000, cache_hits=0, local_fallbacks=0):
+    return ninja_jobs.record({
+        'state_file': self.state_file,
+        'stats_file': self.stats_file,
+        'key': 'b/c',
+        'jobs': jobs,
+        'actions': actions,
+        'cache_hits': cache_hits,
+        'local_fallbacks': local_fallbacks,
+    })
+
+  def test_choose_default(self):
+    choice = self.choose()
+    self.assertEqual(choice['jobs'], 640)
+    self.assertEqual(choice['source'], 'default')
+    self.assertEqual(choice['load_limit'], CORES * ninja_jobs.LOAD_PER_CORE)
+
+  def test_choose_cached_value(self):
+    self.write_state({'best_jobs': 500, 'next_jobs': 550})
+    choice = self.choose()
+    self.assertEqual(choice['jobs'], 550)
+    self.assertEqual(choice['source'], 'cache')
+
+  def test_choose_platform_cap(self):
+    self.write_state({'next_jobs': 1200})
+    choice = self.choose(max_jobs=800)
+    self.assertEqual(choice['jobs'], 800)
+    self.assertEqual(choice['source'], 'platform')
+
+  def test_choose_open_files_cap(self):
+    choice = self.choose(open_files=1024)
+    self.assertEqual(choice['jobs'], 128)
+    self.assertEqual(choice['source'], 'open files')
+
+  def test_choose_raised_open_files_limit_does_not_cap(self):
+    self.assertEqual(self.choose(open_files=65536)['jobs'], 640)
+
+  def test_raise_open_files_limit_to_hard_limit(self):
+    fake = FakeResource(1024, 65536)
+    with mock.patch.dict(sys.modules, {'resource': fake}):
+      self.assertEqual(ninja_jobs.raise_open_files_limit(), 65536)
+
+  def test_raise_open_files_limit_unlimited_hard_limit(self):
+    fake = FakeResource(256, FakeResource.RLIM_INFINITY)
+    with mock.patch.dict(sys.modules, {'resource': fake}):
+      self.assertEqual(
+          ninja_jobs.raise_open_files_limit(), ninja_jobs.MAX_OPEN_FILES
+      )
+
+  def test_raise_open_files_limit_refused(self):
+    fake = FakeResource(256, 1 << 20, max_allowed=10240)
+    with mock.patch.dict(sys.modules, {'resource': fake}):
+      self.assertEqual(ninja_jobs.raise_open_files_limit(), 10240)
+
+  def test_record_fully_cached_build_is_ignored(self):
+    self.write_stats(100)
+    entry = self.record(640, cache_hits=1000)
+    self.assertEqual(entry['last'], {'jobs': 640, 'actions_per_second': 10.0})
+    self.assertNotIn('next_jobs', entry)
+    self.assertFalse(os.path.exists(self.state_file))
+
+  def test_record_first_build_explores_up(self):
+    self.write_stats(100)
+    entry = self.record(640, cache_hits=500)
+    self.assertEqual(entry['best_jobs'], 640)
+    self.assertEqual(entry['best_throughput'], 5.0)
+    self.assertEqual(entry['next_jobs'], 704)
+
+  def test_record_throughput_counts_cache_misses_only(self):
+    self.write_state({'best_jobs': 640, 'best_throughput': 5.0})
+    self.write_stats(10)
+    # 1000 actions in 10s but only 10 cache misses: not a better value.
+    entry = self.record(704, cache_hits=990)
+    self.assertEqual(entry['best_jobs'], 640)
+    self.assertEqual(entry['next_jobs'], 640)
+
+  def test_record_best_throughput_decays(self):
+    self.write_state({'best_jobs': 640, 'best_throughput': 10.0})
+    self.write_stats(100)
+    # 9.5 actions per second beats the decayed 9.0.
+    entry = self.record(500, actions=950)
+    self.assertEqual(entry['best_jobs'], 500)
+    self.assertEqual(entry['best_throughput'], 9.5)
+
+  def test_record_local_fallbacks_lower_the_value(self):
+    self.write_stats(100)
+    entry = self.record(640, local_fallbacks=100)
+    self.assertEqual(entry['next_jobs'], 576)
+
+  def test_record_throttled_build_lowers_the_value(self):
+    self.write_stats(100, [CORES * ninja_jobs.LOAD_PER_CORE] * 3)
+    entry = self.record(640)
+    self.assertEqual(entry['next_jobs'], 576)
+
+  def test_record_load_under_the_limit_is_not_throttled(self):
+    self.write_stats(100, [CORES * 1.5] * 3)
+    entry = self.record(640)
+    self.assertEqual(entry['next_jobs'], 704)
+
+  def test_run_writes_stats_and_returns_exit_code(self):
+    with mock.patch.object(ninja_jobs, 'raise_open_files_limit'):
+      exit_code = ninja_jobs.run(
+          self.stats_file, [sys.executable, '-c', 'import sys; sys.exit(3)']
+      )
+    self.assertEqual(exit_code, 3)
+    with open(self.stats_file) as f:
+      stats = json.load(f)
+    self.assertGreater(stats['seconds'], 0)
+    self.assertEqual(stats['load_samples'], [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -55,13 +55,35 @@ class CacheApi(recipe_api.RecipeApi):
         INFRA_BUCKET_NAME, cache_name, platform
     )
 
-  def write(self, cache_name, paths, ttl_secs):
+  def _manifest_path(self, cache_name, name, hash_value):
+    """Returns the object path of a manifest relative to INFRA_BUCKET_NAME."""
+    platform = self.m.platform.name
+    return 'caches/%s-%s/%s-%s.manifest.json' % (
+        cache_name, platform, name, hash_value
+    )
+
+  def _manifest_step(self, step_name, data, test_data=None):
+    """Runs an operation of the cache_manifest.py resource."""
+    return self.m.step(
+        step_name,
+        ['python3', self.resource('cache_manifest.py')],
+        stdin=self.m.json.input(data),
+        stdout=self.m.json.output(),
+        step_test_data=lambda: self.m.json.test_api.output_stream(
+            test_data or {}
+        ),
+    ).stdout
+
+  def write(self, cache_name, paths, ttl_secs, manifest=False):
     """Writes a new cache along with its metadata file.
 
     Args:
       cache_name (str): The name of the cache.
       paths (List(Path)): List of Paths to archive.
       ttl_secs (int): Seconds from last update that the cache is still valid.
+      manifest (bool): Whether to also upload a per-file digest manifest of
+        every path and an archive of the files changed since the previous
+        cache, allowing mount_cache to update local copies in place.
     """
     cache_metadata = {}
     ms_since_epoch_now = 1684900396429444 if self._test_data.enabled else int(
@@ -71,10 +93,25 @@ class CacheApi(recipe_api.RecipeApi):
     cache_metadata['cache_ttl_microseconds'] = int(ttl_secs * 1e6)
     cache_metadata['hashes'] = {}
 
+    previous_manifests = {}
+    if manifest:
+      cache_metadata['manifests'] = {}
+      if self._metadata(cache_name):
+        previous_metadata = self.m.gsutil.cat(
+            self._cache_path(cache_name),
+            stdout=self.m.json.output(),
+            name='cat previous metadata',
+        ).stdout or {}
+        previous_manifests = previous_metadata.get('manifests', {})
+
     for path in paths:
       name = self.m.path.basename(path)
       hash_value = self.m.cas.archive('Archive %s' % name, path, log_level='debug')
       cache_metadata['hashes'][name] = hash_value
+      if manifest:
+        cache_metadata['manifests'][name] = self._write_manifest(
+            cache_name, name, path, hash_value, previous_manifests.get(name)
+        )
     platform = self.m.platform.name
     local_cache_path = self.m.path.cleanup_dir / f'{cache_name}-{platform}.json'
     self.m.file.write_json(
@@ -91,12 +128,136 @@ class CacheApi(recipe_api.RecipeApi):
         metadata=headers,
     )
 
+  def _write_manifest(self, cache_name, name, path, hash_value, previous):
+    """Uploads the manifest of |path| and the archive of its changed files.
+
+    Args:
+      cache_name (str): The name of the cache.
+      name (str): The name of the cache folder.
+      path (Path): The folder archived as |hash_value|.
+      hash_value (str): The CAS digest of the full folder.
+      previous (dict): The manifest metadata of the previous cache, if any.
+
+    Returns:
+      A dict with the manifest object path and the CAS digest of the files
+      changed since |previous|, None when there is no usable delta.
+    """
+    with self.m.step.nest('Manifest %s' % name):
+      manifest_dir = self.m.path.mkdtemp('cache_manifest')
+      previous_path = None
+      if previous:
+        previous_path = manifest_dir / 'previous.json'
+        self.m.gsutil.download(
+            INFRA_BUCKET_NAME,
+            previous['path'],
+            previous_path,
+            name='download previous manifest',
+        )
+      manifest_path = manifest_dir / 'manifest.json'
+      # The delta files are staged in their own tree so that they are
+      # archived as one directory, whatever their number.
+      delta_dir = self.m.path.mkdtemp('cache_delta')
+      delta = self._manifest_step(
+          'Index %s' % name,
+          {
+              'operation': 'build',
+              'root': str(path),
+              'output': str(manifest_path),
+              'previous': str(previous_path) if previous_path else None,
+              'staging': str(delta_dir),
+          },
+          test_data={'delta': ['changed_file'] if previous else None},
+      )['delta']
+      delta_hash = None
+      if delta:
+        delta_hash = self.m.cas.archive(
+            'Archive %s delta' % name, delta_dir, log_level='debug'
+        )
+      manifest_gs_path = self._manifest_path(cache_name, name, hash_value)
+      self.m.gsutil.upload(
+          name='Upload manifest to %s' % manifest_gs_path,
+          source=manifest_path,
+          bucket=INFRA_BUCKET_NAME,
+          dest=manifest_gs_path,
+      )
+    return {'path': manifest_gs_path, 'delta_hash': delta_hash}
+
+  def _sync_cache(self, name, hash_value, manifest, cache_root):
+    """Updates an existing local cache folder in place.
+
+    Files not in the manifest are deleted and only the missing or changed
+    files are fetched, from the delta archive when it contains all of them.
+    The changed files are deleted before they are fetched, so the folder is
+    clobbered if they cannot be fetched and the next mount downloads it
+    again.
+
+    Args:
+      name (str): The name of the cache folder.
+      hash_value (str): The CAS digest of the full folder.
+      manifest (dict): The manifest metadata written by _write_manifest.
+      cache_root (Path): The directory holding the local copy of the folder.
+    """
+    with self.m.step.nest('Sync %s' % name):
+      mount_path = cache_root / name
+      # Digests of the local files keyed by size and mtime, to avoid hashing
+      # unchanged files on every mount.
+      state_path = cache_root / ('.%s_manifest_state.json' % name)
+      manifest_path = self.m.path.mkdtemp('cache_manifest') / 'manifest.json'
+      self.m.gsutil.download(
+          INFRA_BUCKET_NAME,
+          manifest['path'],
+          manifest_path,
+          name='download manifest',
+      )
+      result = self._manifest_step(
+          'Diff %s' % name,
+          {
+              'operation': 'diff',
+              'root': str(mount_path),
+              'manifest': str(manifest_path),
+              'state': str(state_path),
+          },
+          test_data={'missing': [], 'use_delta': False},
+      )
+      missing = result['missing']
+      if not missing:
+        return
+      digest = hash_value
+      if result['use_delta'] and manifest.get('delta_hash'):
+        digest = manifest['delta_hash']
+      staging = self.m.path.mkdtemp('cache_staging')
+      try:
+        self.m.cas.download(
+            'Fetching %d files with hash %s' % (len(missing), digest), digest,
+            staging
+        )
+        self.m.step(
+            'Apply %s' % name,
+            ['python3', self.resource('cache_manifest.py')],
+            stdin=self.m.json.input({
+                'operation': 'apply',
+                'root': str(mount_path),
+                'staging': str(staging),
+                'paths': missing,
+                'manifest': str(manifest_path),
+                'state': str(state_path),
+            }),
+        )
+      except self.m.step.StepFailure:
+        # The folder is missing files, it must not be mounted as is.
+        self.m.file.rmtree('Clobber local cache: %s' % name, mount_path)
+        self.m.file.remove('Remove %s state' % name, state_path)
+        raise
+
   def mount_cache(self, cache_name, cache_root=None, force=True):
     """Mounts a cache.
 
     The cache may be composed of several independent folders that will mounted using
     <cache_root>/cache_name.
 
+    Folders written with a manifest that already exist locally are updated in
+    place instead of being clobbered when |force| is True.
+
     Args:
       cache_name (str): The name of the cache.
       cache_root (str): A string with a chroot path suported by the api.path module.
@@ -111,7 +272,11 @@ class CacheApi(recipe_api.RecipeApi):
       ).stdout
       if self._test_data.enabled:
         metadata = metadata or collections.defaultdict(dict)
+      manifests = metadata.get('manifests', {})
       for k, v in metadata['hashes'].items():
+        if force and k in manifests and self.m.path.exists(cache_root / k):
+          self._sync_cache(k, v, manifests[k], cache_root)
+          continue
         if force:
           self.m.file.rmtree('Clobber local cache: %s' % k, cache_root / k)
         # Mount the cache only if it doesn't exist locally.
@@ -0,0 +1,207 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Builds and applies per-file digest manifests of named caches.
+
+Three operations are supported, all reading their arguments as JSON from stdin:
+
+  build: writes a manifest with the sha256 digest, size and executable bit of
+    each file under |root| to |output|. When a |previous| manifest is provided
+    the files added or changed since then are recorded under "delta" and
+    printed to stdout. When |staging| is provided the delta files are also
+    hardlinked there, at the same relative paths, so they can be archived as
+    one directory.
+
+  diff: updates |root| in place to match |manifest|. Files not in the manifest
+    are deleted, symlinks and executable bits are fixed and the files whose
+    content differs are removed. Prints the files that must be fetched and
+    whether all of them are part of the manifest delta. Digests of unchanged
+    files are read from the |state| file instead of hashing them again.
+
+  apply: moves the fetched |paths| from |staging| into |root| and records them
+    in the |state| file.
+
+See cache/api.py for the format of the inputs.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def is_executable(path):
+  return bool(os.lstat(path).st_mode & stat.S_IXUSR)
+
+
+def set_executable(path, executable):
+  mode = os.lstat(path).st_mode
+  if executable:
+    mode |= stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+  else:
+    mode &= ~(stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+  os.chmod(path, mode)
+
+
+def walk(root):
+  """Yields (relative path, absolute path) for each file and symlink."""
+  for dirpath, dirnames, filenames in os.walk(root):
+    # Symlinks to directories are reported as entries, not traversed.
+    for name in [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))
+                ] + filenames:
+      abs_path = os.path.join(dirpath, name)
+      yield os.path.relpath(abs_path, root).replace(os.sep, '/'), abs_path
+
+
+def load_json(path, default):
+  if not path or not os.path.exists(path):
+    return default
+  with open(path) as f:
+    return json.load(f)
+
+
+def write_json(path, data):
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  with open(path, 'w') as f:
+    json.dump(data, f, sort_keys=True)
+
+
+def stat_key(path):
+  st = os.lstat(path)
+  return [st.st_size, st.st_mtime_ns]
+
+
+def stage(root, rel_paths, staging):
+  """Mirrors |rel_paths| of |root| into |staging|, copying across devices."""
+  for rel_path in rel_paths:
+    src = os.path.join(root, *rel_path.split('/'))
+    dst = os.path.join(staging, *rel_path.split('/'))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+      os.link(src, dst)
+    except OSError:
+      shutil.copy2(src, dst)
+
+
+def build(data):
+  files = {}
+  symlinks = {}
+  for rel_path, abs_path in walk(data['root']):
+    if os.path.islink(abs_path):
+      symlinks[rel_path] = os.readlink(abs_path)
+      continue
+    files[rel_path] = {
+        'digest': hash_file(abs_path),
+        'size': os.path.getsize(abs_path),
+        'is_executable': is_executable(abs_path),
+    }
+  manifest = {'files': files, 'symlinks': symlinks, 'delta': None}
+  previous = load_json(data.get('previous'), None)
+  if previous is not None:
+    manifest['delta'] = sorted(
+        rel_path for rel_path, entry in files.items()
+        if previous['files'].get(rel_path, {}).get('digest') != entry['digest']
+    )
+  if manifest['delta'] and data.get('staging'):
+    stage(data['root'], manifest['delta'], data['staging'])
+  write_json(data['output'], manifest)
+  json.dump({'delta': manifest['delta']}, sys.stdout)
+
+
+def diff(data):
+  root = data['root']
+  manifest = load_json(data['manifest'], None)
+  state = load_json(data['state'], {})
+  files = manifest['files']
+  symlinks = manifest['symlinks']
+  new_state = {}
+  present = set()
+  for rel_path, abs_path in list(walk(root)):
+    if os.path.islink(abs_path):
+      if symlinks.get(rel_path) == os.readlink(abs_path):
+        present.add(rel_path)
+      else:
+        os.remove(abs_path)
+      continue
+    entry = files.get(rel_path)
+    if entry is None:
+      os.remove(abs_path)
+      continue
+    key = stat_key(abs_path)
+    cached = state.get(rel_path)
+    if cached and cached[:2] == key:
+      digest = cached[2]
+    else:
+      digest = hash_file(abs_path)
+    if digest != entry['digest']:
+      os.remove(abs_path)
+      continue
+    if is_executable(abs_path) != entry['is_executable']:
+      set_executable(abs_path, entry['is_executable'])
+    present.add(rel_path)
+    new_state[rel_path] = stat_key(abs_path) + [digest]
+
+  # Drop the directories left empty by the deletions above.
+  for dirpath, _, _ in list(os.walk(root, topdown=False)):
+    if dirpath != root and not os.path.islink(dirpath) and not os.listdir(
+        dirpath):
+      os.rmdir(dirpath)
+
+  for rel_path, link in symlinks.items():
+    if rel_path not in present:
+      abs_path = os.path.join(root, rel_path)
+      os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+      os.symlink(link, abs_path)
+
+  write_json(data['state'], new_state)
+  missing = sorted(set(files) - present)
+  delta = manifest.get('delta')
+  json.dump({
+      'missing': missing,
+      'use_delta': delta is not None and set(missing).issubset(delta),
+  }, sys.stdout)
+
+
+def apply(data):
+  root = data['root']
+  staging = data['staging']
+  manifest = load_json(data['manifest'], None)
+  state = load_json(data['state'], {})
+  for rel_path in data['paths']:
+    entry = manifest['files'][rel_path]
+    dst = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.move(os.path.join(staging, rel_path), dst)
+    set_executable(dst, entry['is_executable'])
+    state[rel_path] = stat_key(dst) + [entry['digest']]
+  write_json(data['state'], state)
+  sys.stdout.write('moved %d files into %s\n' % (len(data['paths']), root))
+
+
+OPERATIONS = {
+    'build': build,
+    'diff': diff,
+    'apply': apply,
+}
+
+
+def main():
+  data = json.load(sys.stdin)
+  OPERATIONS[data['operation']](data)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
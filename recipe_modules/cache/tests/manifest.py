@@ -0,0 +1,121 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+from recipe_engine.post_process import DoesNotRun, MustRun
+
+DEPS = [
+    'flutter/cache',
+    'recipe_engine/json',
+    'recipe_engine/path',
+]
+
+
+def RunSteps(api):
+  paths = [
+      api.path.cache_dir / 'builder',
+      api.path.cache_dir / 'git',
+  ]
+  api.cache.write('builder', paths, 60, manifest=True)
+  api.cache.mount_cache('builder', api.path.cache_dir)
+
+
+def GenTests(api):
+  manifests = {
+      'builder': {
+          'path': 'caches/builder-linux/builder-hash1.manifest.json',
+          'delta_hash': 'delta1',
+      },
+      'git': {
+          'path': 'caches/builder-linux/git-hash2.manifest.json',
+          'delta_hash': None,
+      },
+  }
+  metadata = {
+      'hashes': {'builder': 'hash1', 'git': 'hash2'},
+      'manifests': manifests,
+  }
+  previous_metadata = api.step_data(
+      'gsutil cat previous metadata',
+      stdout=api.json.output({'manifests': manifests}),
+  )
+  mount_metadata = api.step_data(
+      'Mount caches.gsutil cat',
+      stdout=api.json.output(metadata),
+  )
+
+  yield api.test(
+      'first_manifest',
+      api.step_data('builder exists', retcode=1),
+      mount_metadata,
+      api.post_check(DoesNotRun, 'gsutil cat previous metadata'),
+      api.post_check(DoesNotRun, 'Manifest builder.Archive builder delta'),
+  )
+
+  yield api.test(
+      'sync_from_delta',
+      previous_metadata,
+      mount_metadata,
+      api.path.exists(api.path.cache_dir / 'builder'),
+      api.step_data(
+          'Mount caches.Sync builder.Diff builder',
+          stdout=api.json.output({
+              'missing': ['a', 'b'],
+              'use_delta': True
+          }),
+      ),
+      api.post_check(MustRun, 'Manifest builder.Archive builder delta'),
+      api.post_check(
+          MustRun, 'Mount caches.Sync builder.Fetching 2 files with hash delta1'
+      ),
+      api.post_check(DoesNotRun, 'Mount caches.Clobber local cache: builder'),
+      api.post_check(MustRun, 'Mount caches.Clobber local cache: git'),
+  )
+
+  yield api.test(
+      'sync_from_full_tree',
+      previous_metadata,
+      mount_metadata,
+      api.path.exists(api.path.cache_dir / 'builder'),
+      api.step_data(
+          'Mount caches.Sync builder.Diff builder',
+          stdout=api.json.output({
+              'missing': ['a'],
+              'use_delta': False
+          }),
+      ),
+      api.post_check(
+          MustRun, 'Mount caches.Sync builder.Fetching 1 files with hash hash1'
+      ),
+  )
+
+  yield api.test(
+      'sync_fetch_failure',
+      previous_metadata,
+      mount_metadata,
+      api.path.exists(api.path.cache_dir / 'builder'),
+      api.step_data(
+          'Mount caches.Sync builder.Diff builder',
+          stdout=api.json.output({
+              'missing': ['a'],
+              'use_delta': False
+          }),
+      ),
+      api.step_data(
+          'Mount caches.Sync builder.Fetching 1 files with hash hash1',
+          retcode=1,
+      ),
+      api.post_check(
+          MustRun, 'Mount caches.Sync builder.Clobber local cache: builder'
+      ),
+      api.post_check(DoesNotRun, 'Mount caches.Sync builder.Apply builder'),
+      status='INFRA_FAILURE',
+  )
+
+  yield api.test(
+      'already_up_to_date',
+      previous_metadata,
+      mount_metadata,
+      api.path.exists(api.path.cache_dir / 'builder'),
+      api.post_check(DoesNotRun, 'Mount caches.Sync builder.Apply builder'),
+  )
@@ -2,6 +2,7 @@ DEPS = [
     'depot_tools/depot_tools',
     'flutter/test_utils',
     'recipe_engine/file',
+    'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/platform',
     'recipe_engine/properties',
@@ -1,5 +1,8 @@
+import bisect
+import calendar
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 import json
 
 from recipe_engine import recipe_api
@@ -7,48 +10,131 @@ from recipe_engine import recipe_api
 JSON_ENTRY_NAME = 'name'
 JSON_ENTRY_UPDATED_DATE = 'updated_date'
 JSON_ENTRY_REMOVAL_DATE = 'removal_date'
+JSON_ENTRY_UPDATED_EPOCH = 'updated_epoch'
+JSON_ENTRY_REMOVAL_EPOCH = 'removal_epoch'
+JSON_ENTRY_SIZE = 'size'
+JSON_ENTRY_ACCESS_COUNT = 'access_count'
+JSON_ENTRIES = 'entries'
+
+LEGACY_DATE_FORMAT = "%m/%d/%Y, %H:%M:%S"
 
 PACKAGE_REMOVAL_INTERVAL_DAYS = 30
 
 
+def to_epoch(date: datetime) -> int:
+  """Converts a datetime to seconds since epoch, naive ones are UTC."""
+  return calendar.timegm(date.utctimetuple())
+
+
+def to_legacy_date(epoch: int) -> str:
+  """Converts seconds since epoch to the string dates of older recipes."""
+  return datetime.fromtimestamp(epoch, timezone.utc).strftime(
+      LEGACY_DATE_FORMAT
+  )
+
+
 class CacheEntry:
   """An object used to represent a file and its usage in a cache."""
 
   def __init__(
       self,
       file_name: str,
-      updated_date: datetime = None,
-      removal_date: datetime = None,
+      updated_date: int,
+      removal_date: int = None,
+      size: int = 0,
+      access_count: int = 0,
   ):
     self.name = file_name
-
-    # The updated date will be stored as a string for easy conversion to and from json.
+    # Dates are stored as seconds since epoch.
     self.updated_date = updated_date
-    self.updated_date = updated_date.strftime("%m/%d/%Y, %H:%M:%S")
-
-    # The removal date will be stored as a string for easy conversion to and from json.
     self.removal_date = removal_date
     if self.removal_date is None:
-      self._calc_removal_date(self.updated_date)
-    else:
-      self.removal_date = removal_date.strftime("%m/%d/%Y, %H:%M:%S")
-
-  def _calc_removal_date(self, updated_date: datetime):
-    """Calculate the removal date as the update date + 30 days."""
-    time_delta = timedelta(days=PACKAGE_REMOVAL_INTERVAL_DAYS)
-    updated_date_datetime = datetime.strptime(
-        updated_date, "%m/%d/%Y, %H:%M:%S"
+      self.removal_date = updated_date + int(
+          timedelta(days=PACKAGE_REMOVAL_INTERVAL_DAYS).total_seconds()
+      )
+    # Disk usage in bytes, only measured by size aware eviction policies.
+    self.size = size
+    # Number of runs that used this entry as a dependency.
+    self.access_count = access_count
+
+  def to_json(self) -> dict:
+    """Returns the metadata stored for this entry.
+
+    The name and string dates keep the file readable by older recipes
+    sharing the cache, they ignore the other fields.
+    """
+    return {
+        JSON_ENTRY_NAME: self.name,
+        JSON_ENTRY_UPDATED_DATE: to_legacy_date(self.updated_date),
+        JSON_ENTRY_REMOVAL_DATE: to_legacy_date(self.removal_date),
+        JSON_ENTRY_UPDATED_EPOCH: self.updated_date,
+        JSON_ENTRY_REMOVAL_EPOCH: self.removal_date,
+        JSON_ENTRY_SIZE: self.size,
+        JSON_ENTRY_ACCESS_COUNT: self.access_count,
+    }
+
+
+class ExpirationPolicy:
+  """Evicts the entries not used in PACKAGE_REMOVAL_INTERVAL_DAYS."""
+
+  # Whether the policy needs the size of the entries and the free disk space.
+  needs_disk_usage = False
+
+  def select(
+      self, entries: dict, now: int, in_use: set, free_bytes: int
+  ) -> list:
+    """Returns the names of the entries to evict.
+
+    Args:
+      * entries (dict[str, CacheEntry]): the cache entries keyed by name.
+      * now (int): the current time in seconds since epoch.
+      * in_use (set[str]): the names of the dependencies used by this run.
+      * free_bytes (int): the free space on the cache disk if measured.
+    """
+    removal_index = sorted(
+        (entry.removal_date, name) for name, entry in entries.items()
     )
-    new_removal_date = updated_date_datetime + time_delta
-    self.removal_date = new_removal_date.strftime("%m/%d/%Y, %H:%M:%S")
+    expired_count = bisect.bisect_left(removal_index, (now, ''))
+    return [name for _, name in removal_index[:expired_count]]
+
 
-  def removal_date_as_datetime(self) -> datetime:
-    """Return the stored removal timestamp string as a datetime object."""
-    return self._convert_str_to_datetime(self.removal_date)
+class LruSizePolicy(ExpirationPolicy):
+  """Evicts expired entries, then least recently used ones until the cache
+  fits in |max_bytes| and the disk has at least |min_free_bytes| free.
 
-  def _convert_str_to_datetime(self, date_str: str) -> datetime:
-    """Return the converted string date as a datetime object"""
-    return datetime.strptime(date_str, "%m/%d/%Y, %H:%M:%S")
+  Entries used by the current run are never evicted by size.
+  """
+
+  needs_disk_usage = True
+
+  def __init__(self, max_bytes: int = None, min_free_bytes: int = None):
+    self.max_bytes = max_bytes
+    self.min_free_bytes = min_free_bytes
+
+  def select(
+      self, entries: dict, now: int, in_use: set, free_bytes: int
+  ) -> list:
+    evicted = super().select(entries, now, in_use, free_bytes)
+    evicted_bytes = sum(entries[name].size for name in evicted)
+    total_bytes = sum(e.size for e in entries.values()) - evicted_bytes
+    free_bytes += evicted_bytes
+
+    def _within_budget():
+      return ((self.max_bytes is None or total_bytes <= self.max_bytes) and
+              (self.min_free_bytes is None or
+               free_bytes >= self.min_free_bytes))
+
+    # Least recently used first, less used first on ties.
+    lru_index = sorted((entry.updated_date, entry.access_count, name)
+                       for name, entry in entries.items()
+                       if name not in in_use and name not in evicted)
+    for _, _, name in lru_index:
+      if _within_budget():
+        break
+      evicted.append(name)
+      total_bytes -= entries[name].size
+      free_bytes += entries[name].size
+    return evicted
 
 
 class CacheMicroManagerApi(recipe_api.RecipeApi):
@@ -80,9 +166,9 @@ class CacheMicroManagerApi(recipe_api.RecipeApi):
 
   def today(self):
     """Provide a deterministic date when running tests."""
-    return datetime.now()  # pragma: nocover
+    return datetime.now(timezone.utc)  # pragma: nocover
 
-  def run(self, target_dir, deps_list: list):
+  def run(self, target_dir, deps_list: list, eviction_policy=None):
     """Run the cache micro manager on the target directory.
 
     If the directory is not yet being tracked by the cache micro manager it will read the contents of
@@ -99,14 +185,21 @@ class CacheMicroManagerApi(recipe_api.RecipeApi):
     * Then it will look at all removal dates from the metadata file and delete all expired packages from
     disk and remove them from the metadata file.
 
+    Entries are keyed by their name relative to the cache directory, so
+    dependencies can be passed either as names or as paths inside it.
+
     Args:
       * deps_list(list[str]): the list of dependencies that are currently being used.
+      * eviction_policy(ExpirationPolicy): selects the entries to delete,
+        defaults to deleting the entries not used in the last
+        PACKAGE_REMOVAL_INTERVAL_DAYS days.
     """
 
     self._initialize(target_dir=target_dir)
+    eviction_policy = eviction_policy or ExpirationPolicy()
 
     with self.m.step.nest('Running Cache Micro Manager on {}.'.format(
-        self.cache_target_directory)):
+        self.cache_target_directory)) as presentation:
 
       cache_exists = self.m.path.exists(self.cache_target_directory)
       if not cache_exists:
@@ -117,199 +210,124 @@ class CacheMicroManagerApi(recipe_api.RecipeApi):
         )
         return
 
-      if not self.m.path.exists(self.cache_metadata_file_path):
-        directory_files_list = self.m.file.listdir(
-            'Reading cache directory {}'.format(self.cache_target_directory),
-            self.cache_target_directory,
-            recursive=False,
-        )
+      metadata_exists = self.m.path.exists(self.cache_metadata_file_path)
+      # the currently stored metadata entries keyed by name.
+      entries = self.read_metadata_file() if metadata_exists else {}
 
-        directory_cache_entry_list = self.convert_file_list_to_cache_entry_list(
-            directory_files_list
-        )
-
-        if len(directory_cache_entry_list) > 0:
-          # It should be safe to ignore the check for existence of the file since no one
-          # actively logs onto the bots and manipulates the file system.
-          self.m.file.write_text(
-              'Writing cache metadata file.',
-              self.cache_metadata_file_path,
-              json.dumps([ob.__dict__ for ob in directory_cache_entry_list]),
+      # these files may not be in the metadata file, no telling how they got there.
+      names_on_disk = {
+          self.m.path.basename(item) for item in self.m.file.listdir(
+              'Reading cache directory {}'.format(self.cache_target_directory),
+              self.cache_target_directory,
+              recursive=False,
           )
-      else:
-        # the currently stored metadata entries.
-
-        # example of the data that is stored in the metadata file.
-        # [
-        #   {
-        #     "name": "package_1",
-        #     "updated_date": "datetime",
-        #     "removal_date": "datetime + interval"
-        #   },
-        #   {
-        #     "name": "package_2",
-        #     "updated_date": "datetime",
-        #     "removal_date": "datetime + interval"
-        #   }
-        # ]
-
-        current_metadata_entries = self.read_metadata_file()
-
-        # these files may not be in the metadata file, no telling how they got there.
-        current_directory_entries = self.m.file.listdir(
-            'Reading cache directory {}'.format(self.cache_target_directory),
-            self.cache_target_directory, False
-        )
-
-        # remove the cache file itself so we do not record it in the file.
-        current_directory_entries.remove(self.cache_metadata_file_path)
-
-        # add or update the current working dependencies.
-        for dep in deps_list:
-          if not self.is_file_name_in_cache_entry_list(
-              dep, current_metadata_entries):
-            # we need to add it.
-            current_metadata_entries.append(
-                CacheEntry(file_name=str(dep), updated_date=self.today())
-            )
-          else:
-            # we want to update it.
-            existing_entry = self.get_cache_entry_from_list(
-                str(dep), current_metadata_entries
-            )
-
-            # package will be active for another month.
-            new_entry = CacheEntry(
-                file_name=str(existing_entry.name), updated_date=self.today()
-            )
-            current_metadata_entries.remove(existing_entry)
-            current_metadata_entries.append(new_entry)
-
-        paths_as_str_current_dir_entries = [
-            str(item) for item in current_directory_entries
-        ]
-        # there can be deps in the file and not in the directory or
-        for current_meta_entry in current_metadata_entries:  # current metadata entries should be str
-          if str(current_meta_entry.name
-                ) not in paths_as_str_current_dir_entries:
-            current_metadata_entries.remove(current_meta_entry)
-
-        # there can be deps in the directory and not in the file.
-        for file_path in paths_as_str_current_dir_entries:
-          cacheEntry = self.get_cache_entry_from_list(
-              str(file_path), current_metadata_entries
+      }
+      # remove the cache file itself so we do not record it in the file.
+      names_on_disk.discard(self.metadata_file_name)
+
+      now = to_epoch(self.today())
+      # there can be deps in the file and not in the directory.
+      entries = {
+          name: entry
+          for name, entry in entries.items()
+          if name in names_on_disk
+      }
+      # there can be deps in the directory and not in the file.
+      for name in names_on_disk:
+        if name not in entries:
+          entries[name] = CacheEntry(file_name=name, updated_date=now)
+      # package will be active for another month.
+      in_use = set()
+      for dep in deps_list:
+        name = self.m.path.basename(str(dep))
+        if name in names_on_disk:
+          in_use.add(name)
+          entries[name] = CacheEntry(
+              file_name=name,
+              updated_date=now,
+              size=entries[name].size,
+              access_count=entries[name].access_count + 1,
           )
-          if cacheEntry is None:
-            current_metadata_entries.append(
-                CacheEntry(file_name=str(file_path), updated_date=self.today())
-            )
 
-        # Check dates and delete unused packages.
-        for cacheEntry in current_metadata_entries:
-          today = self.today()
-          if cacheEntry.removal_date_as_datetime().date() < today.date():
-            self.delete_file(cacheEntry.name)
-            current_metadata_entries.remove(cacheEntry)
-
-        # write the new file contents.
-        self.m.file.remove(
-            'Removing existing cache file {}'.format(
-                self.cache_metadata_file_path
-            ), self.cache_metadata_file_path
-        )
-        self.m.file.write_text(
-            'Writing cache metadata file.',
-            self.cache_metadata_file_path,
-            json.dumps([ob.__dict__ for ob in current_metadata_entries]),
-        )
+      free_bytes = 0
+      if eviction_policy.needs_disk_usage:
+        free_bytes = self._measure_disk_usage(entries, in_use)
 
-  def get_cache_entry_from_list(
-      self, file_name: str, cache_entry_list: list
-  ) -> CacheEntry:
-    """Get the associated cache entry when supplied with a specific file name.
+      if metadata_exists:
+        # Check dates and delete unused packages.
+        evicted = eviction_policy.select(entries, now, in_use, free_bytes)
+        if evicted:
+          reclaimed_bytes = sum(entries[name].size for name in evicted)
+          self.delete_files([
+              self.cache_target_directory / name for name in evicted
+          ])
+          for name in evicted:
+            del entries[name]
+          presentation.properties['{}_bytes_reclaimed'.format(
+              self.cache_name
+          )] = reclaimed_bytes
+      elif not entries:
+        return
 
-    Args:
-      * file_name (str): the name of a file/directory that represents a dependency.
-      * cache_entry_list (list[CacheEntry]): a list of CacheEntry objects.
+      # It should be safe to ignore the check for existence of the file since no one
+      # actively logs onto the bots and manipulates the file system.
+      self.m.file.write_text(
+          'Writing cache metadata file.',
+          self.cache_metadata_file_path,
+          json.dumps([entries[name].to_json() for name in sorted(entries)]),
+      )
 
-    Returns:
-      CacheEntry | None: Returns a CacheEntry if found in the list otherwise returns None.
-    """
-    for cache_entry in cache_entry_list:
-      if file_name == cache_entry.name:
-        return cache_entry
-    return None
+  def _measure_disk_usage(self, entries: dict, in_use: set) -> int:
+    """Records the disk usage of entries and returns the free disk space.
 
-  # file name is a path as passed in here
-  def is_file_name_in_cache_entry_list(
-      self, file_name, cache_entry_list: list
-  ) -> bool:
-    """Check to see if a CacheEntry is in the list for the supplied file_name.
+    Only the entries without a recorded size, e.g. new ones, and the entries
+    used by this run are measured, the others keep their recorded size.
 
     Args:
-      * file_name (str): the name of a file/directory that represents a dependency.
-      * cache_entry_list (list[CacheEntry]): a list of CacheEntry objects.
+      * entries (dict[str, CacheEntry]): the cache entries keyed by name.
+      * in_use (set[str]): the names of the dependencies used by this run.
 
     Returns:
-      bool: True if a cache entry exists with file_name as its name, False if it does not.
+      int: the free space in bytes on the disk holding the cache.
     """
-    for cache_entry in cache_entry_list:
-      if str(file_name) == str(cache_entry.name):
-        return True
-    return False
-
-  def convert_file_list_to_cache_entry_list(
-      self, file_names_list: list
-  ) -> list:
-    """Create a list of CacheEntry objects from a list of file names.
-
-    The primary usage of this is on start of CacheMicroManager when it has not yet begun
-    to manage a directory and we need to record the contents of it.
+    usage = self.m.step(
+        'Measuring cache entries',
+        ['python3', self.resource('disk_usage.py')],
+        stdin=self.m.json.input({
+            'root': str(self.cache_target_directory),
+            'names': sorted(
+                name for name, entry in entries.items()
+                if name in in_use or not entry.size
+            ),
+        }),
+        stdout=self.m.json.output(),
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            'sizes': {}, 'free_bytes': 0
+        }),
+    ).stdout
+    for name, size in usage['sizes'].items():
+      if name in entries:
+        entries[name].size = size
+    return usage['free_bytes']
+
+  def delete_files(self, file_names: list):
+    """Delete files or directories in a single step.
 
     Args:
-      * file_names_list (list[str]): a list of file names to use to instantiate CacheEntry
-        objects.
-
-    Returns:
-      list[CacheEntry]: a list of newly instantiated CacheEntry objects associate with the
-        supplied file names list.
+      * file_names (list[Path]): the files or directories that will be deleted.
     """
-    cache_entry_list = []
-    for fd in file_names_list:
-      cache_entry = CacheEntry(file_name=str(fd), updated_date=self.today())
-      cache_entry_list.append(cache_entry)
-    return cache_entry_list
-
-  def delete_file(self, file_name):
-    """Delete a file or directory.
+    self.m.step(
+        'Removing {} expired cache entries'.format(len(file_names)),
+        ['python3', self.resource('remove_paths.py')],
+        stdin=self.m.json.input([str(f) for f in file_names]),
+    )
 
-    Args:
-      * file_name (Path): a file or directory name that will be deleted.
-    """
-    try:
-      if self.m.path.isfile(file_name):
-        self.m.file.remove(
-            'Removing file descriptor {}'.format(file_name), file_name
-        )  #pragma: nocover
-      elif self.m.path.isdir(file_name):
-        try:  #pragma: nocover
-          self.m.file.rmtree(
-              'Removig dir file descriptor {} (rmtree)'.format(file_name),
-              file_name
-          )  #pragma: nocover
-        except self.m.file.Error:  #pragma: nocover
-          self.m.step(
-              'Removing dir file descriptor {} (fallback rm)'.format(file_name),
-              ['rm', '-rf', file_name]
-          )  #pragma: nocover
-    except self.m.file.Error:  #pragma: nocover
-      print('File not found.')  #pragma: nocover
-
-  def read_metadata_file(self) -> list:
+  def read_metadata_file(self) -> dict:
     """Read the metadata file at the self.cache_metadata_file_location path.
 
     Returns:
-      list[CacheEntry]: returns the list of CacheEntry's found in the existing file.
+      dict[str, CacheEntry]: returns the CacheEntry's found in the existing file
+        keyed by name.
     """
     with self.m.step.nest('Reading metadata file {}'.format(
         self.cache_metadata_file_path)):
@@ -318,40 +336,59 @@ class CacheMicroManagerApi(recipe_api.RecipeApi):
           'Reading {}'.format(self.cache_metadata_file_path),
           self.cache_metadata_file_path,
       )
-      meta_cache_entries = []
-      json_items = json.loads(meta_json)
-      for item in json_items:
-        # TODO(ricardoamador) remove this code once the old dates without times are removed.
-        updated_date_found = None
-        if (self.date_format_check(item[JSON_ENTRY_UPDATED_DATE])):
-          updated_date_found = datetime.strptime(
-              item[JSON_ENTRY_UPDATED_DATE], "%m/%d/%Y, %H:%M:%S"
-          )
-        else:
-          updated_date_found = datetime.strptime(
-              "{}, 12:00:00".format(item[JSON_ENTRY_UPDATED_DATE]),
-              "%m/%d/%Y, %H:%M:%S"
-          )
-
-        removal_date_found = None
-        if (self.date_format_check(item[JSON_ENTRY_REMOVAL_DATE])):
-          removal_date_found = datetime.strptime(
-              item[JSON_ENTRY_REMOVAL_DATE], "%m/%d/%Y, %H:%M:%S"
-          )
-        else:
-          removal_date_found = datetime.strptime(
-              "{}, 12:00:00".format(item[JSON_ENTRY_REMOVAL_DATE]),
-              "%m/%d/%Y, %H:%M:%S"
-          )
-
-        new_entry = CacheEntry(
-            file_name=str(item[JSON_ENTRY_NAME]),
-            updated_date=updated_date_found,
-            removal_date=removal_date_found
+      json_data = json.loads(meta_json)
+      if isinstance(json_data, dict):
+        # Files written keyed by name by an earlier version of this module.
+        json_data = [
+            dict(item, **{JSON_ENTRY_NAME: name})
+            for name, item in json_data[JSON_ENTRIES].items()
+        ]
+      # example of the data that is stored in the metadata file.
+      # [
+      #   {
+      #     "name": "package_1",
+      #     "updated_date": "12/15/2023, 13:43:21",
+      #     "removal_date": "01/14/2024, 13:43:21",
+      #     "updated_epoch": epoch,
+      #     "removal_epoch": epoch,
+      #     "size": bytes,
+      #     "access_count": count
+      #   }
+      # ]
+      meta_cache_entries = {}
+      for item in json_data:
+        name = self.m.path.basename(str(item[JSON_ENTRY_NAME]))
+        meta_cache_entries[name] = CacheEntry(
+            file_name=name,
+            updated_date=self._entry_epoch(
+                item, JSON_ENTRY_UPDATED_EPOCH, JSON_ENTRY_UPDATED_DATE
+            ),
+            removal_date=self._entry_epoch(
+                item, JSON_ENTRY_REMOVAL_EPOCH, JSON_ENTRY_REMOVAL_DATE
+            ),
+            size=item.get(JSON_ENTRY_SIZE, 0),
+            access_count=item.get(JSON_ENTRY_ACCESS_COUNT, 0),
         )
-        meta_cache_entries.append(new_entry)
       return meta_cache_entries
 
+  def _entry_epoch(self, item: dict, epoch_key: str, date_key: str) -> int:
+    """Returns a date of an entry in seconds since epoch.
+
+    Entries written by older recipes only have string dates.
+    """
+    if epoch_key in item:
+      return item[epoch_key]
+    if isinstance(item[date_key], int):
+      return item[date_key]
+    return self._legacy_date_to_epoch(item[date_key])
+
+  def _legacy_date_to_epoch(self, date_str: str) -> int:
+    """Converts a legacy string date, with or without time, to epoch."""
+    # TODO(ricardoamador) remove this code once the old dates without times are removed.
+    if not self.date_format_check(date_str):
+      date_str = "{}, 12:00:00".format(date_str)
+    return to_epoch(datetime.strptime(date_str, LEGACY_DATE_FORMAT))
+
   def date_format_check(self, date_str: str) -> bool:
     """Check the date format of the date we are attempting to process.
 
@@ -359,7 +396,7 @@ class CacheMicroManagerApi(recipe_api.RecipeApi):
       True if the time stamp includes the time and the date. False if non-compliant.
     """
     try:
-      datetime.strptime(date_str, "%m/%d/%Y, %H:%M:%S")
+      datetime.strptime(date_str, LEGACY_DATE_FORMAT)
       return True
     except ValueError:
       return False
@@ -0,0 +1,140 @@
+DEPS = [
+  'flutter/cache_micro_manager',
+  'recipe_engine/file',
+  'recipe_engine/path',
+  'recipe_engine/step',
+]
+
+from recipe_engine.post_process import DoesNotRun, MustRun
+
+from datetime import datetime
+import json
+from unittest.mock import Mock
+
+from RECIPE_MODULES.flutter.cache_micro_manager.api import to_epoch
+from RECIPE_MODULES.flutter.cache_micro_manager.api import to_legacy_date
+
+TODAY = datetime(2023, 12, 15, 13, 43, 21, 621929)
+DAY_SECS = 24 * 60 * 60
+
+
+def RunSteps(api):
+  cache_target_dir = api.path.cache_dir / 'osx_sdk'
+  api.path.mock_add_file(cache_target_dir / '.osx_sdk_cache_metadata.json')
+
+  deps_list = [cache_target_dir / 'fake_dep_package_1', 'new_dep_5']
+
+  api.cache_micro_manager.today = Mock(return_value=TODAY)
+
+  api.cache_micro_manager.run(cache_target_dir, deps_list)
+
+
+def MetadataFile(ages_in_days, keyed=False) -> str:
+  '''Computes a metadata file with entries last updated |ages_in_days| ago.
+
+  The file is written keyed by name like earlier versions of the module did
+  if |keyed| is set.
+  '''
+  now = to_epoch(TODAY)
+  entries = []
+  for name, age in ages_in_days.items():
+    updated = now - age * DAY_SECS
+    entries.append({
+        'name': name,
+        'updated_date': to_legacy_date(updated),
+        'removal_date': to_legacy_date(updated + 30 * DAY_SECS),
+        'updated_epoch': updated,
+        'removal_epoch': updated + 30 * DAY_SECS,
+    })
+  if keyed:
+    return json.dumps({
+        'version': 2,
+        'entries': {
+            e['name']: {
+                'updated_date': e['updated_epoch'],
+                'removal_date': e['removal_epoch'],
+            } for e in entries
+        },
+    })
+  return json.dumps(entries)
+
+
+def GenTests(api):
+  read_step = (
+      'Running Cache Micro Manager on [CACHE]/osx_sdk..Reading metadata file '
+      '[CACHE]/osx_sdk/.osx_sdk_cache_metadata.json.Reading '
+      '[CACHE]/osx_sdk/.osx_sdk_cache_metadata.json'
+  )
+  listdir_step = (
+      'Running Cache Micro Manager on [CACHE]/osx_sdk..Reading cache '
+      'directory [CACHE]/osx_sdk'
+  )
+  remove_step = (
+      'Running Cache Micro Manager on [CACHE]/osx_sdk..Removing 2 expired '
+      'cache entries'
+  )
+  yield api.test(
+      'expired_entries_removed_in_one_step',
+      api.step_data(
+          read_step,
+          api.file.read_text(
+              MetadataFile({
+                  'fake_dep_package_1': 45,
+                  'fake_dep_package_2': 365,
+                  'fake_expired_file': 31,
+                  'fake_dep_file_1': 2,
+                  'dep_not_in_dir': 720,
+              })
+          )
+      ),
+      api.step_data(
+          listdir_step,
+          api.file.listdir([
+              'fake_dep_file_1', 'fake_dep_package_1', 'fake_dep_package_2',
+              'fake_expired_file', 'untracked_file',
+              '.osx_sdk_cache_metadata.json'
+          ])
+      ),
+      api.post_check(MustRun, remove_step),
+      api.post_check(
+          MustRun,
+          'Running Cache Micro Manager on [CACHE]/osx_sdk..Writing cache '
+          'metadata file.'
+      ),
+  )
+
+  yield api.test(
+      'nothing_expired',
+      api.step_data(
+          read_step,
+          api.file.read_text(MetadataFile({'fake_dep_file_1': 2}))
+      ),
+      api.step_data(
+          listdir_step,
+          api.file.listdir(['fake_dep_file_1', '.osx_sdk_cache_metadata.json'])
+      ),
+      api.post_check(DoesNotRun, remove_step),
+  )
+
+  yield api.test(
+      'keyed_metadata_file',
+      api.step_data(
+          read_step,
+          api.file.read_text(
+              MetadataFile({
+                  'fake_dep_file_1': 2,
+                  'fake_expired_file': 31,
+                  'fake_dep_package_2': 365,
+              },
+                           keyed=True)
+          )
+      ),
+      api.step_data(
+          listdir_step,
+          api.file.listdir([
+              'fake_dep_file_1', 'fake_expired_file', 'fake_dep_package_2',
+              '.osx_sdk_cache_metadata.json'
+          ])
+      ),
+      api.post_check(MustRun, remove_step),
+  )
@@ -0,0 +1,121 @@
+DEPS = [
+  'flutter/cache_micro_manager',
+  'recipe_engine/file',
+  'recipe_engine/json',
+  'recipe_engine/path',
+  'recipe_engine/step',
+]
+
+from recipe_engine.post_process import MustRun, PropertiesDoNotContain, PropertyEquals
+
+from datetime import datetime
+import json
+from unittest.mock import Mock
+
+from RECIPE_MODULES.flutter.cache_micro_manager.api import LruSizePolicy
+from RECIPE_MODULES.flutter.cache_micro_manager.api import to_epoch
+from RECIPE_MODULES.flutter.cache_micro_manager.api import to_legacy_date
+
+TODAY = datetime(2023, 12, 15, 13, 43, 21, 621929)
+DAY_SECS = 24 * 60 * 60
+GB = 1024 * 1024 * 1024
+
+
+def RunSteps(api):
+  cache_target_dir = api.path.cache_dir / 'osx_sdk'
+  api.path.mock_add_file(cache_target_dir / '.osx_sdk_cache_metadata.json')
+
+  api.cache_micro_manager.today = Mock(return_value=TODAY)
+
+  api.cache_micro_manager.run(
+      cache_target_dir,
+      [cache_target_dir / 'xcode_in_use'],
+      eviction_policy=LruSizePolicy(max_bytes=30 * GB, min_free_bytes=10 * GB),
+  )
+
+
+def MetadataFile(entries) -> str:
+  '''Computes a metadata file from the (age in days, size) of |entries|.'''
+  now = to_epoch(TODAY)
+  items = []
+  for name, (age, size) in entries.items():
+    updated = now - age * DAY_SECS
+    items.append({
+        'name': name,
+        'updated_date': to_legacy_date(updated),
+        'removal_date': to_legacy_date(updated + 30 * DAY_SECS),
+        'updated_epoch': updated,
+        'removal_epoch': updated + 30 * DAY_SECS,
+        'size': size,
+        'access_count': 1,
+    })
+  return json.dumps(items)
+
+
+def GenTests(api):
+  nest = 'Running Cache Micro Manager on [CACHE]/osx_sdk.'
+  read_step = (
+      nest + '.Reading metadata file '
+      '[CACHE]/osx_sdk/.osx_sdk_cache_metadata.json.Reading '
+      '[CACHE]/osx_sdk/.osx_sdk_cache_metadata.json'
+  )
+  listdir_step = nest + '.Reading cache directory [CACHE]/osx_sdk'
+  measure_step = nest + '.Measuring cache entries'
+
+  def metadata(size):
+    return api.step_data(
+        read_step,
+        api.file.read_text(
+            MetadataFile({
+                'xcode_in_use': (20, size),
+                'xcode_recent': (1, size),
+                'xcode_old': (10, size),
+                'xcode_oldest': (25, 0),
+            })
+        )
+    )
+
+  listing = api.step_data(
+      listdir_step,
+      api.file.listdir([
+          'xcode_in_use', 'xcode_recent', 'xcode_old', 'xcode_oldest',
+          '.osx_sdk_cache_metadata.json'
+      ])
+  )
+
+  # 48GB used, the two least recently used entries not in use are evicted.
+  # Only the entry in use and the one without a recorded size are measured.
+  yield api.test(
+      'over_budget_evicts_least_recently_used',
+      metadata(12 * GB),
+      listing,
+      api.step_data(
+          measure_step,
+          stdout=api.json.output({
+              'sizes': {
+                  'xcode_in_use': 12 * GB,
+                  'xcode_oldest': 12 * GB,
+              },
+              'free_bytes': 5 * GB,
+          })
+      ),
+      api.post_check(MustRun, nest + '.Removing 2 expired cache entries'),
+      api.post_check(PropertyEquals, 'osx_sdk_bytes_reclaimed', 24 * GB),
+  )
+
+  yield api.test(
+      'within_budget',
+      metadata(5 * GB),
+      listing,
+      api.step_data(
+          measure_step,
+          stdout=api.json.output({
+              'sizes': {
+                  'xcode_in_use': 10 * GB,
+                  'xcode_oldest': 5 * GB,
+              },
+              'free_bytes': 100 * GB,
+          })
+      ),
+      api.post_check(PropertiesDoNotContain, 'osx_sdk_bytes_reclaimed'),
+  )
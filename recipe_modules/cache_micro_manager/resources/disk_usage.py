@@ -0,0 +1,51 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Measures the size of cache entries and the free space on the cache disk.
+
+Reads {"root": <cache dir>, "names": [<entry name>, ...]} from stdin and
+writes {"sizes": {<entry name>: <bytes>}, "free_bytes": <bytes>} to stdout.
+"""
+
+import json
+import os
+import shutil
+import sys
+
+
+def entry_size(path):
+  """Returns the bytes used by |path|, counting hardlinked files once."""
+  if os.path.islink(path) or not os.path.isdir(path):
+    return os.lstat(path).st_size
+  seen = set()
+  total = 0
+  for dirpath, dirnames, filenames in os.walk(path):
+    for name in dirnames + filenames:
+      try:
+        st = os.lstat(os.path.join(dirpath, name))
+      except OSError:
+        continue
+      if (st.st_dev, st.st_ino) in seen:
+        continue
+      seen.add((st.st_dev, st.st_ino))
+      total += st.st_size
+  return total
+
+
+def main():
+  data = json.load(sys.stdin)
+  root = data['root']
+  sizes = {}
+  for name in data['names']:
+    path = os.path.join(root, name)
+    if os.path.lexists(path):
+      sizes[name] = entry_size(path)
+  json.dump({
+      'sizes': sizes,
+      'free_bytes': shutil.disk_usage(root).free,
+  }, sys.stdout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,32 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Removes a list of files and directories read as JSON from stdin."""
+
+import json
+import os
+import shutil
+import stat
+import sys
+
+
+def _make_writable_and_retry(func, path, _):
+  # Read-only files (e.g. Xcode bundles, git objects) can not be removed on
+  # some platforms until they are made writable.
+  os.chmod(path, os.lstat(path).st_mode | stat.S_IWRITE)
+  func(path)
+
+
+def main():
+  paths = json.load(sys.stdin)
+  for path in paths:
+    if os.path.isdir(path) and not os.path.islink(path):
+      shutil.rmtree(path, onerror=_make_writable_and_retry)
+    elif os.path.lexists(path):
+      os.remove(path)
+    sys.stdout.write('removed %s\n' % path)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
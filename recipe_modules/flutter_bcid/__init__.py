@@ -10,6 +10,7 @@ DEPS = [
     'recipe_engine/bcid_reporter',
     'recipe_engine/buildbucket',
     'recipe_engine/file',
+    'recipe_engine/futures',
     'recipe_engine/path',
     'recipe_engine/platform',
     'recipe_engine/step',
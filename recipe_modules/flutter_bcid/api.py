@@ -20,6 +20,15 @@ class BcidStage(Enum):
 
 VSA_EXTENSION = ".vsa.intoto.jsonl"
 
+# Provenance is usually available seconds after the upload, poll with a short
+# initial sleep and back off for slower uploads.
+PROVENANCE_POLL_SLEEP = 10
+PROVENANCE_POLL_BACKOFF_FACTOR = 2
+PROVENANCE_POLL_MAX_ATTEMPTS = 6
+
+# Maximum number of artifacts verified at once.
+DEFAULT_VERIFY_CONCURRENCY = 8
+
 
 class FlutterBcidApi(recipe_api.RecipeApi):
 
@@ -56,8 +65,54 @@ class FlutterBcidApi(recipe_api.RecipeApi):
       sha256 = self.m.file.file_hash(local_artifact_path)
       self.m.bcid_reporter.report_gcs(sha256, remote_artifact_path)
 
+  def verify_provenances(
+      self, artifacts, max_concurrency=DEFAULT_VERIFY_CONCURRENCY
+  ):
+    """Verifies the provenance of several artifacts concurrently.
+
+    Unlike calling download_and_verify_provenance after a fixed sleep, this
+    starts verifying right away and polls for the provenance with a short
+    exponential backoff. This method is a noop if it is not an official build.
+
+    parameters:
+      artifacts: (list) objects with a `remote` attribute holding the gcs uri
+        of the artifact, e.g. the ArchivePaths returned by the archives module.
+      max_concurrency: (int) maximum number of artifacts verified at once.
+    """
+    if not self.is_official_build():
+      return
+    futures = []
+    for artifact in artifacts:
+      if len(futures) >= max_concurrency:
+        for future in self.m.futures.wait(futures, count=1):
+          futures.remove(future)
+          future.result()
+      gcs_path_without_prefix = artifact.remote[len('gs://'):]
+      bucket, gcs_path_without_bucket = gcs_path_without_prefix.split('/', 1)
+      futures.append(
+          self.m.futures.spawn(
+              self.download_and_verify_provenance,
+              self.m.path.basename(gcs_path_without_bucket),
+              bucket,
+              gcs_path_without_bucket,
+              sleep=PROVENANCE_POLL_SLEEP,
+              backoff_factor=PROVENANCE_POLL_BACKOFF_FACTOR,
+              max_attempts=PROVENANCE_POLL_MAX_ATTEMPTS,
+          )
+      )
+    self.m.futures.wait(futures)
+    # We awaited above; this loop will raise the first exception (if any)
+    for future in futures:
+      future.result()
+
   def download_and_verify_provenance(
-      self, filename, bucket, gcs_path_without_bucket
+      self,
+      filename,
+      bucket,
+      gcs_path_without_bucket,
+      sleep=60,
+      backoff_factor=2,
+      max_attempts=4,
   ):
     """Downloads and verifies provenance for a specified artifact.
 
@@ -71,6 +126,10 @@ class FlutterBcidApi(recipe_api.RecipeApi):
       bucket: (str) the GCS bucket, eg: "flutter_infra_release"
       gcs_path_without_bucket: (str) the GCS path, excluding gs://{bucket}/
         eg: "flutter/004d0bdf6721bc65cdb9a558908b2de4cfac97c5/sky_engine.zip"
+      sleep: (int) the initial time to wait for the provenance to be uploaded.
+      backoff_factor: (int) the factor by which the sleep time is multiplied
+        after each attempt.
+      max_attempts: (int) how many times to try before giving up.
     """
     if self.is_official_build():
       with self.m.step.nest("Verify %s provenance" % filename):
@@ -87,9 +146,9 @@ class FlutterBcidApi(recipe_api.RecipeApi):
         # https://github.com/flutter/flutter/issues/151791
         bcid_response = self.m.retry.wrap(
             download_and_verify,
-            sleep=60,
-            backoff_factor=2,
-            max_attempts=4,
+            sleep=sleep,
+            backoff_factor=backoff_factor,
+            max_attempts=max_attempts,
         )
 
         artifact_vsa = bcid_response['verificationSummary']
@@ -2,10 +2,13 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from RECIPE_MODULES.flutter.archives.api import ArchivePaths
+
 DEPS = [
     'flutter/flutter_bcid',
     'recipe_engine/buildbucket',
     'recipe_engine/path',
+    'recipe_engine/properties',
     'recipe_engine/raw_io',
 ]
 
@@ -21,6 +24,11 @@ def RunSteps(api):
   api.flutter_bcid.download_and_verify_provenance(
       "artifact.zip", "flutter_infra", "release_artifacts/artifacts.zip"
   )
+  artifacts = [
+      ArchivePaths(api.path.cache_dir / name, remote)
+      for name, remote in api.properties.get('artifacts', {}).items()
+  ]
+  api.flutter_bcid.verify_provenances(artifacts, max_concurrency=1)
 
 
 def GenTests(api):
@@ -53,3 +61,44 @@ def GenTests(api):
           stdout=api.raw_io.output_text(fake_bcid_response_success)
       ),
   )
+
+  yield api.test(
+      'verify_provenances',
+      api.properties(
+          artifacts={
+              'a.zip': 'gs://flutter_infra/flutter/abc/a.zip',
+              'b.zip': 'gs://flutter_infra/flutter/abc/b.zip',
+          }
+      ),
+      api.buildbucket.ci_build(
+          project='dart-internal',
+          bucket='flutter',
+          git_repo='https://dart.googlesource.com/monorepo',
+          git_ref='refs/heads/main'
+      ),
+      api.step_data(
+          'Verify artifact.zip provenance.verify artifact.zip provenance',
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+      api.step_data(
+          'Verify a.zip provenance.verify a.zip provenance',
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+      api.step_data(
+          'Verify b.zip provenance.verify b.zip provenance',
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+  )
+
+  yield api.test(
+      'verify_provenances_not_official',
+      api.properties(
+          artifacts={'a.zip': 'gs://flutter_infra/flutter/abc/a.zip'}
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main'
+      ),
+  )
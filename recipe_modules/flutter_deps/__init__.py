@@ -11,6 +11,7 @@ DEPS = [
     'recipe_engine/context',
     'recipe_engine/defer',
     'recipe_engine/file',
+    'recipe_engine/futures',
     'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/platform',
@@ -19,3 +20,18 @@ DEPS = [
     'recipe_engine/step',
     'recipe_engine/swarming',
 ]
+
+from recipe_engine.recipe_api import Property
+from recipe_engine.config import ConfigGroup, Single
+
+PROPERTIES = {
+    '$flutter/flutter_deps': Property(
+    help='Properties specifically for the flutter_deps module.',
+    param_name='deps_properties',
+    kind=ConfigGroup(  # pylint: disable=line-too-long
+      # Install the CIPD packages of the dependencies concurrently, see
+      # FlutterDepsApi.required_deps.
+      parallel_install=Single(bool),
+    ), default={},
+    )
+}
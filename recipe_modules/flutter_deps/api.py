@@ -6,9 +6,59 @@ import copy
 from recipe_engine import recipe_api
 
 
+# Dependencies that only install CIPD packages and update the environment.
+# With parallel_install their packages are installed together, before the
+# other dependencies run.
+PLANNABLE_DEPS = frozenset([
+    'android_sdk',
+    'chrome_and_driver',
+    'clang',
+    'cmake',
+    'codesign',
+    'curl',
+    'dart_sdk',
+    'doxygen',
+    'firefox',
+    'go_sdk',
+    'goldctl',
+    'ninja',
+    'open_jdk',
+    'swift_format',
+])
+
+
 class FlutterDepsApi(recipe_api.RecipeApi):
   """Utilities to install flutter build/test dependencies at runtime."""
 
+  def __init__(self, deps_properties, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._deps_properties = deps_properties
+    # (root, EnsureFile) pairs collected while planning, see required_deps.
+    self._planned_ensures = None
+
+  def _ensure(self, root, ensure_file):
+    """Installs |ensure_file| in |root|, or records it while planning."""
+    if self._planned_ensures is not None:
+      self._planned_ensures.append((root, ensure_file))
+      return
+    self.m.cipd.ensure(root, ensure_file)
+
+  def _install_planned(self, planned):
+    """Installs the packages recorded while planning, one root per step."""
+    if not planned:
+      return
+    with self.m.step.nest('Install dependencies'):
+      futures = [
+          self.m.futures.spawn(
+              self.m.cipd.ensure,
+              root,
+              ensure_file,
+              name='ensure %s' % self.m.path.basename(root),
+          ) for root, ensure_file in planned
+      ]
+      for future in futures:
+        future.result()
+
   def flutter_engine(self, env, env_prefixes):
     """Sets the local engine related information to environment variables.
 
@@ -61,7 +111,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
       env_prefixes['PATH'] = paths
       env['LOCAL_WEB_SDK'] = local_web_sdk
 
-  def required_deps(self, env, env_prefixes, deps):
+  def required_deps(self, env, env_prefixes, deps, parallel_install=None):
     """Install all the required dependencies for a given builder.
 
     Args:
@@ -70,7 +120,12 @@ class FlutterDepsApi(recipe_api.RecipeApi):
       deps(list(dict)): A list of dictionaries with dependencies as
         {'dependency': 'android_sdk', version: ''} where an empty version
         means the default.
+      parallel_install(bool): Whether to install the CIPD packages of the
+        PLANNABLE_DEPS concurrently before the other dependencies. Defaults
+        to the parallel_install module property.
     """
+    if parallel_install is None:
+      parallel_install = self._deps_properties.get('parallel_install', False)
     available_deps = {
         'android_sdk': self.android_sdk,
         'android_virtual_device': self.android_virtual_device,
@@ -103,6 +158,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
         'vs_build': self.vs_build,
     }
     parsed_deps = []
+    to_run = []
     for dep in deps:
       dependency = dep.get('dependency')
       # TODO(fujino): Enforce a hard requirement that there be a version here,
@@ -125,7 +181,24 @@ class FlutterDepsApi(recipe_api.RecipeApi):
             If this is a new dependency, update https://cs.opensource.google/flutter/recipes/+/main:recipe_modules/flutter_deps/api.py
             '''.format(dependency, available_deps.keys())
         raise ValueError(msg)
-      dep_funct(env, env_prefixes, version)
+      to_run.append((dependency, dep_funct, version))
+
+    if not parallel_install:
+      for _, dep_funct, version in to_run:
+        dep_funct(env, env_prefixes, version)
+      return
+
+    self._planned_ensures = []
+    try:
+      for dependency, dep_funct, version in to_run:
+        if dependency in PLANNABLE_DEPS:
+          dep_funct(env, env_prefixes, version)
+    finally:
+      planned, self._planned_ensures = self._planned_ensures, None
+    self._install_planned(planned)
+    for dependency, dep_funct, version in to_run:
+      if dependency not in PLANNABLE_DEPS:
+        dep_funct(env, env_prefixes, version)
 
   def android_virtual_device(self, env, env_prefixes, version):
     """Simply sets the version of the emulator globally as the module will download the package itself.
@@ -159,7 +232,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     version = version or 'version:11'
     with self.m.step.nest('OpenJDK dependency'):
       java_cache_dir = self.m.path.cache_dir / 'java'
-      self.m.cipd.ensure(
+      self._ensure(
           java_cache_dir,
           self.m.cipd.EnsureFile().add_package(
               'flutter/java/openjdk/${platform}', version
@@ -228,7 +301,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     version = version or 'git_revision:720a542f6fe4f92922c3b8f0fdcc4d2ac6bb83cd'
     with self.m.step.nest('Download goldctl'):
       goldctl_cache_dir = self.m.path.cache_dir / 'gold'
-      self.m.cipd.ensure(
+      self._ensure(
           goldctl_cache_dir,
           self.m.cipd.EnsureFile().add_package(
               'skia/tools/goldctl/${platform}', version
@@ -254,13 +327,13 @@ class FlutterDepsApi(recipe_api.RecipeApi):
       chrome_path = self.m.path.cache_dir / 'chrome/chrome'
       pkgs = self.m.cipd.EnsureFile()
       pkgs.add_package('flutter_internal/browsers/chrome/${platform}', version)
-      self.m.cipd.ensure(chrome_path, pkgs)
+      self._ensure(chrome_path, pkgs)
       chrome_driver_path = self.m.path.cache_dir / 'chrome/drivers'
       pkgdriver = self.m.cipd.EnsureFile()
       pkgdriver.add_package(
           'flutter_internal/browser-drivers/chrome/${platform}', version
       )
-      self.m.cipd.ensure(chrome_driver_path, pkgdriver)
+      self._ensure(chrome_driver_path, pkgdriver)
       paths = env_prefixes.get('PATH', [])
       paths.append(chrome_path)
       paths.append(chrome_driver_path)
@@ -297,7 +370,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
       firefox_path = self.m.path.cache_dir / 'firefox'
       pkgs = self.m.cipd.EnsureFile()
       pkgs.add_package('flutter_internal/browsers/firefox/${platform}', version)
-      self.m.cipd.ensure(firefox_path, pkgs)
+      self._ensure(firefox_path, pkgs)
       paths = env_prefixes.get('PATH', [])
       paths.append(firefox_path)
       env_prefixes['PATH'] = paths
@@ -323,7 +396,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     go_path = self.m.path.cache_dir / 'go'
     go = self.m.cipd.EnsureFile()
     go.add_package('infra/3pp/tools/go/${platform}', version)
-    self.m.cipd.ensure(go_path, go)
+    self._ensure(go_path, go)
     paths = env_prefixes.get('PATH', [])
     paths.append(go_path / 'bin')
     # Setup GOPATH and add to the env.
@@ -351,7 +424,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     doxygen_path = self.m.path.mkdtemp() / 'doxygen'
     doxygen = self.m.cipd.EnsureFile()
     doxygen.add_package('flutter/doxygen/${platform}', version)
-    self.m.cipd.ensure(doxygen_path, doxygen)
+    self._ensure(doxygen_path, doxygen)
     paths = env_prefixes.get('PATH', [])
     paths.append(doxygen_path / 'bin')
     env_prefixes['PATH'] = paths
@@ -362,7 +435,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     curl_path = self.m.path.mkdtemp() / 'curl'
     curl = self.m.cipd.EnsureFile()
     curl.add_package('flutter_internal/tools/curl/${platform}', version)
-    self.m.cipd.ensure(curl_path, curl)
+    self._ensure(curl_path, curl)
     paths = env_prefixes.get('PATH', [])
     paths.append(curl_path)
     env_prefixes['PATH'] = paths
@@ -371,7 +444,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     """Installs android sdk."""
     version = version or 'latest'
     sdk_root = self.m.path.cache_dir / 'android'
-    self.m.cipd.ensure(
+    self._ensure(
         sdk_root,
         self.m.cipd.EnsureFile().add_package(
             'flutter/android/sdk/all/${platform}',
@@ -446,7 +519,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     clang = self.m.cipd.EnsureFile()
     clang.add_package('fuchsia/third_party/clang/${platform}', version)
     with self.m.step.nest('Install clang'):
-      self.m.cipd.ensure(clang_path, clang)
+      self._ensure(clang_path, clang)
     paths = env_prefixes.get('PATH', [])
     paths.append(clang_path / 'bin')
     env_prefixes['PATH'] = paths
@@ -463,7 +536,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     version = version or 'build_id:8787856497187628321'
     cmake.add_package('infra/3pp/tools/cmake/${platform}', version)
     with self.m.step.nest('Install cmake'):
-      self.m.cipd.ensure(cmake_path, cmake)
+      self._ensure(cmake_path, cmake)
     paths = env_prefixes.get('PATH', [])
     paths.append(cmake_path / 'bin')
     env_prefixes['PATH'] = paths
@@ -480,7 +553,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     codesign = self.m.cipd.EnsureFile()
     codesign.add_package('flutter/codesign/${platform}', version)
     with self.m.step.nest('Installing Mac codesign CIPD pkg'):
-      self.m.cipd.ensure(codesign_path, codesign)
+      self._ensure(codesign_path, codesign)
     paths = env_prefixes.get('PATH', [])
     paths.append(codesign_path)
     env_prefixes['PATH'] = paths
@@ -498,7 +571,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     ninja = self.m.cipd.EnsureFile()
     ninja.add_package("infra/ninja/${platform}", version)
     with self.m.step.nest('Install ninja'):
-      self.m.cipd.ensure(ninja_path, ninja)
+      self._ensure(ninja_path, ninja)
     paths = env_prefixes.get('PATH', [])
     paths.append(ninja_path)
     env_prefixes['PATH'] = paths
@@ -515,7 +588,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     dart_sdk = self.m.cipd.EnsureFile()
     dart_sdk.add_package("dart/dart-sdk/${platform}", version)
     with self.m.step.nest('Install dart sdk'):
-      self.m.cipd.ensure(dart_sdk_path, dart_sdk)
+      self._ensure(dart_sdk_path, dart_sdk)
     paths = env_prefixes.get('PATH', [])
     paths.insert(0, dart_sdk_path)
     env_prefixes['PATH'] = paths
@@ -563,7 +636,7 @@ class FlutterDepsApi(recipe_api.RecipeApi):
     sf = self.m.cipd.EnsureFile()
     sf.add_package("infra/3pp/tools/swift-format/${platform}", version)
     with self.m.step.nest('Install swift-format'):
-      self.m.cipd.ensure(swift_format_path, sf)
+      self._ensure(swift_format_path, sf)
     paths = env_prefixes.get('PATH', [])
     paths.append(swift_format_path)
     env_prefixes['PATH'] = paths
@@ -3,7 +3,7 @@
 # found in the LICENSE file.
 
 import contextlib
-from recipe_engine.post_process import DoesNotRun, Filter, StatusFailure
+from recipe_engine.post_process import DoesNotRun, Filter, MustRun, StatusFailure
 from recipe_engine.recipe_api import Property
 
 DEPS = [
@@ -214,3 +214,23 @@ def GenTests(api):
           stdout=api.json.output([{'isComplete': True, 'catalog': {'productLineVersion': '2019'}}])
       ),
   )
+  yield api.test(
+      'parallel_install',
+      api.platform('linux', 64),
+      api.properties(
+          **{
+              '$flutter/flutter_deps': {'parallel_install': True},
+              'dependencies': [
+                  {'dependency': 'open_jdk'},
+                  {'dependency': 'gh_cli'},
+                  {'dependency': 'ninja'},
+                  {'dependency': 'clang'},
+              ],
+          }
+      ),
+      api.repo_util.flutter_environment_data(checkout_path),
+      api.post_process(
+          MustRun,
+          'Install dependencies.ensure clang',
+      ),
+  )
@@ -1,7 +1,10 @@
 DEPS = [
+    'depot_tools/depot_tools',
     'depot_tools/gsutil',
     'recipe_engine/buildbucket',
     'recipe_engine/file',
+    'recipe_engine/futures',
+    'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/step',
     'recipe_engine/uuid',
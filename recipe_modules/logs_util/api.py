@@ -3,13 +3,14 @@
 # found in the LICENSE file.
 
 import re
+from contextlib import contextmanager
 from recipe_engine import recipe_api
 
 
 class LogUtilsApi(recipe_api.RecipeApi):
   """Utilities to collect logs in a generic way."""
 
-  def initialize_logs_collection(self, env):
+  def initialize_logs_collection(self, env, logs_path=None):
     """Initializes log processing.
 
     The initialization process creates a temp directory and adds it to the
@@ -18,11 +19,13 @@ class LogUtilsApi(recipe_api.RecipeApi):
 
     Args:
       env(dict): Env variables dictionary.
+      logs_path(Path): Optional logs directory, used to keep the logs of tasks
+        running concurrently apart. Defaults to a shared directory.
     """
     # Create a temp folder to keep logs until we can upload them to gcs
     # at the end of the execution of the test.
     with self.m.step.nest('Initialize logs'):
-      logs_path = self.m.path.cleanup_dir / 'flutter_logs_dir'
+      logs_path = logs_path or self.m.path.cleanup_dir / 'flutter_logs_dir'
       self.m.file.ensure_directory('Ensure %s' % logs_path, logs_path)
       env['FLUTTER_LOGS_DIR'] = logs_path
       # Ensure that any test outputs, e.g. timelines/timeline summaries are
@@ -34,45 +37,102 @@ class LogUtilsApi(recipe_api.RecipeApi):
           'Write noop file', logs_path / 'noop.txt', '', include_log=False
       )
 
-  def upload_logs(self, task, type='flutter', uuid=None):
-    """Upload the log files in FLUTTER_LOGS_DIR to GCS.
-
-    Args:
-      task(str): A string with the task name the logs belong to.
-    """
+  def _logs_destination(self, task, type, uuid):
+    """Returns the invocation id and the GCS path of the logs of |task|."""
     git_hash = self.m.buildbucket.gitiles_commit.id
     # gitiles_commit is only populated on post-submits.
     # UUID is used in LED and try jobs.
     if uuid is None:
       uuid = self.m.uuid.random()
     invocation_id = git_hash if git_hash else uuid
-    logs_path = self.m.path.cleanup_dir / 'flutter_logs_dir'
-    with self.m.step.nest('process logs'):
-      self.m.gsutil.upload(
-          bucket='flutter_logs',
-          source=logs_path,
-          dest='%s/%s/%s/%s' % (type, invocation_id, task, uuid),
-          link_name='archive logs',
-          args=['-r'],
-          multithreaded=True,
-          name='upload logs %s' % invocation_id,
-          unauthenticated_url=True
-      )
-      log_files = self.m.file.glob_paths(
-          'logs', source=logs_path, pattern='*', test_data=['a.txt']
-      )
+    return invocation_id, '%s/%s/%s/%s' % (type, invocation_id, task, uuid)
+
+  def _ship_logs(self, step_name, logs_path, dest, stop_file=None, interval=30):
+    """Runs the log shipper and returns the manifest of uploaded files."""
+    data = {
+        'logs_path': logs_path,
+        'gsutil': ['python3', '-u', self.m.depot_tools.gsutil_py_path, '--'],
+        'dest': 'gs://flutter_logs/%s' % dest,
+        'url_prefix': 'https://storage.googleapis.com/flutter_logs/%s' % dest,
+    }
+    if stop_file:
+      data['stop_file'] = stop_file
+      data['interval'] = interval
+    step = self.m.step(
+        step_name,
+        ['python3', self.resource('log_shipper.py')],
+        stdin=self.m.json.input(data),
+        stdout=self.m.json.output(),
+        infra_step=True,
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            'myfile.txt': {
+                'url': '%s/myfile.txt' % data['url_prefix'],
+                'size': 1,
+            }
+        }),
+    )
+    step.presentation.links['archive logs'] = data['url_prefix']
+    return step.stdout or {}
+
+  def _present_log_links(self, manifest):
     with self.m.step.nest('log links') as presentation:
-      pattern_str = 'https://storage.googleapis.com/%s/%s/%s/%s/%s/%s'
-      log_files = self.m.file.listdir(
-          'List logs path', logs_path, True, test_data=('myfile.txt',)
+      for rel_path, entry in sorted(manifest.items()):
+        presentation.links[rel_path] = entry['url']
+
+  def upload_logs(self, task, type='flutter', uuid=None, logs_path=None):
+    """Upload the log files in FLUTTER_LOGS_DIR to GCS.
+
+    Text logs are stored gzipped and served with Content-Encoding: gzip.
+
+    Args:
+      task(str): A string with the task name the logs belong to.
+      logs_path(Path): The logs directory passed to initialize_logs_collection
+        if any.
+    """
+    invocation_id, dest = self._logs_destination(task, type, uuid)
+    logs_path = logs_path or self.m.path.cleanup_dir / 'flutter_logs_dir'
+    with self.m.step.nest('process logs'):
+      manifest = self._ship_logs(
+          'upload logs %s' % invocation_id, logs_path, dest
       )
-      for log_file in log_files:
-        base_name = self.m.path.basename(log_file)
+    self._present_log_links(manifest)
+
+  @contextmanager
+  def streaming_upload_logs(
+      self, task, type='flutter', uuid=None, logs_path=None, interval=30
+  ):
+    """Uploads the log files in FLUTTER_LOGS_DIR while the body runs.
+
+    The files that stopped changing are uploaded every |interval| seconds,
+    so the logs written so far survive a task killed at timeout and only the
+    last files are left to upload when the body completes.
 
-        url = pattern_str % (
-            'flutter_logs', type, invocation_id, task, uuid, base_name
+    Args:
+      task(str): A string with the task name the logs belong to.
+      logs_path(Path): The logs directory passed to initialize_logs_collection
+        if any.
+      interval(int): Seconds between two scans of the logs directory.
+    """
+    invocation_id, dest = self._logs_destination(task, type, uuid)
+    logs_path = logs_path or self.m.path.cleanup_dir / 'flutter_logs_dir'
+    stop_file = self.m.path.mkdtemp('log_shipper') / 'stop'
+    shipper = self.m.futures.spawn(
+        self._ship_logs,
+        'stream logs %s' % invocation_id,
+        logs_path,
+        dest,
+        stop_file=stop_file,
+        interval=interval,
+    )
+    try:
+      yield
+    finally:
+      with self.m.step.nest('process logs'):
+        self.m.file.write_text(
+            'stop log shipper', stop_file, '', include_log=False
         )
-        presentation.links[base_name] = url
+        manifest = shipper.result()
+      self._present_log_links(manifest)
 
   def upload_test_metrics(self, file_path, task_name, git_hash=None):
     """Retrieve the file from the provided path and store it in gcs.
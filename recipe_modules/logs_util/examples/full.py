@@ -13,6 +13,13 @@ def RunSteps(api):
   api.logs_util.initialize_logs_collection(env)
   api.logs_util.upload_logs('mytaskname')
   api.logs_util.upload_logs('uniquetask', uuid='uuid-abc')
+  custom_logs_path = api.path.cleanup_dir / 'custom_logs_dir'
+  api.logs_util.initialize_logs_collection(env, logs_path=custom_logs_path)
+  api.logs_util.upload_logs('customtask', logs_path=custom_logs_path)
+  with api.logs_util.streaming_upload_logs('streamingtask', interval=10):
+    api.file.write_text(
+        'write log', api.path.cleanup_dir / 'flutter_logs_dir' / 'log.txt', ''
+    )
   s = api.path.cleanup_dir / 'flutter_logs_dir'
   api.logs_util.upload_test_metrics(s, 'taskname', 'hash')
   api.logs_util.upload_test_metrics('/path/to/tmp/json', 'taskname2')
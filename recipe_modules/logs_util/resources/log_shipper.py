@@ -0,0 +1,113 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Uploads the files of a logs directory to GCS, optionally while they grow.
+
+Reads a json dict from stdin with:
+  logs_path: the directory to upload.
+  gsutil: the command prefix running gsutil.
+  dest: the gs:// destination of the directory.
+  url_prefix: the public url of the destination.
+  stop_file: (optional) when set, the directory is polled every |interval|
+    seconds and the files that did not change since the previous poll are
+    uploaded, until |stop_file| exists. A final pass then uploads everything
+    left.
+
+Text files are gzipped before the upload (gsutil cp -z) and stored with
+Content-Encoding: gzip, so they use less space and still render in the
+browser. Prints a json manifest mapping the path of each
+uploaded file, relative to logs_path, to its url and size.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Extensions of the files gzipped on upload.
+TEXT_EXTENSIONS = ('csv', 'html', 'json', 'log', 'md', 'txt', 'xml', 'yaml')
+
+
+def scan(logs_path):
+  """Returns a dict mapping relative paths to (size, mtime)."""
+  files = {}
+  for dirpath, _, filenames in os.walk(logs_path):
+    for name in filenames:
+      path = os.path.join(dirpath, name)
+      try:
+        st = os.stat(path)
+      except OSError:
+        continue
+      rel_path = os.path.relpath(path, logs_path).replace(os.sep, '/')
+      files[rel_path] = (st.st_size, st.st_mtime_ns)
+  return files
+
+
+def upload(data, rel_paths):
+  """Uploads |rel_paths|, one gsutil invocation per directory.
+
+  Returns:
+    The relative paths that were uploaded.
+  """
+  by_dir = {}
+  for rel_path in rel_paths:
+    by_dir.setdefault(os.path.dirname(rel_path), []).append(rel_path)
+  uploaded = []
+  for rel_dir, paths in sorted(by_dir.items()):
+    dest = data['dest'].rstrip('/') + '/'
+    if rel_dir:
+      dest += rel_dir + '/'
+    cmd = data['gsutil'] + [
+        '-m', 'cp', '-z', ','.join(TEXT_EXTENSIONS), '-I', dest
+    ]
+    stdin = '\n'.join(os.path.join(data['logs_path'], p) for p in paths)
+    result = subprocess.run(cmd, input=stdin, text=True, check=False)
+    if result.returncode:
+      sys.stderr.write('Failed to upload %d files to %s\n' % (len(paths), dest))
+      continue
+    uploaded.extend(paths)
+  return uploaded
+
+
+def main():
+  data = json.load(sys.stdin)
+  logs_path = data['logs_path']
+  stop_file = data.get('stop_file')
+  interval = data.get('interval', 30)
+
+  manifest = {}
+  uploaded = {}
+  previous = {}
+  failed = False
+  while True:
+    final = not stop_file or os.path.exists(stop_file)
+    current = scan(logs_path)
+    if final:
+      to_upload = [p for p, key in current.items() if uploaded.get(p) != key]
+    else:
+      # Only upload the files that stopped changing, a file still being
+      # written is uploaded in a later pass.
+      to_upload = [
+          p for p, key in current.items()
+          if previous.get(p) == key and uploaded.get(p) != key
+      ]
+    done = upload(data, sorted(to_upload))
+    for rel_path in done:
+      uploaded[rel_path] = current[rel_path]
+      manifest[rel_path] = {
+          'url': data['url_prefix'].rstrip('/') + '/' + rel_path,
+          'size': current[rel_path][0],
+      }
+    if final:
+      failed = len(done) != len(to_upload)
+      break
+    previous = current
+    time.sleep(interval)
+
+  json.dump(manifest, sys.stdout, sort_keys=True)
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -21,19 +21,6 @@ class OsUtilsApi(recipe_api.RecipeApi):
     if self._test_data.enabled:
       self._mock_is_symlink = self._test_data.get('is_symlink', True)
 
-  def _kill_win(self, name, exe_name):
-    """Kills all the windows processes with a given name.
-
-    Args:
-      name(str): The name of the step.
-      exe_name(str): The name of the windows executable.
-    """
-    self.m.step(
-        name,
-        ['taskkill', '/f', '/im', exe_name, '/t'],
-        ok_ret='any',
-    )
-
   def replace_magic_envs(self, command, env):
     """Replaces allowed listed env variables by its value."""
     MAGIC_ENV_DICT = {
@@ -113,19 +100,76 @@ class OsUtilsApi(recipe_api.RecipeApi):
           infra_step=True,
       )
 
+  def reap_processes(
+      self,
+      step_name,
+      names=(),
+      name_patterns=(),
+      cmdline_patterns=(),
+      roots=(),
+      kill_tree=False,
+  ):
+    """Kills the matching processes in a single step.
+
+    The process table is read once and this step's own ancestors are never
+    killed. Processes that are not running are not an error. Processes get
+    SIGTERM and a few seconds to exit before SIGKILL.
+
+    Args:
+      step_name(str): The name of the step.
+      names(list(str)): Exact process names, like killall. The .exe suffix
+        is optional on Windows.
+      name_patterns(list(str)): Regular expressions searched in process
+        names, like pkill.
+      cmdline_patterns(list(str)): Regular expressions searched in full
+        command lines, like pkill -f.
+      roots(list(int)): Pids whose whole process tree is killed.
+      kill_tree(bool): Whether to also kill the descendants of the matched
+        processes, like taskkill /t.
+
+    Returns:
+      A dict with the 'killed' processes and those that 'failed' to be
+      killed, each one a dict with its pid, name, cmdline and the reason it
+      matched.
+    """
+    step = self.m.step(
+        step_name,
+        ['python3', self.resource('reaper.py')],
+        stdin=self.m.json.input({
+            'names': list(names),
+            'name_patterns': list(name_patterns),
+            'cmdline_patterns': list(cmdline_patterns),
+            'roots': list(roots),
+            'kill_tree': kill_tree,
+        }),
+        stdout=self.m.json.output(),
+        ok_ret='any',
+        infra_step=True,
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            'killed': [],
+            'failed': []
+        }),
+    )
+    report = step.stdout or {'killed': [], 'failed': []}
+    killed = sorted({p['name'] for p in report['killed']})
+    step.presentation.step_text = 'killed %d processes%s' % (
+        len(report['killed']), ': %s' % ', '.join(killed) if killed else ''
+    )
+    if report['failed']:
+      step.presentation.logs['failed'] = self.m.json.dumps(
+          report['failed'], indent=2
+      ).splitlines()
+    return report
+
   def kill_simulators(self):
     """Kills any open simulators.
 
     This is to ensure builds use xcode from a clean state.
     """
     if self.m.platform.is_mac:
-      self.m.step(
-          'kill dart', [
-              'killall', '-9', '-v',
-              'com.apple.CoreSimulator.CoreSimulatorDevice'
-          ],
-          ok_ret='any',
-          infra_step=True
+      self.reap_processes(
+          'kill simulators',
+          names=['com.apple.CoreSimulator.CoreSimulatorDevice'],
       )
 
   def kill_processes(self):
@@ -145,70 +189,29 @@ class OsUtilsApi(recipe_api.RecipeApi):
     """
     with self.m.step.nest('Killing Processes') as presentation:
       if self.m.platform.is_win:
-        self._kill_win('stop gradle daemon', 'java.exe')
-        self._kill_win('stop dart', 'dart.exe')
-        self._kill_win('stop adb', 'adb.exe')
-        self._kill_win('stop flutter_tester', 'flutter_tester.exe')
-      elif self.m.platform.is_mac:
-        self.m.step(
-            'kill dart', ['killall', '-9', '-v', 'dart'],
-            ok_ret='any',
-            infra_step=True
+        self.reap_processes(
+            'reap processes',
+            names=['java', 'dart', 'adb', 'flutter_tester'],
+            kill_tree=True,
         )
-        self.m.step(
-            'kill flutter', ['killall', '-9', '-v', 'flutter'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill Chrome', ['killall', '-9', '-v', 'Chrome'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill Safari', ['killall', '-9', '-v', 'Safari'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill java', ['killall', '-9', '-v', 'java'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill adb', ['killall', '-9', '-v', 'adb'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill Xcode', ['killall', '-9', '-v', 'Xcode'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill QuickTime', ['killall', '-9', '-v', 'QuickTime Player'],
-            ok_ret='any',
-            infra_step=True
+      elif self.m.platform.is_mac:
+        self.reap_processes(
+            'reap processes',
+            names=[
+                'dart',
+                'flutter',
+                'Chrome',
+                'Safari',
+                'java',
+                'adb',
+                'Xcode',
+                'QuickTime Player',
+            ],
         )
       else:
-        self.m.step(
-            'kill chrome', ['pkill', '-e', 'chrome'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill dart', ['pkill', '-e', 'dart'], ok_ret='any', infra_step=True
-        )
-        self.m.step(
-            'kill flutter', ['pkill', '-e', 'flutter'],
-            ok_ret='any',
-            infra_step=True
-        )
-        self.m.step(
-            'kill java', ['pkill', '-e', 'java'], ok_ret='any', infra_step=True
-        )
-        self.m.step(
-            'kill adb', ['pkill', '-e', 'adb'], ok_ret='any', infra_step=True
+        self.reap_processes(
+            'reap processes',
+            name_patterns=['chrome', 'dart', 'flutter', 'java', 'adb'],
         )
       # Ensure we always pass this step as killing non existing processes
       # may create errors.
@@ -116,7 +116,24 @@ def GenTests(api):
   yield api.test(
       'with_failures',
       api.platform('win', 64),
-      api.step_data("Killing Processes.stop dart", retcode=1),
+      api.step_data(
+          "Killing Processes.reap processes",
+          stdout=api.json.output({
+              'killed': [{
+                  'pid': 2,
+                  'name': 'java.exe',
+                  'cmdline': 'java',
+                  'reason': 'name'
+              }],
+              'failed': [{
+                  'pid': 3,
+                  'name': 'dart.exe',
+                  'cmdline': 'dart',
+                  'reason': 'name',
+                  'error': 'Access is denied'
+              }],
+          }),
+      ),
       api.step_data('Detect installation', stdout=api.json.output([])),
       api.step_data('Detect installation (2)', stdout=api.json.output([])),
   )
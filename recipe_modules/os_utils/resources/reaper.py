@@ -0,0 +1,259 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Kills the processes matching a set of rules in a single pass.
+
+Reads a json dict from stdin with:
+  names: process names to kill, compared exactly like killall does. The
+    .exe suffix and the case are ignored on Windows.
+  name_patterns: regular expressions searched in process names, like pkill.
+  cmdline_patterns: regular expressions searched in the full command lines,
+    like pkill -f.
+  roots: pids whose whole process tree is killed.
+  kill_tree: whether to also kill the descendants of matched processes, like
+    taskkill /t.
+  grace_seconds: how long processes have to exit after SIGTERM before they
+    get SIGKILL, GRACE_SECONDS by default.
+
+The process table is read once. This script and its ancestors are never
+killed. Prints a json report with the killed processes and the ones that
+could not be killed.
+"""
+
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+GRACE_SECONDS = 5
+# Seconds between two checks of the processes still running after SIGTERM.
+POLL_SECONDS = 0.1
+
+
+class Process(object):
+
+  def __init__(self, pid, ppid, name, cmdline, create_time=None):
+    self.pid = pid
+    self.ppid = ppid
+    self.name = name
+    self.cmdline = cmdline
+    # Only known on Windows, where the parent pid of a process is not
+    # updated when its parent exits and may be reused by another process.
+    self.create_time = create_time
+
+  def to_json(self, **kwargs):
+    data = {'pid': self.pid, 'name': self.name, 'cmdline': self.cmdline}
+    data.update(kwargs)
+    return data
+
+
+def read_proc(path):
+  with open(path, 'rb') as f:
+    return f.read().decode('utf-8', 'replace')
+
+
+def list_linux():
+  processes = []
+  for entry in os.listdir('/proc'):
+    if not entry.isdigit():
+      continue
+    try:
+      stat = read_proc('/proc/%s/stat' % entry)
+      cmdline = read_proc('/proc/%s/cmdline' % entry)
+    except OSError:
+      # The process exited while the table was being read.
+      continue
+    # The name is in parentheses and may itself contain spaces.
+    name = stat[stat.index('(') + 1:stat.rindex(')')]
+    ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+    processes.append(
+        Process(int(entry), ppid, name,
+                cmdline.replace('\0', ' ').strip())
+    )
+  return processes
+
+
+def list_mac():
+  # comm and command may contain spaces, so they are read separately with
+  # the pid as the only other column.
+  parents = {}
+  names = {}
+  for line in subprocess.check_output(['ps', '-axo', 'pid=,ppid=,comm='],
+                                      text=True).splitlines():
+    fields = line.split(None, 2)
+    if len(fields) < 2:
+      continue
+    pid, ppid = int(fields[0]), int(fields[1])
+    parents[pid] = ppid
+    # comm is empty for some kernel processes.
+    names[pid] = os.path.basename(fields[2]) if len(fields) > 2 else ''
+  cmdlines = {}
+  for line in subprocess.check_output(['ps', '-axww', '-o', 'pid=,command='],
+                                      text=True).splitlines():
+    fields = line.split(None, 1)
+    cmdlines[int(fields[0])] = fields[1] if len(fields) > 1 else ''
+  return [
+      Process(pid, ppid, names[pid], cmdlines.get(pid, ''))
+      for pid, ppid in parents.items()
+  ]
+
+
+def list_win():
+  output = subprocess.check_output([
+      'powershell.exe', '-NoProfile', '-Command',
+      'Get-CimInstance Win32_Process | '
+      'Select-Object ProcessId,ParentProcessId,Name,CommandLine,'
+      # CreationDate is null for processes such as System Idle.
+      '@{n="CreationDate";'
+      'e={if ($_.CreationDate) {$_.CreationDate.ToFileTimeUtc()}}} | '
+      'ConvertTo-Json -Compress'
+  ], text=True)
+  entries = json.loads(output)
+  if isinstance(entries, dict):
+    entries = [entries]
+  return [
+      Process(
+          e['ProcessId'], e['ParentProcessId'], e['Name'] or '',
+          e['CommandLine'] or '', e.get('CreationDate')
+      ) for e in entries
+  ]
+
+
+def list_processes():
+  if sys.platform == 'win32':
+    return list_win()
+  if os.path.isdir('/proc/self'):
+    return list_linux()
+  return list_mac()
+
+
+def normalize_name(name):
+  if sys.platform != 'win32':
+    return name
+  name = name.lower()
+  return name[:-len('.exe')] if name.endswith('.exe') else name
+
+
+def select(processes, data):
+  """Returns a dict mapping each pid to kill to the rule that matched it."""
+  by_pid = {p.pid: p for p in processes}
+  children = {}
+  for p in processes:
+    parent = by_pid.get(p.ppid)
+    if (parent and parent.create_time and p.create_time and
+        p.create_time < parent.create_time):
+      # The real parent exited and its pid was reused.
+      continue
+    children.setdefault(p.ppid, []).append(p.pid)
+
+  # Never kill the reaper itself or the recipe engine running it.
+  protected = set()
+  pid = os.getpid()
+  while pid and pid not in protected:
+    protected.add(pid)
+    pid = by_pid[pid].ppid if pid in by_pid else None
+
+  names = {normalize_name(n) for n in data.get('names', [])}
+  name_patterns = [re.compile(p) for p in data.get('name_patterns', [])]
+  cmdline_patterns = [re.compile(p) for p in data.get('cmdline_patterns', [])]
+
+  selected = {}
+  for p in processes:
+    if normalize_name(p.name) in names:
+      selected[p.pid] = 'name'
+    elif any(r.search(p.name) for r in name_patterns):
+      selected[p.pid] = 'name_pattern'
+    elif any(r.search(p.cmdline) for r in cmdline_patterns):
+      selected[p.pid] = 'cmdline_pattern'
+
+  tree_roots = [pid for pid in data.get('roots', []) if pid in by_pid]
+  for pid in tree_roots:
+    selected[pid] = 'root'
+  if data.get('kill_tree'):
+    tree_roots.extend(selected)
+  while tree_roots:
+    for child in children.get(tree_roots.pop(), []):
+      if child not in selected:
+        selected[child] = 'descendant'
+        tree_roots.append(child)
+
+  return {pid: reason for pid, reason in selected.items()
+          if pid not in protected}
+
+
+def is_running(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except OSError:
+    # e.g. EPERM, the process exists.
+    return True
+  try:
+    # Zombies are dead, they only wait for their parent to reap them.
+    return read_proc('/proc/%d/stat' % pid).rsplit(')', 1)[1].split()[0] != 'Z'
+  except (OSError, IndexError):
+    return True
+
+
+def kill(pids, grace_seconds):
+  """Terminates |pids|, gracefully first where the platform allows it.
+
+  Returns:
+    The pids that were killed, and a dict mapping the pids that could not be
+    killed to the error. Pids already gone are in neither.
+  """
+  errors = {}
+  terminated = []
+  for pid in pids:
+    try:
+      # TerminateProcess on Windows, there is no SIGKILL there.
+      os.kill(pid, signal.SIGTERM)
+      terminated.append(pid)
+    except ProcessLookupError:
+      # Already gone, e.g. killed along with its parent.
+      continue
+    except OSError as e:
+      errors[pid] = str(e)
+  if sys.platform == 'win32':
+    return terminated, errors
+
+  deadline = time.time() + grace_seconds
+  running = terminated
+  while running and time.time() < deadline:
+    time.sleep(POLL_SECONDS)
+    running = [pid for pid in running if is_running(pid)]
+  for pid in running:
+    try:
+      os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+      continue
+    except OSError as e:
+      errors[pid] = str(e)
+  return [pid for pid in terminated if pid not in errors], errors
+
+
+def main():
+  data = json.load(sys.stdin)
+  processes = list_processes()
+  by_pid = {p.pid: p for p in processes}
+  selected = select(processes, data)
+  killed_pids, errors = kill(
+      sorted(selected), data.get('grace_seconds', GRACE_SECONDS)
+  )
+  killed = [
+      by_pid[pid].to_json(reason=selected[pid]) for pid in killed_pids
+  ]
+  failed = [
+      by_pid[pid].to_json(reason=selected[pid], error=error)
+      for pid, error in sorted(errors.items())
+  ]
+  json.dump({'killed': killed, 'failed': failed}, sys.stdout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -46,6 +46,11 @@ PROPERTIES = {
       # Cleanup caches
       cleanup_cache=Single(bool),
 
+      # Evict the least recently used Xcode packages once the cache is larger
+      # than cache_max_bytes or the disk has less than cache_min_free_bytes.
+      cache_max_bytes=Single(int),
+      cache_min_free_bytes=Single(int),
+
       # Location of the Xcode CIPD package
       xcode_cipd_package_source=Single(str),
     ), default={},
@@ -12,6 +12,8 @@ from contextlib import contextmanager
 from recipe_engine import recipe_api
 from datetime import datetime, timedelta
 
+from RECIPE_MODULES.flutter.cache_micro_manager.api import LruSizePolicy
+
 _RUNTIMESPATH = (
     'Contents/Developer/Platforms/iPhoneOS.platform/Library/'
     'Developer/CoreSimulator/Profiles/Runtimes'
@@ -577,7 +579,16 @@ class OSXSDKApi(recipe_api.RecipeApi):
     app_dir = self._xcode_dir(devicelab)
     self.m.step("show app_dir", ['echo', app_dir])
     self._show_xcode_cache(cache_path)
-    self.m.cache_micro_manager.run(cache_path, [app_dir])
+    eviction_policy = None
+    max_bytes = self._sdk_properties.get('cache_max_bytes')
+    min_free_bytes = self._sdk_properties.get('cache_min_free_bytes')
+    if max_bytes or min_free_bytes:
+      eviction_policy = LruSizePolicy(
+          max_bytes=max_bytes, min_free_bytes=min_free_bytes
+      )
+    self.m.cache_micro_manager.run(
+        cache_path, [app_dir], eviction_policy=eviction_policy
+    )
     self._show_xcode_cache(cache_path)
 
   def _show_xcode_cache(self, cache_path):
@@ -45,6 +45,19 @@ def GenTests(api):
       }})
   )
 
+  yield api.test(
+      'size_limited_cache', api.platform.name('mac'),
+      api.properties(
+          **{
+              '$flutter/osx_sdk': {
+                  'sdk_version': 'deadbeef',
+                  'cache_max_bytes': 100 * 1024 * 1024 * 1024,
+                  'cache_min_free_bytes': 50 * 1024 * 1024 * 1024,
+              }
+          }
+      )
+  )
+
   yield api.test(
       'explicit_version', api.platform.name('mac'),
       api.properties(
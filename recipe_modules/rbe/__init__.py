@@ -6,6 +6,7 @@ from PB.recipe_modules.flutter.rbe.properties import InputProperties
 
 DEPS = [
     "recipe_engine/buildbucket",
+    "recipe_engine/cas",
     "recipe_engine/cipd",
     "recipe_engine/context",
     "recipe_engine/file",
@@ -16,6 +16,12 @@ _DEPS_CACHE_MAX_MB = "512"
 # https://github.com/flutter/engine/blob/9cb60de37b6d582d886f46b86b90ccb9d6323fea/DEPS#L47
 RBE_VERSION = 're_client_version:0.141.1.29a9d3c-gomaip'
 
+# Number of slowest actions listed in the rbe summary.
+_SLOWEST_ACTIONS = 10
+
+# Seconds between two checks of the log watcher while reproxy runs.
+_COLLECT_LOGS_POLL_SECONDS = 10
+
 
 class RbeApi(recipe_api.RecipeApi):
   """RemoteExecutionApi contains helper functions for using remote execution
@@ -34,33 +40,40 @@ class RbeApi(recipe_api.RecipeApi):
       self._instance = "fake_rbe_instance"
     self._log_format = props.log_format or "reducedtext"
     self._started = False  # A flag tracking if rbe service is running.
-    self._rbe_triggered = False  # A flag tracking if rbe service has ever been started.
+    self._running = False  # Whether an rbe context is active.
+    self._summary = None
 
-  def set_rbe_triggered(self, triggered):
-    self._rbe_triggered = triggered
+  @property
+  def summary(self):
+    """The summary of the rbe metrics of the last collected logs, or None."""
+    return self._summary
 
   def wait_and_collect_logs(self, collect_rbe_logs_latency, working_dir):
     """Collect logs if build running time exceeds collect_rbe_logs_latency.
 
+    Waits until the rbe context exits or until the latency expires, whichever
+    happens first, and only collects the logs in the latter case.
+
     collect_rbe_logs_latency(int): the latency (in seconds) to wait before collecting rbe logs.
     working_dir(path): the working path.
     """
-    timer_seconds = 0  # tracks how long this has been waiting
-    sleep_period_seconds = 60  # in seconds
+    if collect_rbe_logs_latency is None:
+      return
+    if collect_rbe_logs_latency <= 0:
+      self._collect_logs(working_dir)
+      return
+    deadline = self.m.time.time() + collect_rbe_logs_latency
     while True:
-      # If build has been running over the `collect_rbe_logs_latency`,
-      # we will proactivelly collect rbe logs to avoid logs loss when
-      # timeout happens.
-      if timer_seconds > collect_rbe_logs_latency:
-        self._collect_logs(working_dir)
-        break
-      # If rbe service started before and is not running now, it means
-      # rbe has finished building and has been shutdown normally. For
-      # This case, we just exit.
-      if self._rbe_triggered and not self._started:
+      if not self._running:
+        return
+      remaining = deadline - self.m.time.time()
+      if remaining <= 0:
         break
-      timer_seconds += sleep_period_seconds
-      self.m.time.sleep(sleep_period_seconds)
+      self.m.time.sleep(min(_COLLECT_LOGS_POLL_SECONDS, remaining))
+    # If build has been running over the `collect_rbe_logs_latency`,
+    # we will proactivelly collect rbe logs to avoid logs loss when
+    # timeout happens.
+    self._collect_logs(working_dir)
 
   @contextmanager
   def __call__(
@@ -81,6 +94,7 @@ class RbeApi(recipe_api.RecipeApi):
             StepFailure or InfraFailure if it fails to start/stop.
         """
     # Spawns a backend process to wait and collect rbe build logs in case build timing out.
+    self._running = True
     self.m.futures.spawn(
         self.wait_and_collect_logs, collect_rbe_logs_latency, working_path
     )
@@ -104,11 +118,14 @@ class RbeApi(recipe_api.RecipeApi):
     with self.m.context(env=self._environment(working_dir), infra_steps=True):
       try:
         self._start(config_path=config_path)
-        self.set_rbe_triggered(True)
         with self.m.context(infra_steps=is_infra_step):
           yield
       finally:
-        self._stop(working_dir=working_dir, config_path=config_path)
+        try:
+          self._stop(working_dir=working_dir, config_path=config_path)
+        finally:
+          # Stops the log watcher.
+          self._running = False
 
   @property
   def _ensure_reclient_path(self):
@@ -203,10 +220,9 @@ class RbeApi(recipe_api.RecipeApi):
     #
     # We extract the WARNING log messages for each portion of the
     # local rbe client as well as reproxy stdout/stderr and metrics
-    # from the build by default. If further debugging is required,
-    # you could increase the verbosity of log messages that we
-    # retain in logdog or add the full reproxy_log.txt log file to
-    # the list of outputs.
+    # from the build by default. The action logs are summarized and
+    # uploaded to CAS. If further debugging is required, you could
+    # increase the verbosity of log messages that we retain in logdog.
     with self.m.step.nest("collect rbe logs"):
       diagnostic_outputs = [
           "bootstrap.WARNING",
@@ -242,14 +258,71 @@ class RbeApi(recipe_api.RecipeApi):
           ],
       )
 
-      # More than 1 rpl file is likely a bug but we can punt until
-      # that breaks someone.
-      for p in rpl_paths:
-        self.m.path.mock_add_paths(p)
-        # Not all builds use rbe, so it might not exist.
-        if self.m.path.exists(p):
-          # Read the log so it shows up in Milo for debugging.
-          self.m.file.read_text(f"read {self.m.path.basename(p)}", p)
+      self._summarize_logs(working_dir, rpl_paths)
+
+  def _summarize_logs(self, working_dir, rpl_paths):
+    """Publishes a summary of the rbe metrics and action logs.
+
+    The action logs can be several GB, they are uploaded to CAS compressed
+    rather than read into logdog.
+    """
+    self._summary = None
+    # More than 1 rpl file is likely a bug but we can punt until
+    # that breaks someone.
+    for p in rpl_paths:
+      self.m.path.mock_add_paths(p)
+    # Not all builds use rbe, so they might not exist.
+    rpl_paths = [p for p in rpl_paths if self.m.path.exists(p)]
+    step = self.m.step(
+        "summarize rbe logs",
+        [
+            "python3",
+            self.resource("summarize_logs.py"),
+            working_dir / "rbe_metrics.txt",
+            _SLOWEST_ACTIONS,
+        ] + rpl_paths,
+        stdout=self.m.json.output(),
+        ok_ret="any",
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            "actions": 3,
+            "completion_status": {"CACHE_HIT": 2, "LOCAL_FALLBACK": 1},
+            "cache_hit_rate": 0.6667,
+            "remote": 2,
+            "local_fallbacks": 1,
+            "slowest_actions": [{
+                "id": "fake_command_id",
+                "output": "obj/fake.o",
+                "status": "LOCAL_FALLBACK",
+                "seconds": 10.0,
+            }],
+            "compressed_logs": [f"{p}.gz" for p in rpl_paths],
+        }),
+    )
+    summary = step.stdout
+    if summary:
+      logs = [
+          working_dir / self.m.path.basename(p)
+          for p in summary.pop("compressed_logs", [])
+      ]
+      step.presentation.step_text = (
+          f"cache hit rate: {summary.get('cache_hit_rate', 0):.1%}, "
+          f"local fallbacks: {summary.get('local_fallbacks', 0)}"
+      )
+      step.presentation.properties["rbe_summary"] = summary
+      self._summary = summary
+    else:
+      # The raw action logs can be several GB, they are only uploaded
+      # compressed.
+      step.presentation.status = self.m.step.WARNING
+      logs = []
+      if rpl_paths:
+        step.presentation.step_text = "action logs not uploaded: " + ", ".join(
+            self.m.path.basename(p) for p in rpl_paths
+        )
+    if logs:
+      digest = self.m.cas.archive("upload rbe action logs", working_dir, *logs)
+      self.m.step.active_result.presentation.properties[
+          "rbe_action_logs_cas_digest"] = digest
 
   def prepare_rbe_gn(self, rbe_working_path, gn):
     """Appends rbe server address to GN config."""
@@ -13,16 +13,23 @@ Note, however, that this script is unaware of exec_root; it is the
 responsibility of the invoker to make sure all path arguments fall
 under a common exec_root.
 
+Existence checks and relative directories are memoized, so a long command
+line only stats each top-level directory once. With --batch, commands are
+read as json lines from stdin or from @response files so one interpreter
+serves many commands.
+
 NOTE: This file is copied over from fuchsia.git:build/rbe/relativize_args.py
 which also comes with unit-tests.
 """
 
 import argparse
+import functools
+import json
 import os
 import subprocess
 import sys
 from pathlib import Path
-from typing import Callable, Sequence
+from typing import Callable, Iterable, Optional, Sequence, Tuple
 
 _SCRIPT_BASENAME = os.path.basename(__file__)
 
@@ -64,6 +71,61 @@ def greatest_path_parent(p: Path) -> Path:
   return Path(*p.parts[:2])  # keep the leading '/' and the first component
 
 
+def _path_root(path: str) -> str:
+  """Same as str(greatest_path_parent(Path(path))), without a Path."""
+  if os.sep != "/":
+    return str(greatest_path_parent(Path(path)))
+  name = path.lstrip("/")
+  # Like pathlib, exactly two leading slashes are kept, more collapse to one.
+  slashes = "//" if len(path) - len(name) == 2 else "/"
+  return slashes + name.split("/", 1)[0]
+
+
+def _is_absolute(path: str) -> bool:
+  """Same as Path(path).is_absolute(), without a Path on posix.
+
+    os.path.isabs differs on Windows, where it also accepts paths without a
+    drive such as the /Fo and /I flags of MSVC.
+    """
+  if os.sep != "/":
+    return Path(path).is_absolute()
+  return path.startswith("/")
+
+
+@functools.lru_cache(maxsize=None)
+def _path_root_exists(root: str) -> bool:
+  """Memoized existence check of a top-level path component."""
+  return Path(root).exists()
+
+
+@functools.lru_cache(maxsize=None)
+def _relative_dir(directory: str, start: str) -> Tuple[str, Optional[str]]:
+  """Memoized os.path.relpath of a directory.
+
+    Returns:
+      The relative path of directory, and when directory is an ancestor of
+      start, the name of its child on the way to start.
+    """
+  child = os.path.relpath(start, start=directory).split(os.sep)[0]
+  if child in (os.curdir, os.pardir):
+    child = None
+  return os.path.relpath(directory, start=start), child
+
+
+def _relpath(path: str, start: str) -> str:
+  """Same as os.path.relpath, computed once per directory prefix."""
+  directory, base = os.path.split(path)
+  if base in ("", os.curdir, os.pardir):
+    return os.path.relpath(path, start=start)
+  relative_dir, child = _relative_dir(directory, start)
+  if base == child:
+    # path is start or one of its ancestors, joining would give "../name".
+    return os.path.relpath(path, start=start)
+  if relative_dir == os.curdir:
+    return base
+  return os.path.join(relative_dir, base)
+
+
 def relativize_path(arg: str, start: Path) -> str:
   """Convert a path or path substring to relative.
 
@@ -82,15 +144,17 @@ def relativize_path(arg: str, start: Path) -> str:
       suffix = arg[len(flag):]
       return flag + relativize_path(suffix, start=start_abs)
 
-  try_path = Path(arg)
+  # Most tokens are not absolute paths, skip them before building a Path.
+  if not _is_absolute(arg):
+    return arg
   # Windows-style flags look like absolute paths, e.g. /Foo
   # so we leave those alone by checking for existence.
   # Only check the existence of the greatest parent, because some paths
   # may refer to outputs that do not exist yet.
-  if try_path.is_absolute() and greatest_path_parent(try_path).exists():
+  if _path_root_exists(_path_root(arg)):
     # Can't use Path.relative_to() because arguments
     # aren't guaranteed to be subdir of the other.
-    return os.path.relpath(arg, start=start_abs)
+    return _relpath(arg, start=str(start_abs))
 
   return arg
 
@@ -107,6 +171,7 @@ def relativize_command(command: Sequence[str],
       command using relative paths
     """
   relativized_command = []
+  working_dir = working_dir.absolute()
   # Subprocess calls do not work for commands that start with VAR=VALUE
   # environment variables, which is remedied by prefixing with 'env'.
   if command and "=" in command[0]:
@@ -120,6 +185,23 @@ def relativize_command(command: Sequence[str],
   return relativized_command
 
 
+def read_batch(sources: Iterable[str]) -> Iterable[Sequence[str]]:
+  """Yields the commands of a batch, one json list of tokens per line.
+
+    Args:
+      sources: "-" for stdin, or "@path" response files.
+    """
+  for source in sources:
+    if source == "-":
+      lines = sys.stdin
+    else:
+      with open(source[1:]) as f:
+        lines = f.readlines()
+    for line in lines:
+      if line.strip():
+        yield json.loads(line)
+
+
 def main_arg_parser() -> argparse.ArgumentParser:
   """Construct the argument parser, called by main()."""
   parser = argparse.ArgumentParser(
@@ -151,17 +233,22 @@ def main_arg_parser() -> argparse.ArgumentParser:
       default=True,
       help="If disabled, run the original command as-is.",
   )
+  parser.add_argument(
+      "--batch",
+      action="store_true",
+      default=False,
+      help="Read commands as json lists, one per line, from stdin or from "
+      "the @response files given as command. Commands run in order until "
+      "one fails.",
+  )
 
   # Positional args are the command and arguments to run.
   parser.add_argument("command", nargs="*", help="The command to run")
   return parser
 
 
-def main(argv: Sequence[str]) -> None:
-  parser = main_arg_parser()
-  args = parser.parse_args(argv)
-
-  command = args.command
+def run(command: Sequence[str], args: argparse.Namespace) -> int:
+  """Relativizes and runs a single command."""
   relativized_command = relativize_command(
       command=command, working_dir=args.cwd
   )
@@ -182,5 +269,19 @@ def main(argv: Sequence[str]) -> None:
   return exit_code
 
 
+def main(argv: Sequence[str]) -> None:
+  parser = main_arg_parser()
+  args = parser.parse_args(argv)
+
+  if not args.batch:
+    return run(args.command, args)
+
+  for command in read_batch(args.command or ["-"]):
+    exit_code = run(command, args)
+    if exit_code != 0:
+      return exit_code
+  return 0
+
+
 if __name__ == "__main__":
   sys.exit(main(sys.argv[1:]))
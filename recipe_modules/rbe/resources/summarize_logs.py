@@ -0,0 +1,205 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Summarizes reproxy metrics and action logs, and compresses the logs.
+
+Usage: summarize_logs.py <rbe_metrics.txt> <slowest count> [<log.rpl>...]
+
+The metrics and the action logs are text protos, they are parsed with a
+minimal tokenizer so no proto definitions are needed. Each action log is
+gzipped next to itself, streaming, so multi-GB logs are never held in memory.
+The logs are compressed before being parsed and the parsing is best-effort:
+the logs may be truncated when they are collected while reproxy still runs.
+
+Prints a json summary with the cache hit rate, the count of each completion
+status, the remote and local fallback counts and the slowest actions.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import re
+import shutil
+import sys
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(?P<str>"(?:[^"\\]|\\.)*")|(?P<punct>[{}<>:\[\],])|'
+    r'(?P<word>[^\s{}<>:\[\],"]+))'
+)
+
+REMOTE_STATUSES = ('CACHE_HIT', 'REMOTE_SUCCESS', 'RACING_REMOTE')
+LOCAL_FALLBACK_STATUSES = ('LOCAL_FALLBACK', 'RACING_LOCAL')
+
+
+def tokens(lines):
+  for line in lines:
+    position = 0
+    line = line.rstrip('\n')
+    while position < len(line):
+      match = TOKEN_RE.match(line, position)
+      if not match or match.end() == position:
+        break
+      position = match.end()
+      kind = match.lastgroup
+      value = match.group(kind)
+      if kind == 'str':
+        value = value[1:-1]
+      yield kind, value
+
+
+def field_value(stream):
+  """Returns the value of the field whose name was just read.
+
+  Returns None when the stream ends before the value, e.g. in a truncated
+  log.
+  """
+  kind, value = next(stream, (None, None))
+  if kind == 'punct' and value == ':':
+    kind, value = next(stream, (None, None))
+  if kind == 'punct' and value in ('{', '<'):
+    value = parse_fields(stream)
+  return value
+
+
+def parse_fields(stream):
+  """Parses fields until the closing brace into a dict of lists of values.
+
+  Parses until the end of the stream when the closing brace is missing.
+  """
+  message = {}
+  for kind, name in stream:
+    if kind == 'punct' and name in ('}', '>'):
+      return message
+    if kind != 'word':
+      continue
+    value = field_value(stream)
+    if value is not None:
+      message.setdefault(name, []).append(value)
+  return message
+
+
+def first(message, *path):
+  """Returns the first value at |path| in a parsed message, or None."""
+  for name in path:
+    values = message.get(name) if isinstance(message, dict) else None
+    if not values:
+      return None
+    message = values[0]
+  return message
+
+
+def read_metrics(path):
+  """Returns the counts of each completion status in rbe_metrics.txt."""
+  if not os.path.exists(path):
+    return {}
+  with open(path) as f:
+    metrics = parse_fields(tokens(f))
+  counts = {}
+  for stat in metrics.get('stats', []):
+    if first(stat, 'name') != 'CompletionStatus':
+      continue
+    for value in stat.get('counts_by_value', []):
+      counts[first(value, 'name')] = int(first(value, 'count') or 0)
+  return counts
+
+
+def seconds(timestamp):
+  if not isinstance(timestamp, dict):
+    return 0.0
+  return (
+      int(first(timestamp, 'seconds') or 0) +
+      int(first(timestamp, 'nanos') or 0) / 1e9
+  )
+
+
+def records(path):
+  """Yields the LogRecords of an action log, one at a time."""
+  with open(path, errors='replace') as f:
+    stream = tokens(f)
+    record = {}
+    for kind, name in stream:
+      if kind != 'word':
+        continue
+      value = field_value(stream)
+      if value is None:
+        break
+      # Every LogRecord starts with its command.
+      if name == 'command' and 'command' in record:
+        yield record
+        record = {}
+      record.setdefault(name, []).append(value)
+    if record:
+      yield record
+
+
+def action_duration(record):
+  for event in (first(record, 'local_metadata') or {}).get('event_times', []):
+    if first(event, 'key') == 'ProxyExecution':
+      times = first(event, 'value') or {}
+      start, end = first(times, 'from'), first(times, 'to')
+      if not start or not end:
+        # The action is still running, or the log is truncated.
+        return 0.0
+      return seconds(end) - seconds(start)
+  return 0.0
+
+
+def summarize_actions(paths, slowest_count):
+  counts = {}
+  slowest = []
+  for path in paths:
+    for record in records(path):
+      status = first(record, 'result', 'status') or 'UNKNOWN'
+      counts[status] = counts.get(status, 0) + 1
+      outputs = first(record, 'command', 'output') or {}
+      action = {
+          'id': first(record, 'command', 'identifiers', 'command_id'),
+          'output': first(outputs, 'output_files'),
+          'status': status,
+          'seconds': round(action_duration(record), 3),
+      }
+      item = (action['seconds'], len(slowest), action)
+      if len(slowest) < slowest_count:
+        heapq.heappush(slowest, item)
+      else:
+        heapq.heappushpop(slowest, item)
+  return counts, [a for _, _, a in sorted(slowest, reverse=True)]
+
+
+def compress(path):
+  with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+  return path + '.gz'
+
+
+def main():
+  metrics_path = sys.argv[1]
+  slowest_count = int(sys.argv[2])
+  log_paths = [p for p in sys.argv[3:] if os.path.exists(p)]
+  # Compress first so the logs are uploaded even if they fail to parse.
+  compressed_logs = [compress(p) for p in log_paths]
+
+  counts = read_metrics(metrics_path)
+  action_counts, slowest = summarize_actions(log_paths, slowest_count)
+  # The metrics are authoritative, the action logs are used when reproxy did
+  # not write them, e.g. when it was killed.
+  counts = counts or action_counts
+  total = sum(counts.values())
+  summary = {
+      'actions': total,
+      'completion_status': counts,
+      'cache_hit_rate': (
+          round(counts.get('CACHE_HIT', 0) / float(total), 4) if total else 0
+      ),
+      'remote': sum(counts.get(s, 0) for s in REMOTE_STATUSES),
+      'local_fallbacks': sum(counts.get(s, 0) for s in LOCAL_FALLBACK_STATUSES),
+      'slowest_actions': slowest,
+      'compressed_logs': compressed_logs,
+  }
+  json.dump(summary, sys.stdout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
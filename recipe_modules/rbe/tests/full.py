@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 from PB.recipe_modules.flutter.rbe.properties import InputProperties
+from recipe_engine.post_process import DoesNotRun
 
 DEPS = [
     "flutter/rbe",
@@ -24,14 +25,13 @@ def RunSteps(api):
                working_path=api.path.cleanup_dir / "rbe"):
     # build something using rbe.
     api.step("build", ["echo", "Misison Accomplished!"])
+    # The latency expires while the build is still running.
+    api.rbe.wait_and_collect_logs(
+        working_dir=api.path.cleanup_dir / "rbe", collect_rbe_logs_latency=61
+    )
   api.rbe.wait_and_collect_logs(
       working_dir=api.path.cleanup_dir / "rbe", collect_rbe_logs_latency=-1
   )
-  api.rbe.set_rbe_triggered(False)
-  api.rbe.wait_and_collect_logs(
-      working_dir=api.path.cleanup_dir / "rbe", collect_rbe_logs_latency=61
-  )
-  api.rbe.set_rbe_triggered(True)
   api.rbe.wait_and_collect_logs(
       working_dir=api.path.cleanup_dir / "rbe", collect_rbe_logs_latency=61
   )
@@ -65,3 +65,14 @@ def GenTests(api):
   )
 
   yield (api.test("read_log_proto_failure_does_not_block") + rbe_properties())
+
+  yield (
+      api.test("summarize_logs_failure_does_not_block") + rbe_properties() +
+      api.step_data(
+          "teardown remote execution.collect rbe logs.summarize rbe logs",
+          retcode=1
+      ) + api.post_process(
+          DoesNotRun,
+          "teardown remote execution.collect rbe logs.upload rbe action logs"
+      )
+  )
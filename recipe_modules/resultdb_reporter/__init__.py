@@ -4,6 +4,7 @@
 
 DEPS = [
     "fuchsia/buildbucket_util",
+    "recipe_engine/json",
     "recipe_engine/raw_io",
     "recipe_engine/resultdb",
     "recipe_engine/runtime",
@@ -17,6 +17,19 @@ class PreparedResult:
     self._status = status
     self._resultdb_resource = resultdb_resource
 
+  @property
+  def test_id(self):
+    return self._test_id
+
+  def test_result(self):
+    """Returns the json TestResult message for this result."""
+    return {
+        "testId": self._test_id,
+        "expected": self._status == TestStatus.PASS,
+        "summaryHtml": self._summary,
+        "status": self._status,
+    }
+
   def upload(self):
     """
         Uploads the preparedResult to resultdb.
@@ -35,19 +48,10 @@ class PreparedResult:
       )
       return
 
-    expected = self._status == TestStatus.PASS
-
-    test_result = {
-        "testId": self._test_id,
-        "expected": expected,
-        "summaryHtml": self._summary,
-        "status": self._status,
-    }
-
     cmd = [
         "vpython3",
         self._resultdb_resource,
-        json.dumps(test_result),
+        json.dumps(self.test_result()),
     ]
 
     self._api.step(
@@ -57,6 +61,99 @@ class PreparedResult:
     )
 
 
+class ResultBatch:
+  """Buffers PreparedResults and uploads them with a single process.
+
+  Results are uploaded when flush() is called, or when max_size results are
+  buffered.
+  """
+
+  def __init__(self, api, resultdb_resource, max_size):
+    self._api = api
+    self._resultdb_resource = resultdb_resource
+    self._max_size = max_size
+    self._pending = []
+    self._flush_count = 0
+
+  def __len__(self):
+    return len(self._pending)
+
+  def add(self, prepared_result):
+    """Buffers |prepared_result|, flushing the batch once it is full.
+
+        Returns:
+          The statuses returned by flush() if the batch was flushed, else
+          None.
+        """
+    self._pending.append(prepared_result)
+    if len(self._pending) >= self._max_size:
+      return self.flush()
+    return None
+
+  def flush(self):
+    """
+        Uploads the buffered results to resultdb.
+
+        This operation creates a step at the current nesting level.
+
+        Returns:
+          A dict mapping each test id to the error of its upload, None if it
+          was uploaded.
+        """
+    if not self._pending:
+      return {}
+    pending, self._pending = self._pending, []
+    self._flush_count += 1
+    step_name = "upload to resultdb"
+    if self._flush_count > 1:
+      step_name += f" ({int(self._flush_count)})"
+
+    if not self._api.resultdb.enabled:
+      self._api.step.empty(
+          step_name,
+          status=self._api.step.INFRA_FAILURE,
+          step_text="ResultDB integration was not enabled for this build",
+          raise_on_failure=False,
+      )
+      error = "ResultDB integration was not enabled for this build"
+      return {result.test_id: error for result in pending}
+
+    cmd = [
+        "vpython3",
+        self._resultdb_resource,
+        "--batch",
+    ]
+    step = self._api.step(
+        step_name,
+        self._api.resultdb.wrap(cmd),
+        stdin=self._api.json.input([r.test_result() for r in pending]),
+        stdout=self._api.json.output(),
+        infra_step=True,
+        raise_on_failure=False,
+        step_test_data=lambda: self._api.json.test_api.output_stream([{
+            "testId": r.test_id,
+            "error": None
+        } for r in pending]),
+    )
+    statuses = {
+        status["testId"]: status["error"] for status in step.stdout or []
+    }
+    # Results missing from the output were not uploaded at all.
+    error = "no status reported"
+    statuses = {
+        r.test_id: statuses.get(r.test_id, error) for r in pending
+    }
+    failed = [test_id for test_id, error in statuses.items() if error]
+    step.presentation.step_text = (
+        f"uploaded {int(len(pending) - len(failed))}/{int(len(pending))} "
+        "test results"
+    )
+    if failed:
+      step.presentation.status = self._api.step.INFRA_FAILURE
+      step.presentation.logs["failed test ids"] = failed
+    return statuses
+
+
 class ResultdbReporterApi(recipe_api.RecipeApi):
   """ResultdbReporterApi provides functionality to upload test results
     to resultsdb.
@@ -70,7 +167,28 @@ class ResultdbReporterApi(recipe_api.RecipeApi):
             summary (string): The summary of the test result.
             status (TestStatus): The pass/failed/skipped status of the test result.
         """
-    prepared_result = PreparedResult(
+    prepared_result = self.prepare_result(test_id, summary, status)
+    prepared_result.upload()
+
+  def prepare_result(self, test_id, summary, status):
+    """
+        Creates a test result without uploading it, see batch().
+        Args:
+            test_id (str): test id to be used by resultdb.
+            summary (string): The summary of the test result.
+            status (TestStatus): The pass/failed/skipped status of the test result.
+        """
+    return PreparedResult(
         self.m, test_id, summary, status, self.resource("resultdb.py")
     )
-    prepared_result.upload()
+
+  def batch(self, max_size=500):
+    """
+        Creates a ResultBatch uploading test results in a single process.
+
+        Prefer this to report_result() when reporting many results, each
+        report_result() call starts a new process and connection.
+        Args:
+            max_size (int): number of buffered results triggering a flush.
+        """
+    return ResultBatch(self.m, self.resource("resultdb.py"), max_size)
@@ -32,6 +32,9 @@ import os
 import sys
 import requests
 
+# Maximum number of test results sent in a single ReportTestResults call.
+CHUNK_SIZE = 500
+
 
 def upload_results(test_result, url, auth_token):
     res = requests.post(
@@ -46,6 +49,40 @@ def upload_results(test_result, url, auth_token):
     res.raise_for_status()
 
 
+def upload_batch(test_results, url, auth_token, chunk_size=CHUNK_SIZE):
+    """Uploads |test_results| over a single connection.
+
+    Args:
+        test_results (list(dict)): the json test results to upload.
+
+    Returns:
+        A list with the status of each test result, in the same order, as a
+        dict with the testId and the error, None when it was uploaded.
+    """
+    statuses = []
+    with requests.Session() as session:
+        session.headers.update({
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"ResultSink {auth_token}",
+        })
+        for start in range(0, len(test_results), chunk_size):
+            chunk = test_results[start:start + chunk_size]
+            error = None
+            try:
+                res = session.post(
+                    url, data=json.dumps({"test_results": chunk})
+                )
+                res.raise_for_status()
+            except requests.RequestException as e:
+                # Keep going, the other chunks may still be accepted.
+                error = str(e)
+            statuses.extend(
+                {"testId": r["testId"], "error": error} for r in chunk
+            )
+    return statuses
+
+
 def add_artifacts_to_test_result(test_result, artifacts):
     """
     Args:
@@ -71,9 +108,17 @@ def main():
     parser.add_argument(
         "test_result",
         action="store",
+        nargs="?",
         help="json string to upload to ResultDB",
     )
 
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="read a json list of test results from stdin, upload them in \
+        chunks and print the status of each one as json to stdout",
+    )
+
     parser.add_argument(
         "--artifact",
         dest="artifacts",
@@ -96,16 +141,22 @@ def main():
         print("result_sink not defined in LUCI_CONTEXT")
         return 1
 
-    if not args.test_result:
-        print("Empty test results: skipping")
-        return 0
-
     url = str.format(
         "http://{}/prpc/luci.resultsink.v1.Sink/{}",
         sink["address"],
         "ReportTestResults",
     )
 
+    if args.batch:
+        test_results = json.load(sys.stdin)
+        statuses = upload_batch(test_results, url, sink["auth_token"])
+        json.dump(statuses, sys.stdout)
+        return 1 if any(s["error"] for s in statuses) else 0
+
+    if not args.test_result:
+        print("Empty test results: skipping")
+        return 0
+
     test_result = json.loads(args.test_result)
     add_artifacts_to_test_result(test_result, args.artifacts)
 
@@ -0,0 +1,69 @@
+# Copyright 2024 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+from PB.go.chromium.org.luci.lucictx import sections as sections_pb2
+from PB.go.chromium.org.luci.resultdb.proto.v1.test_result import TestStatus
+
+DEPS = [
+    "flutter/resultdb_reporter",
+    "recipe_engine/assertions",
+    "recipe_engine/context",
+    "recipe_engine/json",
+    "recipe_engine/properties",
+    "recipe_engine/step",
+]
+
+
+def RunSteps(api):
+  batch = api.resultdb_reporter.batch(max_size=2)
+  statuses = {}
+  for name, status in [('a', TestStatus.PASS), ('b', TestStatus.FAIL),
+                       ('c', TestStatus.SKIP)]:
+    statuses.update(
+        batch.add(
+            api.resultdb_reporter.prepare_result(
+                test_id=f'//test_suite/{name}', summary='summary', status=status
+            )
+        ) or {}
+    )
+  api.assertions.assertEqual(len(batch), 1)
+  statuses.update(batch.flush())
+  api.assertions.assertEqual(batch.flush(), {})
+  failed = sorted(test_id for test_id, error in statuses.items() if error)
+  api.assertions.assertEqual(failed, api.properties.get('failed', []))
+
+
+def GenTests(api):
+  luci_context = api.context.luci_context(
+      realm=sections_pb2.Realm(name="proj:realm"),
+      resultdb=sections_pb2.ResultDB(
+          current_invocation=sections_pb2.ResultDBInvocation(
+              name="invocations/inv",
+              update_token="token",
+          ),
+          hostname="rdbhost",
+      ),
+  )
+
+  yield api.test("basic") + luci_context
+
+  yield (
+      api.test("partial_failure") + luci_context +
+      api.properties(failed=['//test_suite/b', '//test_suite/c']) +
+      api.step_data(
+          "upload to resultdb",
+          stdout=api.json.output([
+              {"testId": "//test_suite/a", "error": None},
+              {"testId": "//test_suite/b", "error": "503 Server Error"},
+          ]),
+          retcode=1,
+      ) + api.step_data(
+          "upload to resultdb (2)",
+          stdout=api.json.output([]),
+      )
+  )
+
+  yield api.test("resultdb_not_enabled") + api.properties(
+      failed=['//test_suite/a', '//test_suite/b', '//test_suite/c']
+  )
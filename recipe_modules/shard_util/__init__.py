@@ -15,5 +15,7 @@ DEPS = [
     'recipe_engine/path',
     'recipe_engine/platform',
     'recipe_engine/properties',
+    'recipe_engine/step',
     'recipe_engine/swarming',
+    'recipe_engine/time',
 ]
@@ -48,6 +48,27 @@ PARENT_COMMIT = 'parent_commit'
 # used to namespace the engine artifacts gcs upload location.
 BUILD_IDENTIFIER = 'build_identifier'
 
+# Seconds to wait between collection rounds when streaming test launches.
+STREAMING_COLLECT_INTERVAL = 20
+
+# Maximum time in seconds to keep polling builds when streaming test launches.
+STREAMING_COLLECT_TIMEOUT = 24 * 60 * 60
+
+# Bounds in seconds of the adaptive collection interval. Builds are polled
+# frequently at first, the interval then grows by the backoff factor on every
+# round without completed builds and resets when a build completes.
+ADAPTIVE_COLLECT_MIN_INTERVAL = 10
+ADAPTIVE_COLLECT_MAX_INTERVAL = 120
+ADAPTIVE_COLLECT_BACKOFF_FACTOR = 1.5
+
+# Directory of the builder named cache holding the content addressed blobs of
+# downloaded builds. The builder cache is mounted on every LUCI builder.
+DIGEST_STORE_DIR = 'full_build_digest_store'
+
+# Size in bytes over which the least recently used blobs of the digest store
+# are evicted.
+DIGEST_STORE_MAX_SIZE = 50 * 1024 * 1024 * 1024
+
 
 @attr.s
 class SubbuildResult(object):
@@ -425,15 +446,49 @@ class ShardUtilApi(recipe_api.RecipeApi):
       )
     return results
 
-  def collect(self, tasks):
+  def collect(
+      self,
+      tasks,
+      adaptive=False,
+      on_completed=None,
+      fail_fast=False,
+      required_builds=None,
+  ):
     """Collects builds from build bucket services using the provided tasks.
 
+    By default the builds are collected once all of them are complete. When
+    adaptive, on_completed or fail_fast is set the builds are polled in
+    collection rounds instead, see _collect_in_rounds.
+
     Args:
       tasks (dict(int, SubbuildResult)): A dictionary with the subbuild
         results and the build id as key.
+      adaptive (bool): Whether to poll frequently at first and back off while
+        the builds keep running.
+      on_completed (callable): Called with the SubbuildResult of each build
+        as soon as it completes.
+      fail_fast (bool): Whether to cancel the builds still running once a
+        required build fails.
+      required_builds (seq(str)): Names of the builds whose failure cancels
+        the others when fail_fast is set, defaults to all the builds.
 
     Returns: A list of SubBuildResult, one per task.
     """
+    if adaptive or on_completed or fail_fast:
+      if adaptive:
+        interval = ADAPTIVE_COLLECT_MIN_INTERVAL
+        max_interval = ADAPTIVE_COLLECT_MAX_INTERVAL
+      else:
+        interval = max_interval = STREAMING_COLLECT_INTERVAL
+      return self._collect_in_rounds(
+          tasks,
+          interval=interval,
+          max_interval=max_interval,
+          on_completed=on_completed,
+          fail_fast=fail_fast,
+          required_builds=required_builds,
+      )
+
     build_ids = [build.build_id for build in tasks.values()]
     build_id_to_name = {
         int(build.build_id): build.build_name for build in tasks.values()
@@ -455,42 +510,7 @@ class ShardUtilApi(recipe_api.RecipeApi):
     failed_builds = [
         b for b in builds.values() if b.status != common_pb2.SUCCESS
     ]
-    if failed_builds:
-      task_ids = [
-          b.infra.swarming.task_id
-          if b.infra.swarming.task_id else b.infra.backend.task.id.id
-          for b in failed_builds
-      ]
-      # Make sure task IDs are non-empty.
-      assert all(task_ids), task_ids
-
-      # Wait for the underlying Swarming tasks to complete. The Swarming
-      # task for a Buildbucket build can take significantly longer to
-      # complete than the build itself due to post-processing outside the
-      # scope of the build's recipe (e.g. cache pruning). If the parent
-      # build and its Swarming task both complete before the subbuild's
-      # Swarming task finishes post-processing, then the subbuild's
-      # Swarming task will be killed by Swarming due to the parent being
-      # complete.
-      #
-      # That is actually working as intended. However, it's confusing for
-      # a subbuild to be marked as killed when the recipe actually exited
-      # normally; "killed" usually only happens for CQ builds, when a
-      # build is canceled by CQ because a new patchset of the triggering
-      # CL is uploaded. So it's convenient to have dashboards and queries
-      # ignore "killed" tasks. We use this workaround to ensure that
-      # failed subbuilds with long post-processing steps have time to
-      # complete and exit cleanly with a plain old "COMPLETED (FAILURE)"
-      # status.
-      #
-      # We only do this if the subbuild failed as a latency optimization.
-      # If all subbuilds passed, the parent will go on to do some more
-      # steps using the results of the subbuilds, leaving time for the
-      # subbuilds' tasks to complete asynchronously, so we don't want to
-      # block here while the tasks complete.
-      self.m.swarming.collect(
-          "wait for %s to complete" % pluralize("task", task_ids), task_ids
-      )
+    self._wait_for_failed_tasks(failed_builds)
     for build_id, build in sorted(builds.items()):
       builds[build_id] = SubbuildResult(
           builder=build.builder.builder,
@@ -501,58 +521,434 @@ class ShardUtilApi(recipe_api.RecipeApi):
       )
     return builds
 
-  def download_full_builds(self, build_results, out_build_paths, flag_parallel_download_builds=False):
+  def collect_builds_and_schedule_tests(
+      self,
+      tasks,
+      tests,
+      presentation,
+      interval=STREAMING_COLLECT_INTERVAL,
+      timeout=STREAMING_COLLECT_TIMEOUT,
+  ):
+    """Collects builds incrementally and launches tests as soon as possible.
+
+    Instead of waiting for every build to finish before launching any test,
+    builds are polled in collection rounds. A test is scheduled in the first
+    round where all of its dependencies have completed successfully and
+    produced a `cas_output_hash`. Tests depending on a failed build are never
+    launched, the build failure is surfaced by the caller when displaying the
+    build results. A dependency that is not one of the scheduled builds is a
+    configuration error and fails before any build is collected.
+
+    Args:
+      tasks (dict(int, SubbuildResult)): The scheduled builds keyed by id.
+      tests (list(dict)): The test configurations to be passed to BuildBucket
+        or led.
+      presentation (StepPresentation): The step object used to add links
+        and/or logs.
+      interval (int): Seconds to wait between collection rounds.
+      timeout (int): Seconds to keep polling before giving up on the builds.
+
+    Returns:
+      A tuple with the build results and the scheduled test tasks, both are
+      dictionaries with a long build_id as key and SubbuildResult as value.
+    """
+    build_names = {build.build_name for build in tasks.values()}
+    for test in tests:
+      missing = sorted(
+          set(test.get('dependencies', [])).difference(build_names)
+      )
+      if missing:
+        raise self.m.step.StepFailure(
+            'Test %s depends on %s, which %s not scheduled' % (
+                test.get('name'), ', '.join(missing),
+                'is' if len(missing) == 1 else 'are'
+            )
+        )
+
+    test_tasks = {}
+    waiting_tests = list(tests)
+
+    def _launch_ready_tests(build_results):
+      finished = {b.build_name: b for b in build_results.values()}
+      ready = []
+      for test in list(waiting_tests):
+        deps = test.get('dependencies', [])
+        if not all(dep in finished for dep in deps):
+          continue
+        waiting_tests.remove(test)
+        if all(finished[dep].build_proto.status == common_pb2.SUCCESS and
+               'cas_output_hash' in finished[dep].build_proto.output.properties
+               for dep in deps):
+          ready.append(test)
+      if ready:
+        test_tasks.update(self.schedule_tests(ready, build_results, presentation))
+
+    # Tests without dependencies do not need to wait for any build.
+    _launch_ready_tests({})
+    build_results = self._collect_in_rounds(
+        tasks,
+        interval=interval,
+        max_interval=interval,
+        timeout=timeout,
+        on_round=_launch_ready_tests,
+    )
+    return build_results, test_tasks
+
+  def _collect_in_rounds(
+      self,
+      tasks,
+      interval,
+      max_interval,
+      timeout=STREAMING_COLLECT_TIMEOUT,
+      on_completed=None,
+      on_round=None,
+      fail_fast=False,
+      required_builds=None,
+  ):
+    """Polls builds in collection rounds until all of them are complete.
+
+    Args:
+      tasks (dict(int, SubbuildResult)): The scheduled builds keyed by id.
+      interval (int): Seconds to wait after the first round and after rounds
+        where a build completed.
+      max_interval (int): Upper bound of the wait between rounds, the wait
+        grows by ADAPTIVE_COLLECT_BACKOFF_FACTOR after each round without
+        completed builds.
+      timeout (int): Seconds to keep polling before giving up on the builds.
+      on_completed (callable): Called with the SubbuildResult of each build
+        as soon as it completes.
+      on_round (callable): Called at the end of each round with the results
+        of the builds completed so far, see Returns.
+      fail_fast (bool): Whether to cancel the builds still running once a
+        required build fails.
+      required_builds (seq(str)): Names of the builds whose failure cancels
+        the others when fail_fast is set, defaults to all the builds.
+
+    Returns:
+      A dictionary with a long build_id as key and SubbuildResult as value.
+    """
+    pending = {int(build.build_id): build for build in tasks.values()}
+    build_results = {}
+    failed_builds = []
+    canceled = False
+    deadline = self.m.time.time() + timeout
+    wait = interval
+    collect_round = 0
+    while pending:
+      collect_round += 1
+      builds = self.m.buildbucket.get_multi(
+          sorted(pending),
+          step_name='collect round %d' % collect_round,
+          fields=self.m.buildbucket.DEFAULT_FIELDS,
+      )
+      completed = {
+          build_id: build
+          for build_id, build in builds.items()
+          if build.status & common_pb2.ENDED_MASK
+      }
+      failed_builds.extend(
+          b for b in completed.values() if b.status != common_pb2.SUCCESS
+      )
+      required_failures = []
+      for build_id, build in sorted(completed.items()):
+        result = SubbuildResult(
+            builder=build.builder.builder,
+            build_id=build_id,
+            build_proto=build,
+            build_name=pending.pop(int(build_id)).build_name,
+            url=self.m.buildbucket.build_url(build_id=build_id)
+        )
+        build_results[build_id] = result
+        if on_completed:
+          on_completed(result)
+        if build.status != common_pb2.SUCCESS and (
+            required_builds is None or
+            result.build_name in required_builds):
+          required_failures.append(result.build_name)
+      if fail_fast and required_failures and pending and not canceled:
+        self.cancel_builds(
+            pending, 'Canceled after %s failed' % required_failures[0]
+        )
+        canceled = True
+      if on_round:
+        on_round(build_results)
+      if not pending:
+        break
+      # Rounds and the steps launched between them take time too.
+      if self.m.time.time() >= deadline:
+        raise self.m.step.InfraFailure(
+            'Timed out collecting %s' % pluralize('build', pending)
+        )
+      if completed:
+        wait = interval
+      self.m.time.sleep(wait)
+      wait = min(max_interval, int(wait * ADAPTIVE_COLLECT_BACKOFF_FACTOR))
+    # Waited for once all builds completed so that the rounds, and the tests
+    # launched between them, are not held up by failed builds.
+    self._wait_for_failed_tasks(failed_builds)
+    return build_results
+
+  def cancel_builds(self, pending, reason):
+    """Cancels the builds that are still running.
+
+    Buildbucket ignores the cancellation of builds that already ended.
+
+    Args:
+      pending (dict(int, SubbuildResult)): The running builds keyed by id.
+      reason (str): The summary markdown of the canceled builds.
+    """
+    with self.m.step.nest(
+        'cancel %s' % pluralize('remaining build', pending)) as presentation:
+      presentation.step_summary_text = reason
+      for build_id in sorted(pending):
+        self.m.buildbucket.cancel_build(build_id, reason=reason)
+
+  def _wait_for_failed_tasks(self, failed_builds):
+    """Waits for the swarming tasks of failed builds to complete.
+
+    Builds canceled before they started, e.g. by fail_fast, have no task and
+    are skipped.
+
+    Args:
+      failed_builds (list(build_pb2.Build)): The builds that did not succeed.
+    """
+    task_ids = [
+        b.infra.swarming.task_id
+        if b.infra.swarming.task_id else b.infra.backend.task.id.id
+        for b in failed_builds
+    ]
+    task_ids = [task_id for task_id in task_ids if task_id]
+    if not task_ids:
+      return
+
+    # Wait for the underlying Swarming tasks to complete. The Swarming
+    # task for a Buildbucket build can take significantly longer to
+    # complete than the build itself due to post-processing outside the
+    # scope of the build's recipe (e.g. cache pruning). If the parent
+    # build and its Swarming task both complete before the subbuild's
+    # Swarming task finishes post-processing, then the subbuild's
+    # Swarming task will be killed by Swarming due to the parent being
+    # complete.
+    #
+    # That is actually working as intended. However, it's confusing for
+    # a subbuild to be marked as killed when the recipe actually exited
+    # normally; "killed" usually only happens for CQ builds, when a
+    # build is canceled by CQ because a new patchset of the triggering
+    # CL is uploaded. So it's convenient to have dashboards and queries
+    # ignore "killed" tasks. We use this workaround to ensure that
+    # failed subbuilds with long post-processing steps have time to
+    # complete and exit cleanly with a plain old "COMPLETED (FAILURE)"
+    # status.
+    #
+    # We only do this if the subbuild failed as a latency optimization.
+    # If all subbuilds passed, the parent will go on to do some more
+    # steps using the results of the subbuilds, leaving time for the
+    # subbuilds' tasks to complete asynchronously, so we don't want to
+    # block here while the tasks complete.
+    self.m.swarming.collect(
+        "wait for %s to complete" % pluralize("task", task_ids), task_ids
+    )
+
+  def download_full_builds(
+      self,
+      build_results,
+      out_build_paths,
+      flag_parallel_download_builds=False,
+      use_digest_store=False,
+      paths=None,
+      max_concurrency=None,
+  ):
     """Downloads intermediate builds from CAS.
 
     Args:
       build_results (dict(int, SubbuildResult)): A dictionary with the subbuild
         result and the build id as key.
       flag_parallel_download_builds: attempt to download all builds at once.
+      use_digest_store (bool): hydrate the builds from a local digest store,
+        downloading only trees the bot has not seen before.
+      paths (list(str)): optional paths relative to |out_build_paths| the
+        caller needs, e.g. `ios_debug/Flutter.framework`. Builds not
+        matching any of the paths are not downloaded and, when using the
+        digest store, only the matching subtrees are hydrated.
+      max_concurrency (int): maximum number of builds downloaded at once when
+        downloading in parallel. All builds are downloaded at once if unset.
 
     Mac and fuchsia use artifacts from different sub-builds to generate the final artifacts.
     Calls to this API will happen most likely after all the subbuilds have been completed and
     only if global generators will be executed.
     """
+    if paths is not None:
+      paths = [p.strip('/') for p in paths]
 
-    futures = []
+    downloads = []
     for build_id in build_results:
       build_props = build_results[build_id].build_proto.output.properties
       if 'cas_output_hash' in build_props:
         cas_out_dict = build_props['cas_output_hash']
         build_name = build_results[build_id].build_name
+        # Build names may contain '/', e.g. ci/host_debug, so the paths are
+        # matched against the whole name rather than their first component.
+        if paths is not None and not any(
+            p == build_name or p.startswith(build_name + '/') or
+            build_name.startswith(p + '/') for p in paths):
+          continue
         if 'full_build' in cas_out_dict:
-          if flag_parallel_download_builds:
-            futures.append(
-              self.m.futures.spawn(
-                self.m.cas.download,
-                'Download for build %s and cas key %s' % (build_id, build_name),
-                cas_out_dict['full_build'], out_build_paths
-              )
-            )
-          else:
-            self.m.cas.download(
-                'Download for build %s and cas key %s' % (build_id, build_name),
-                cas_out_dict['full_build'], out_build_paths
-            )
+          downloads.append((
+              build_id, build_name, cas_out_dict['full_build'],
+              cas_out_dict.get('full_build_manifest'), out_build_paths,
+              use_digest_store, paths
+          ))
+
+    if not flag_parallel_download_builds:
+      for download_args in downloads:
+        self._download_full_build(*download_args)
+    else:
+      self._download_full_builds_in_parallel(downloads, max_concurrency)
+
+    if use_digest_store and downloads:
+      # Concurrent hydrations share the store, evicting once all of them are
+      # done keeps blobs from being removed while they are copied.
+      self.m.step(
+          'Evict unused digest store blobs',
+          ['python3', self.resource('cas_manifest.py')],
+          stdin=self.m.json.input({
+              'operation': 'evict',
+              'store': str(self._digest_store()),
+              'max_size': DIGEST_STORE_MAX_SIZE,
+              'keys': sorted(args[2] for args in downloads),
+          }),
+      )
+
+  def _download_full_builds_in_parallel(self, downloads, max_concurrency):
+    """Runs _download_full_build for each of |downloads| concurrently.
+
+    Args:
+      downloads (list(tuple)): The arguments of each _download_full_build.
+      max_concurrency (int): maximum number of builds downloaded at once, all
+        of them if unset.
+    """
+    futures = []
+    for download_args in downloads:
+      if max_concurrency and len(futures) >= max_concurrency:
+        # Wait for a download to finish before starting a new one.
+        for future in self.m.futures.wait(futures, count=1):
+          futures.remove(future)
+          future.result()
+      futures.append(
+          self.m.futures.spawn(self._download_full_build, *download_args)
+      )
     if futures:
       self.m.futures.wait(futures)
       # We awaited above; this loop will raise the first exception (if any)
       for future in futures:
         future.result()
 
-  def archive_full_build(self, build_dir, target):
+  def _digest_store(self):
+    return self.m.path.cache_dir / 'builder' / DIGEST_STORE_DIR
+
+  def _download_full_build(
+      self, build_id, build_name, digest, manifest_digest, out_build_paths,
+      use_digest_store, paths
+  ):
+    """Downloads a single full build from CAS.
+
+    Args:
+      build_id (int): The id of the build that archived the full build.
+      build_name (str): The name of the build that archived the full build.
+      digest (str): The CAS digest of the full build.
+      manifest_digest (str): The CAS digest of the manifest of the full build,
+        None if the build was archived without one.
+      out_build_paths (Path): The directory to download the build to.
+      use_digest_store (bool): hydrate the build from a local digest store.
+      paths (list(str)): optional subtrees to hydrate from the digest store.
+    """
+    step_name = 'Download for build %s and cas key %s' % (build_id, build_name)
+    if not use_digest_store:
+      self.m.cas.download(step_name, digest, out_build_paths)
+      return
+    store = self._digest_store()
+    script_input = {
+        'operation': 'hydrate',
+        'store': str(store),
+        'key': digest,
+        'output': str(out_build_paths),
+    }
+    if paths is not None:
+      script_input['paths'] = sorted(paths)
+    tree_manifest = store / 'trees' / ('%s.json' % digest.replace('/', '_'))
+    if not self.m.path.exists(tree_manifest):
+      tree = self.m.path.mkdtemp('full-build-%s' % build_name)
+      self.m.cas.download(step_name, digest, tree)
+      script_input['tree'] = str(tree)
+      if manifest_digest:
+        manifest_dir = self.m.path.mkdtemp('full-build-manifest-%s' % build_name)
+        self.m.cas.download(
+            'Download manifest for build %s' % build_name, manifest_digest,
+            manifest_dir
+        )
+        script_input['manifest'] = str(manifest_dir)
+    self.m.step(
+        'Hydrate build %s from digest store' % build_name,
+        ['python3', self.resource('cas_manifest.py')],
+        stdin=self.m.json.input(script_input),
+    )
+
+  def archive_full_build_manifest(self, build_dir, target):
+    """Archives the manifest of a full build in cas.
+
+    The manifest lists the digest, size and executable bit of every file of
+    the build so the digest store does not hash them again on download. It
+    is archived separately so plain downloads of the build do not include it.
+
+    Args:
+      build_dir: The path to the build output folder.
+      target(str): The name of the build we are archiving.
+
+    Returns:
+      A string with the hash of the cas archive of the manifest.
+    """
+    manifest_dir = self.m.path.mkdtemp('out-cas-manifest')
+    self.m.step(
+        'Hash %s' % target,
+        ['python3', self.resource('cas_manifest.py')],
+        stdin=self.m.json.input({
+            'operation': 'manifest',
+            'build_dir': str(build_dir),
+            'output': str(manifest_dir),
+            'target': target,
+        }),
+    )
+    return self.m.cas.archive(
+        'Archive full build manifest for %s' % target, manifest_dir
+    )
+
+  def archive_full_build(self, build_dir, target, hardlink=False):
     """Archives a full build in cas.
 
     Args:
       build_dir: The path to the build output folder.
       target(str): The name of the build we are archiving.
+      hardlink(bool): hardlink the build output instead of copying it. The
+        CAS client only uploads the blobs missing from the server.
 
     Returns:
       A string with the hash of the cas archive.
     """
     cas_dir = self.m.path.mkdtemp('out-cas-directory')
-    cas_engine = cas_dir / target
-    self.m.file.copytree('Copy %s' % target, build_dir, cas_engine)
+    if hardlink:
+      self.m.step(
+          'Stage %s' % target,
+          ['python3', self.resource('cas_manifest.py')],
+          stdin=self.m.json.input({
+              'operation': 'stage',
+              'build_dir': str(build_dir),
+              'output': str(cas_dir),
+              'target': target,
+          }),
+      )
+    else:
+      cas_engine = cas_dir / target
+      self.m.file.copytree('Copy %s' % target, build_dir, cas_engine)
 
     # pylint: disable=unused-argument
     def _upload(timeout=None):
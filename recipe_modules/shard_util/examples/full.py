@@ -45,15 +45,34 @@ def RunSteps(api):
         branch=api.properties.get('git_ref', 'main'),
     )
   with api.step.nest("collect builds") as presentation:
-    builds = api.shard_util.collect(reqs)
+    builds = api.shard_util.collect(
+        reqs,
+        adaptive=api.properties.get('adaptive_collect', False),
+        fail_fast=api.properties.get('fail_fast', False),
+    )
     for build in builds.values():
       if build.build_proto.status != common_pb2.SUCCESS:
         raise api.step.StepFailure("build %s failed" % build.build_id)
+    use_digest_store = api.properties.get('use_digest_store') or False
     api.shard_util.archive_full_build(
-        api.path.start_dir / 'out/host_debug', 'host_debug'
+        api.path.start_dir / 'out/host_debug',
+        'host_debug',
+        hardlink=use_digest_store,
     )
+    if use_digest_store:
+      api.shard_util.archive_full_build_manifest(
+          api.path.start_dir / 'out/host_debug',
+          'host_debug',
+      )
     flag_parallel_download_builds = api.properties.get('parallel_download_builds') or False
-    api.shard_util.download_full_builds(builds, api.path.cleanup_dir / 'out', flag_parallel_download_builds)
+    api.shard_util.download_full_builds(
+        builds,
+        api.path.cleanup_dir / 'out',
+        flag_parallel_download_builds,
+        use_digest_store=use_digest_store,
+        paths=api.properties.get('download_paths'),
+        max_concurrency=api.properties.get('max_concurrency'),
+    )
   with api.step.nest("launch builds") as presentation:
     reqs = api.shard_util.schedule_tests(test_configs, builds, presentation)
   api.shard_util.get_base_bucket_name()
@@ -94,7 +113,8 @@ def GenTests(api):
       input_props={'task_name': 'mytask'},
       output_props={
           'cas_output_hash': {
-              'web_tests': 'abc', 'ios_debug': 'bcd', 'full_build': '123'
+              'web_tests': 'abc', 'ios_debug': 'bcd', 'full_build': '123',
+              'full_build_manifest': '321'
           }
       },
       status='SUCCESS',
@@ -195,6 +215,106 @@ def GenTests(api):
       )
   )
 
+  for digest_store_cached in (False, True):
+    yield api.test(
+        'digest_store_%s' % ('cached' if digest_store_cached else 'empty'),
+        api.properties(**({
+            **presubmit_props,
+            'use_digest_store': True,
+        })),
+        api.platform.name('linux'),
+        api.buildbucket.ci_build(
+            project='proj',
+            builder='try-builder',
+            git_repo='https://github.com/repo/a',
+            revision='a' * 40,
+            build_number=123
+        ),
+        api.led.mock_get_builder(
+            job,
+            project='proj',
+            bucket='ci',
+        ),
+        api.shard_util.child_led_steps(
+            subbuilds=[led_try_subbuild1],
+            collect_step='collect builds',
+        ),
+        api.path.exists(
+            api.path.cache_dir / 'builder/full_build_digest_store/trees/123.json'
+        ) if digest_store_cached else api.empty_test_data(),
+    )
+
+  led_try_subbuild2 = api.shard_util.try_build_message(
+      build_id=87654322,
+      builder='host_debug',
+      output_props={'cas_output_hash': {'full_build': '456'}},
+      status='SUCCESS',
+  )
+  led_try_subbuild3 = api.shard_util.try_build_message(
+      build_id=87654323,
+      builder='android_debug',
+      output_props={'cas_output_hash': {'full_build': '789'}},
+      status='SUCCESS',
+  )
+  yield api.test(
+      'selective_bounded_download',
+      api.properties(
+          **({
+              **presubmit_props,
+              'parallel_download_builds': True,
+              'use_digest_store': True,
+              'download_paths': ['ios_debug/Flutter.framework', 'host_debug'],
+              'max_concurrency': 1,
+          })
+      ),
+      api.platform.name('linux'),
+      api.buildbucket.ci_build(
+          project='proj',
+          builder='try-builder',
+          git_repo='https://github.com/repo/a',
+          revision='a' * 40,
+          build_number=123
+      ),
+      api.led.mock_get_builder(
+          job,
+          project='proj',
+          bucket='ci',
+      ),
+      api.shard_util.child_led_steps(
+          subbuilds=[led_try_subbuild1, led_try_subbuild2, led_try_subbuild3],
+          collect_step='collect builds',
+      ),
+  )
+
+  nested_name_props = copy.deepcopy(presubmit_props)
+  nested_name_props['builds'][0]['name'] = 'ci/ios_debug'
+  nested_name_props['download_paths'] = ['ci/ios_debug/Flutter.framework']
+  yield api.test(
+      'selective_download_nested_build_name',
+      api.properties(**nested_name_props),
+      api.platform.name('linux'),
+      api.buildbucket.ci_build(
+          project='proj',
+          builder='try-builder',
+          git_repo='https://github.com/repo/a',
+          revision='a' * 40,
+          build_number=123
+      ),
+      api.led.mock_get_builder(
+          job,
+          project='proj',
+          bucket='ci',
+      ),
+      api.shard_util.child_led_steps(
+          subbuilds=[led_try_subbuild1],
+          collect_step='collect builds',
+      ),
+      api.post_process(
+          MustRun,
+          'collect builds.Download for build 87654321 and cas key ci/ios_debug'
+      ),
+  )
+
   presubmit_props_bb = copy.deepcopy(props_bb)
   presubmit_props_bb['git_url'] = 'http://abc'
   presubmit_props_bb['git_ref'] = 'refs/123/main'
@@ -224,6 +344,43 @@ def GenTests(api):
       )
   )
 
+  fail_fast_props = copy.deepcopy(presubmit_props_bb)
+  fail_fast_props['builds'].append({
+      **fail_fast_props['builds'][0], 'name': 'builder-subbuild2'
+  })
+  fail_fast_props['adaptive_collect'] = True
+  fail_fast_props['fail_fast'] = True
+  running_subbuild = api.shard_util.try_build_message(
+      build_id=8945511751514863186,
+      builder='ios_debug',
+      status='STARTED',
+  )
+  canceled_subbuild = api.shard_util.try_build_message(
+      build_id=8945511751514863186,
+      builder='ios_debug',
+      status='CANCELED',
+  )
+  # Canceled before it started, so it has no swarming task to wait for.
+  canceled_subbuild.build_proto.infra.swarming.task_id = ''
+  canceled_subbuild.build_proto.infra.backend.task.id.id = ''
+  yield (
+      api.buildbucket_util.test('fail_fast', tryjob=False, status='FAILURE') +
+      api.properties(**fail_fast_props) + api.platform.name('linux') +
+      api.shard_util.schedule_build_steps(
+          subbuilds=[running_subbuild, try_failure],
+          launch_step='launch builds.schedule',
+      ) + api.shard_util.streaming_build_steps(
+          subbuilds=[running_subbuild, try_failure],
+          collect_step='collect builds',
+      ) + api.shard_util.streaming_build_steps(
+          subbuilds=[canceled_subbuild],
+          collect_step='collect builds',
+          collect_round=2,
+      ) + api.post_check(
+          MustRun, 'collect builds.cancel 1 remaining build'
+      )
+  )
+
   presubmit_props_bb_with_custom_timeout = copy.deepcopy(props_bb)
   presubmit_props_bb_with_custom_timeout['builds'][0]['timeout'] = 10
   yield (
@@ -0,0 +1,300 @@
+# Copyright 2024 The Flutter Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Stages and hydrates full builds using content digests.
+
+The operations below read their arguments as JSON from stdin:
+
+  stage: hardlinks every file of |build_dir| into |output|/|target|. No file
+    content is copied unless the hardlink fails (e.g. across devices).
+
+  manifest: writes a manifest with the sha256 digest, size and executable bit
+    of each file of |build_dir| to |output|/|target|.json. The manifest is
+    archived on its own so plain downloads of the build do not include it.
+
+  hydrate: moves the files of a downloaded |tree| into a local digest store
+    and copies them into |output|. When |tree| is not provided the tree is
+    expected to be already known by the store under |key|. The files listed
+    in the optional downloaded |manifest| directory are not hashed again. If
+    |paths| is provided only the files under those paths are copied. Blobs
+    are read-only and never linked into |output|, so writes to the hydrated
+    files cannot corrupt the store.
+
+  evict: removes the least recently used blobs once the |store| grows over
+    |max_size| bytes, except the blobs of the trees listed in |keys|. It runs
+    once all hydrations sharing the store are done, so it never removes a
+    blob being copied.
+
+See shard_util/api.py for the format of the inputs.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+# Share of |max_size| the store is trimmed to when evicting, so eviction does
+# not run again on the next hydration.
+EVICTION_TARGET = 0.8
+
+
+def hash_file(path):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def is_executable(path):
+  return bool(os.stat(path).st_mode & stat.S_IXUSR)
+
+
+def link_or_copy(src, dst):
+  """Hardlinks |src| to |dst|, falling back to a copy."""
+  if os.path.lexists(dst):
+    os.remove(dst)
+  try:
+    os.link(src, dst)
+  except OSError:
+    shutil.copy2(src, dst)
+
+
+def walk_files(root):
+  """Yields (relative path, absolute path) for each file and symlink."""
+  for dirpath, dirnames, filenames in os.walk(root):
+    # Symlinks to directories, e.g. in macOS frameworks, are reported as
+    # entries, not traversed.
+    for name in [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))
+                ] + filenames:
+      abs_path = os.path.join(dirpath, name)
+      yield os.path.relpath(abs_path, root).replace(os.sep, '/'), abs_path
+
+
+def stage(data):
+  build_dir = data['build_dir']
+  staged_root = os.path.join(data['output'], data['target'])
+  count = 0
+  for rel_path, abs_path in walk_files(build_dir):
+    dst = os.path.join(staged_root, rel_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.islink(abs_path):
+      os.symlink(os.readlink(abs_path), dst)
+    else:
+      link_or_copy(abs_path, dst)
+    count += 1
+  sys.stdout.write('staged %d files for %s\n' % (count, data['target']))
+  return 0
+
+
+def manifest(data):
+  target = data['target']
+  files = {}
+  symlinks = {}
+  for rel_path, abs_path in walk_files(data['build_dir']):
+    if os.path.islink(abs_path):
+      symlinks[rel_path] = os.readlink(abs_path)
+      continue
+    files[rel_path] = {
+        'digest': hash_file(abs_path),
+        'size': os.path.getsize(abs_path),
+        'is_executable': is_executable(abs_path),
+    }
+  os.makedirs(data['output'], exist_ok=True)
+  with open(os.path.join(data['output'], '%s.json' % target), 'w') as f:
+    json.dump({
+        'version': MANIFEST_VERSION,
+        'target': target,
+        'files': files,
+        'symlinks': symlinks,
+    }, f, sort_keys=True)
+  total_size = sum(f['size'] for f in files.values())
+  unique_size = sum({f['digest']: f['size'] for f in files.values()}.values())
+  sys.stdout.write(
+      'hashed %d files (%d bytes, %d unique bytes) for %s\n' %
+      (len(files), total_size, unique_size, target)
+  )
+  return 0
+
+
+def tree_manifest_path(store, key):
+  return os.path.join(store, 'trees', '%s.json' % key.replace('/', '_'))
+
+
+def blob_path(store, entry):
+  digest = entry['digest']
+  return os.path.join(store, 'blobs', digest[:2], digest)
+
+
+def read_tree_manifest(tree, manifest_dir=None):
+  """Lists the files of a downloaded tree with their digests.
+
+  The entries of the per-target manifests in |manifest_dir| are trusted for
+  the files they list, any other file is hashed.
+  """
+  known = {}
+  manifest_names = []
+  if manifest_dir and os.path.isdir(manifest_dir):
+    manifest_names = sorted(os.listdir(manifest_dir))
+  for name in manifest_names:
+    with open(os.path.join(manifest_dir, name)) as f:
+      target_manifest = json.load(f)
+    target = target_manifest['target']
+    for rel_path, entry in target_manifest['files'].items():
+      known['%s/%s' % (target, rel_path)] = entry
+  files = {}
+  symlinks = {}
+  for rel_path, abs_path in walk_files(tree):
+    if os.path.islink(abs_path):
+      symlinks[rel_path] = os.readlink(abs_path)
+      continue
+    entry = known.get(rel_path)
+    if not entry or entry['size'] != os.path.getsize(abs_path):
+      entry = {
+          'digest': hash_file(abs_path),
+          'size': os.path.getsize(abs_path),
+          'is_executable': is_executable(abs_path),
+      }
+    files[rel_path] = entry
+  return {'files': files, 'symlinks': symlinks}
+
+
+def add_blob(src, blob):
+  """Moves |src| into the store as a read-only blob."""
+  os.makedirs(os.path.dirname(blob), exist_ok=True)
+  os.replace(src, blob)
+  os.chmod(blob, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def copy_blob(blob, dst, executable):
+  """Copies |blob| to |dst|, the copy is writable unlike the blob."""
+  if os.path.lexists(dst):
+    os.remove(dst)
+  shutil.copyfile(blob, dst)
+  os.chmod(dst, 0o755 if executable else 0o644)
+  # The modification time of a blob records when it was last used.
+  os.utime(blob)
+
+
+def evict(store, max_size, keep):
+  """Removes the least recently used blobs once the store exceeds max_size.
+
+  The tree manifests referencing an evicted blob are removed too, so the
+  next hydration of those trees downloads them again.
+
+  Returns:
+    The number of evicted blobs.
+  """
+  blobs = []
+  total = 0
+  for _, abs_path in walk_files(os.path.join(store, 'blobs')):
+    st = os.stat(abs_path)
+    blobs.append((st.st_mtime, st.st_size, abs_path))
+    total += st.st_size
+  if total <= max_size:
+    return 0
+  evicted = set()
+  for _, size, abs_path in sorted(blobs):
+    if total <= max_size * EVICTION_TARGET:
+      break
+    digest = os.path.basename(abs_path)
+    if digest in keep:
+      continue
+    os.remove(abs_path)
+    evicted.add(digest)
+    total -= size
+  trees_dir = os.path.join(store, 'trees')
+  for name in os.listdir(trees_dir):
+    tree_manifest_path = os.path.join(trees_dir, name)
+    with open(tree_manifest_path) as f:
+      tree_files = json.load(f)['files']
+    if any(e['digest'] in evicted for e in tree_files.values()):
+      os.remove(tree_manifest_path)
+  return len(evicted)
+
+
+def is_selected(rel_path, paths):
+  """Whether |rel_path| is one of |paths| or lives under one of them."""
+  if paths is None:
+    return True
+  return any(rel_path == p or rel_path.startswith(p + '/') for p in paths)
+
+
+def hydrate(data):
+  store = data['store']
+  output = data['output']
+  tree = data.get('tree')
+  paths = data.get('paths')
+  if paths is not None:
+    paths = [p.strip('/') for p in paths]
+  manifest_path = tree_manifest_path(store, data['key'])
+  reused = 0
+  if tree:
+    tree_manifest = read_tree_manifest(tree, data.get('manifest'))
+    for rel_path, entry in sorted(tree_manifest['files'].items()):
+      blob = blob_path(store, entry)
+      if os.path.exists(blob):
+        reused += 1
+        continue
+      add_blob(os.path.join(tree, rel_path), blob)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+      json.dump(tree_manifest, f, sort_keys=True)
+  else:
+    with open(manifest_path) as f:
+      tree_manifest = json.load(f)
+    reused = len(tree_manifest['files'])
+
+  copied = 0
+  for rel_path, entry in sorted(tree_manifest['files'].items()):
+    if not is_selected(rel_path, paths):
+      continue
+    dst = os.path.join(output, rel_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    copy_blob(blob_path(store, entry), dst, entry['is_executable'])
+    copied += 1
+  for rel_path, link in sorted(tree_manifest['symlinks'].items()):
+    if not is_selected(rel_path, paths):
+      continue
+    dst = os.path.join(output, rel_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+      os.remove(dst)
+    os.symlink(link, dst)
+  sys.stdout.write(
+      'hydrated %d of %d files, %d reused from the digest store\n' %
+      (copied, len(tree_manifest['files']), reused)
+  )
+  return 0
+
+
+def evict_unused(data):
+  store = data['store']
+  keep = set()
+  for key in data['keys']:
+    path = tree_manifest_path(store, key)
+    if os.path.exists(path):
+      with open(path) as f:
+        keep.update(e['digest'] for e in json.load(f)['files'].values())
+  evicted = evict(store, data['max_size'], keep)
+  sys.stdout.write('%d blobs evicted\n' % evicted)
+  return 0
+
+
+def main():
+  data = json.load(sys.stdin)
+  operations = {
+      'stage': stage,
+      'manifest': manifest,
+      'hydrate': hydrate,
+      'evict': evict_unused,
+  }
+  return operations[data['operation']](data)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -49,6 +49,20 @@ class ShardUtilTestApi(recipe_test_api.RecipeTestApi):
     Args:
       builds (list(build_pb2.Build)): The builds to schedule and collect from.
     """
+    mock_schedule_data = self.schedule_build_steps(subbuilds, launch_step)
+    mock_collect_data = self.m.buildbucket.simulated_collect_output(
+        step_name="%s.collect" % collect_step,
+        builds=[b.build_proto for b in subbuilds],
+    )
+    return mock_schedule_data + mock_collect_data
+
+  def schedule_build_steps(self, subbuilds, launch_step="build"):
+    """Generates step data to schedule child builds.
+
+    Args:
+      subbuilds (list(SubbuildResult)): The builds to schedule.
+      launch_step (str): The name of the schedule step.
+    """
     responses = []
     for subbuild in subbuilds:
       responses.append(
@@ -58,17 +72,11 @@ class ShardUtilTestApi(recipe_test_api.RecipeTestApi):
               )
           )
       )
-    mock_schedule_data = self.m.buildbucket.simulated_schedule_output(
+    return self.m.buildbucket.simulated_schedule_output(
         step_name="%s" % launch_step,
         batch_response=builds_service_pb2.BatchResponse(responses=responses),
     )
 
-    mock_collect_data = self.m.buildbucket.simulated_collect_output(
-        step_name="%s.collect" % collect_step,
-        builds=[b.build_proto for b in subbuilds],
-    )
-    return mock_schedule_data + mock_collect_data
-
   def child_led_steps(self, subbuilds, collect_step="build"):
     """Generates step data to schedule and collect from child builds.
 
@@ -80,3 +88,18 @@ class ShardUtilTestApi(recipe_test_api.RecipeTestApi):
         builds=[b.build_proto for b in subbuilds],
     )
     return mock_collect_data
+
+  def streaming_build_steps(
+      self, subbuilds, collect_step="build", collect_round=1
+  ):
+    """Generates step data for one round of streaming build collection.
+
+    Args:
+      subbuilds (list(SubbuildResult)): The builds returned by the round.
+      collect_step (str): The name of the step nesting the collection.
+      collect_round (int): The collection round number.
+    """
+    return self.m.buildbucket.simulated_get_multi(
+        builds=[b.build_proto for b in subbuilds],
+        step_name="%s.collect round %d" % (collect_step, collect_round),
+    )
@@ -3,7 +3,9 @@
 # found in the LICENSE file.
 
 DEPS = [
-    'flutter/gcloud',
     'recipe_engine/file',
+    'recipe_engine/json',
+    'recipe_engine/path',
+    'recipe_engine/service_account',
     'recipe_engine/step',
 ]
@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 from recipe_engine import recipe_api
+from google.protobuf import field_mask_pb2
 from google.protobuf import json_format
 
 from PB.go.chromium.org.luci.buildbucket.proto import common as common_pb2
@@ -11,41 +12,79 @@ from PB.go.chromium.org.luci.buildbucket.proto import build as build_pb2
 
 class StatusReportingApi(recipe_api.RecipeApi):
 
-  def build_to_json(self, build):
+  def build_to_json(self, build, fields=None):
     """Encodes a shard_util.SubbuildResult to a json string.
 
     Args:
       build(build.Build): The build to encode.
+      fields(list(str)): (optional) Field mask paths of the Build message to
+        keep, e.g. ['id', 'status', 'builder'].
 
     Returns:
       A string with the Build message encoded as Json.
     """
-    return json_format.MessageToJson(build)
+    if fields:
+      masked = build_pb2.Build()
+      field_mask_pb2.FieldMask(paths=fields).MergeMessage(build, masked)
+      build = masked
+    return json_format.MessageToJson(build, indent=None)
 
   def publish_builds(
       self,
       subbuilds,
       topic='projects/flutter-dashboard/topics/luci-builds-prod',
-      only_publish_build_id=False
+      only_publish_build_id=False,
+      fields=None,
   ):
     """Publish builds to a pubsub topic.
 
+    All the messages are sent from a single step, in as few publish requests
+    as the Pub/Sub limits allow.
+
     Args:
       subbuilds(dict): A dictionary with the build name as key and a value
         of shard_util.SubbuildResult as a value.
       topic(str): (optional) gcloud topic to publish message to.
       only_publish_build_id(bool): (optional) If True, only publish the build_id
         of the shard_util.SubbuildResult instead of the entire build json.
+      fields(list(str)): (optional) Field mask paths of the Build messages to
+        publish, the entire build is published by default.
     """
+    messages = []
+    for build in subbuilds.values():
+      if only_publish_build_id is True:
+        message = build.build_id
+      else:
+        message = self.build_to_json(build.build_proto, fields=fields)
+      # Keep the quotes the messages were published with by
+      # `gcloud pubsub topics publish --message='...'`.
+      messages.append('\'%s\'' % message)
+
     with self.m.step.nest('Publish results') as presentation:
-      for id_name, build in subbuilds.items():
-        if only_publish_build_id is True:
-          message = build.build_id
-        else:
-          message = self.build_to_json(build.build_proto)
-
-        cmd = [
-            'pubsub', 'topics', 'publish', topic,
-            '--message=\'%s\'' % message
-        ]
-        self.m.gcloud(*cmd, infra_step=True)
+      if not messages:
+        return
+      access_token = self.m.service_account.default().get_access_token(
+          scopes=['https://www.googleapis.com/auth/pubsub']
+      )
+      token_path = self.m.path.mkstemp()
+      self.m.file.write_text(
+          'write token', token_path, access_token, include_log=False
+      )
+      step = self.m.step(
+          'publish %d messages' % len(messages),
+          ['python3', self.resource('publish.py')],
+          stdin=self.m.json.input({
+              'topic': topic,
+              'token_path': token_path,
+              'messages': messages,
+          }),
+          stdout=self.m.json.output(),
+          infra_step=True,
+          step_test_data=lambda: self.m.json.test_api.output_stream({
+              'message_ids': [str(i) for i in range(len(messages))],
+              'failed': 0,
+          }),
+      )
+      presentation.step_text = 'published %d messages' % len(
+          step.stdout['message_ids']
+      )
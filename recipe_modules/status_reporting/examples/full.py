@@ -32,6 +32,12 @@ def RunSteps(api):
       topic='custom/pubsub/url',
       only_publish_build_id=True
   )
+  api.status_reporting.publish_builds(
+      subbuilds={'mybuild': result},
+      topic='custom/pubsub/url',
+      fields=['builder', 'status']
+  )
+  api.status_reporting.publish_builds(subbuilds={})
 
 
 def GenTests(api):
@@ -0,0 +1,89 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Publishes messages to a Pub/Sub topic in batched publish requests.
+
+Reads a json dict from stdin with:
+  topic: the full topic name, e.g. projects/<project>/topics/<topic>.
+  token_path: path to a file with an OAuth2 access token.
+  messages: list of strings to publish.
+
+Prints a json dict with the published message ids and the number of messages
+that could not be published.
+"""
+
+import base64
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+PUBSUB_URL = 'https://pubsub.googleapis.com/v1/%s:publish'
+
+# Pub/Sub accepts at most 1000 messages and 10MB per publish request.
+MAX_BATCH_MESSAGES = 1000
+MAX_BATCH_BYTES = 9 * 1024 * 1024
+ATTEMPTS = 3
+
+
+def batches(messages):
+  """Yields lists of encoded messages fitting in one publish request."""
+  batch = []
+  size = 0
+  for message in messages:
+    data = base64.b64encode(message.encode('utf-8')).decode('ascii')
+    if batch and (len(batch) == MAX_BATCH_MESSAGES or
+                  size + len(data) > MAX_BATCH_BYTES):
+      yield batch
+      batch = []
+      size = 0
+    batch.append({'data': data})
+    size += len(data)
+  if batch:
+    yield batch
+
+
+def publish(url, token, batch):
+  """Publishes |batch|, retrying transient errors. Returns the message ids."""
+  body = json.dumps({'messages': batch}).encode('utf-8')
+  request = urllib.request.Request(
+      url,
+      data=body,
+      headers={
+          'Authorization': 'Bearer %s' % token,
+          'Content-Type': 'application/json',
+      },
+  )
+  for attempt in range(ATTEMPTS):
+    try:
+      with urllib.request.urlopen(request, timeout=60) as response:
+        return json.load(response)['messageIds']
+    except urllib.error.HTTPError as e:
+      if e.code < 500 and e.code != 429 or attempt == ATTEMPTS - 1:
+        raise
+    except urllib.error.URLError:
+      if attempt == ATTEMPTS - 1:
+        raise
+    time.sleep(2**attempt)
+
+
+def main():
+  data = json.load(sys.stdin)
+  with open(data['token_path']) as f:
+    token = f.read().strip()
+  url = PUBSUB_URL % data['topic']
+  message_ids = []
+  failed = 0
+  for batch in batches(data['messages']):
+    try:
+      message_ids.extend(publish(url, token, batch))
+    except (urllib.error.URLError, KeyError, ValueError) as e:
+      sys.stderr.write('Failed to publish %d messages: %s\n' % (len(batch), e))
+      failed += len(batch)
+  json.dump({'message_ids': message_ids, 'failed': failed}, sys.stdout)
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
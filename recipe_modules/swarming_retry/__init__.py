@@ -7,4 +7,5 @@ DEPS = [
     "recipe_engine/buildbucket",
     "recipe_engine/context",
     "recipe_engine/step",
+    "recipe_engine/time",
 ]
@@ -4,7 +4,9 @@
 
 """Launch and retry swarming jobs until they pass or we hit max attempts."""
 
+import collections
 import itertools
+import math
 from urllib.parse import urlparse
 
 import attr
@@ -14,6 +16,37 @@ from PB.go.chromium.org.luci.buildbucket.proto import common as common_pb2
 from RECIPE_MODULES.fuchsia.utils import pluralize
 
 DEFAULT_MAX_ATTEMPTS = 2
+# Seconds to wait between polls of running attempts, when they are polled
+# instead of waited on.
+DEFAULT_POLL_INTERVAL = 60
+
+
+@attr.s
+class HedgingPolicy:
+  """Launches a duplicate attempt of tasks that run longer than usual.
+
+  An attempt is hedged once it has been running for longer than |percentile|
+  of the historical durations of its task. The first attempt to succeed wins
+  and the other one is canceled. Hedged attempts do not count towards
+  max_attempts and their failures are not counted as flakes.
+  """
+
+  # Percentile of the historical durations after which an attempt is hedged.
+  percentile = attr.ib(type=int, default=90)
+  # Minimum number of historical durations needed to hedge a task.
+  min_history = attr.ib(type=int, default=5)
+  # Maximum number of hedged attempts per task.
+  max_hedges = attr.ib(type=int, default=1)
+  # Seconds to wait between polls of running attempts.
+  poll_interval = attr.ib(type=int, default=DEFAULT_POLL_INTERVAL)
+
+  def threshold(self, durations):
+    """Returns the seconds after which an attempt is hedged, or None."""
+    if len(durations) < self.min_history:
+      return None
+    durations = sorted(durations)
+    index = max(0, int(math.ceil(self.percentile / 100.0 * len(durations))) - 1)
+    return durations[index]
 
 
 @attr.s
@@ -32,6 +65,11 @@ class Attempt:
   has_flakes = attr.ib(type=bool, default=False)
   task_outputs_link = attr.ib(type=str, default=None)
   logs = attr.ib(type=dict, default=attr.Factory(dict))
+  # Whether this attempt duplicates a slow attempt, see HedgingPolicy.
+  is_hedge = attr.ib(type=bool, default=False)
+  # Whether this attempt was canceled after another attempt succeeded.
+  canceled = attr.ib(type=bool, default=False)
+  launch_time = attr.ib(type=float, default=None)
 
   def __attrs_post_init__(self):
     # The led module gives the host and the id, but the swarming module
@@ -41,6 +79,8 @@ class Attempt:
 
   @property
   def name(self):
+    if self.is_hedge:
+      return f"attempt {int(self.index)} (hedge)"
     return f"attempt {int(self.index)}"
 
   @property
@@ -106,7 +146,7 @@ class TaskTracker:
     # builders.
     attempts_allowed = self._task.max_attempts * self._successes_required
     remaining_needed = self._successes_required - self._successes_got
-    remaining_allowed = attempts_allowed - len(self._attempts)
+    remaining_allowed = attempts_allowed - len(self._primary_attempts)
     if remaining_needed > remaining_allowed:
       return self._OVERALL_FAILURE, 0
     # Apply the "no futile retries" strategy: If we need multiple
@@ -115,14 +155,107 @@ class TaskTracker:
     # we're testing is probably bad (i.e. it won't pass if retried).
     # This is intended to avoid wasting time and infra capacity.
     if (self._successes_required > 1 and self._successes_got == 0 and
-        len(self._attempts) >= self._successes_required):
+        len(self._primary_attempts) >= self._successes_required):
       return self._OVERALL_FAILURE, 0
     return self._LAUNCH_MORE, remaining_needed
 
+  @property
+  def _primary_attempts(self):
+    return [a for a in self._attempts if not a.is_hedge]
+
+  @property
+  def pool(self):
+    return self._task.pool
+
+  @property
+  def in_flight(self):
+    """Number of attempts currently running."""
+    return len(self._in_progress_attempts)
+
+  @property
+  def number_to_launch(self):
+    _, number_to_launch = self._get_state()
+    return number_to_launch
+
+  @property
+  def expected_duration(self):
+    """Expected duration in seconds of an attempt, 0 if unknown."""
+    if self._task.expected_duration is not None:
+      return self._task.expected_duration
+    durations = sorted(self._task.historical_durations)
+    if not durations:
+      return 0
+    return durations[len(durations) // 2]
+
+  @property
+  def priority_boost_amount(self):
+    """How much to boost the priority of the next attempt.
+
+    Boost the priority by the number of previous attempts.  This means
+    that second attempts will take priority over first attempts, third
+    attempts will take priority over second attempts, etc.
+
+    This means that if there is a long queue for Swarming tasks to run,
+    only the first attempts should wait.  Subsequent attempts should
+    jump ahead in the queue.
+    """
+    # Don't increase the priority if we need multiple successful runs (used
+    # for perfcompare mode).
+    if self._successes_required > 1:
+      return 0
+    return len(self._primary_attempts)
+
   def should_launch(self):
     _, number_to_launch = self._get_state()
     return number_to_launch > 0
 
+  def should_hedge(self, policy, now):
+    """Whether the running attempt is slow enough to launch a duplicate.
+
+    Args:
+      policy (HedgingPolicy): when to hedge attempts.
+      now (float): the current time in seconds since epoch.
+    """
+    # Tasks that need several successful runs already launch their
+    # attempts together.
+    if self._successes_required > 1 or len(self._in_progress_attempts) != 1:
+      return False
+    attempt = self._in_progress_attempts[0]
+    if attempt.is_hedge or attempt.launch_time is None:
+      return False
+    if len(self._attempts) - len(self._primary_attempts) >= policy.max_hedges:
+      return False
+    threshold = policy.threshold(self._task.historical_durations)
+    return threshold is not None and now - attempt.launch_time > threshold
+
+  def launch_hedge(self):
+    """Launches a duplicate of the running attempt.
+
+    This assumes that should_hedge() was previously called and returned True.
+    """
+    attempt_index = len(self._attempts)
+    task_name = f"{self.name} (attempt {int(attempt_index)}, hedge)"
+    with self._api.step.nest(task_name) as presentation:
+      # Hedges jump ahead in the queue like retries do.
+      attempt = self._task.launch(self.priority_boost_amount)
+      attempt.index = attempt_index
+      attempt.is_hedge = True
+      attempt.launch_time = self._api.time.time()
+      self._attempts.append(attempt)
+      self._in_progress_attempts.append(attempt)
+      presentation.links["Swarming task"] = attempt.task_ui_link
+    return [attempt.task_id]
+
+  def _cancel_in_progress_attempts(self, winner):
+    """Cancels the attempts made redundant by the success of |winner|."""
+    for attempt in list(self._in_progress_attempts):
+      self._api.buildbucket.cancel_build(
+          int(attempt.task_id),
+          reason=f"{winner.name} of {self.name} succeeded first",
+      )
+      attempt.canceled = True
+      self._in_progress_attempts.remove(attempt)
+
   # Launch one or more task attempts.  This assumes that should_launch()
   # was previously called and returned True.
   def launch(self):
@@ -130,20 +263,7 @@ class TaskTracker:
     assert state == self._LAUNCH_MORE, state
     assert number_to_launch > 0
 
-    # Don't increase the priority if we need multiple successful runs (used
-    # for perfcompare mode).
-    if self._successes_required > 1:
-      priority_boost_amount = 0
-    else:
-      # Boost the priority by the number of previous attempts.  This means
-      # that second attempts will take priority over first attempts, third
-      # attempts will take priority over second attempts, etc.
-      #
-      # This means that if there is a long queue for Swarming tasks to run,
-      # only the first attempts should wait.  Subsequent attempts should
-      # jump ahead in the queue.
-      priority_boost_amount = len(self._attempts)
-
+    priority_boost_amount = self.priority_boost_amount
     task_ids = []
     for _ in range(number_to_launch):
       attempt_index = len(self._attempts)
@@ -151,6 +271,7 @@ class TaskTracker:
       with self._api.step.nest(task_name) as presentation:
         attempt = self._task.launch(priority_boost_amount)
         attempt.index = attempt_index
+        attempt.launch_time = self._api.time.time()
         self._attempts.append(attempt)
         self._in_progress_attempts.append(attempt)
         task_ids.append(attempt.task_id)
@@ -208,7 +329,11 @@ class TaskTracker:
         self._successes_got += 1
         if attempt.has_flakes:
           self._flakes_got += 1
-      else:
+        if self._successes_got >= self._successes_required:
+          self._cancel_in_progress_attempts(attempt)
+      elif not attempt.is_hedge:
+        # A failed hedge is not a flake, the attempt it duplicates decides
+        # the outcome.
         self._failures_got += 1
 
   def present(self, **kwargs):
@@ -257,6 +382,15 @@ class Task:
     self.name = name
     self.max_attempts = None
     self.abort_early_if_failed = False
+    # Durations in seconds of previous runs of this task, used to decide
+    # when to hedge an attempt, see HedgingPolicy.
+    self.historical_durations = []
+    # Expected duration in seconds of an attempt. Defaults to the median of
+    # historical_durations. Longer tasks are launched first.
+    self.expected_duration = None
+    # Swarming pool the task runs in, used to cap the number of attempts
+    # running at once in each pool, see run_tasks().
+    self.pool = None
 
   def process_result(self, attempt):
     """Examine the result in the given attempt for failures.
@@ -294,7 +428,11 @@ class Task:
           None
         """
     del kwargs  # Unused.
-    name = f"{attempt.name} ({'pass' if attempt.success else 'fail'})"
+    if attempt.canceled:
+      status = 'canceled'
+    else:
+      status = 'pass' if attempt.success else 'fail'
+    name = f"{attempt.name} ({status})"
     task_step_presentation.links[name] = attempt.task_ui_link
 
   def launch(self, priority_boost_amount):
@@ -356,6 +494,7 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
   Task = Task  # pylint: disable=invalid-name
   LedTask = LedTask  # pylint: disable=invalid-name
   Attempt = Attempt  # pylint: disable=invalid-name
+  HedgingPolicy = HedgingPolicy  # pylint: disable=invalid-name
 
   DEFAULT_MAX_ATTEMPTS = DEFAULT_MAX_ATTEMPTS
 
@@ -382,9 +521,48 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
       return []
     return [task for task in tasks if task.should_launch()]
 
-  def _launch(self, tasks):
+  def _schedule(self, candidates, tasks, max_in_flight):
+    """Orders |candidates| for launch and drops those over the pool budget.
+
+        Retries go first, consistently with the priority boost they get in
+        Swarming, then the longest tasks so that they do not end up last.
+
+        Args:
+          candidates (list[TaskTracker]): tasks that need more attempts.
+          tasks (list[TaskTracker]): all tasks, to count running attempts.
+          max_in_flight (dict or None): maximum number of attempts running
+            at once per pool. Pools not listed are not capped.
+
+        Returns:
+          The tasks to launch in this round, in launch order.
+        """
+    candidates = sorted(
+        candidates,
+        key=lambda task: (-task.priority_boost_amount, -task.expected_duration),
+    )
+    if not max_in_flight:
+      return candidates
+
+    in_flight = collections.Counter()
+    for task in tasks:
+      in_flight[task.pool] += task.in_flight
+
+    scheduled = []
+    for task in candidates:
+      cap = max_in_flight.get(task.pool)
+      count = task.number_to_launch or 1
+      # A task needing more attempts than the cap is launched once the
+      # pool is empty rather than never.
+      if cap is not None and in_flight[task.pool] and (
+          in_flight[task.pool] + count > cap):
+        continue
+      in_flight[task.pool] += count
+      scheduled.append(task)
+    return scheduled
+
+  def _launch(self, tasks, hedge=False):
     for task in tasks:
-      task_ids = task.launch()
+      task_ids = task.launch_hedge() if hedge else task.launch()
       # Check whether we got any duplicate task IDs.  This is just a
       # rationality check for testing.  With the current testing
       # framework, it is easy for multiple launch attempts to return
@@ -397,7 +575,12 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
         self._task_ids_seen.add(task_id)
 
   def _launch_and_collect(
-      self, tasks, collect_output_dir, summary_presentation
+      self,
+      tasks,
+      collect_output_dir,
+      summary_presentation,
+      hedging_policy=None,
+      max_in_flight=None,
   ):
     """Launch necessary tasks and process those that complete.
 
@@ -419,6 +602,10 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
             api.swarming.collect()
           summary_presentation (StepPresentation): where to attach the
             summary for this round of launch/collect.
+          hedging_policy (HedgingPolicy or None): if set, running attempts
+            are polled instead of waited on, and slow attempts are hedged.
+          max_in_flight (dict or None): maximum number of attempts running
+            at once per pool. If set, running attempts are polled too.
 
         Returns:
           Number of jobs still running or to be relaunched. As long as this
@@ -433,19 +620,40 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
         count_or_name = len(task_list)
       return f"{count_or_name} {list_name}"
 
-    to_launch = self._get_tasks_to_launch(tasks)
+    pending = self._get_tasks_to_launch(tasks)
+    to_launch = self._schedule(pending, tasks, max_in_flight)
     if to_launch:
       with self.m.step.nest("launch"):
         self._launch(to_launch)
 
+    if hedging_policy:
+      now = self.m.time.time()
+      to_hedge = self._schedule(
+          [task for task in tasks if task.should_hedge(hedging_policy, now)],
+          tasks,
+          max_in_flight,
+      )
+      if to_hedge:
+        with self.m.step.nest("hedge"):
+          self._launch(to_hedge, hedge=True)
+
     # Wait on tasks that are in-progress.
     tasks_by_id = {}
     for task in tasks:
       for attempt in task._in_progress_attempts:
         assert attempt.task_id not in tasks_by_id
         tasks_by_id[attempt.task_id] = (task, attempt)
+    # Poll instead of waiting for every attempt to complete, so that slow
+    # attempts can be hedged and queued tasks can take the slots freed in
+    # their pool in the next round.
+    poll = bool(hedging_policy or max_in_flight)
     results = {}
-    if tasks_by_id:
+    if tasks_by_id and poll:
+      results = self.m.buildbucket.get_multi(
+          sorted([int(build_id) for build_id in tasks_by_id]),
+          step_name="poll",
+      )
+    elif tasks_by_id:
       results = self.m.buildbucket.collect_builds(
           sorted([int(build_id) for build_id in tasks_by_id]),
           mirror_status=False
@@ -462,6 +670,9 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
       with self.m.step.nest("process results") as process_results_presentation:
         for result in completed_results:
           task, attempt = tasks_by_id[str(result.id)]
+          if attempt.canceled:
+            # Another attempt of the task succeeded earlier in this round.
+            continue
           task.process_result(attempt, result)
           if attempt.success:
             passed_tasks.append((task, attempt))
@@ -491,6 +702,10 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
 
       summary.append(summary_entry(list_name, [task for task, _ in task_list]))
 
+    queued_tasks = [task for task in pending if task not in to_launch]
+    if queued_tasks:
+      summary.append(summary_entry("queued", queued_tasks))
+
     incomplete_tasks = [task for task in tasks if task.in_progress]
     # Do minimal presentation of all in-progress Attempts.
     links = []
@@ -528,6 +743,12 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
       if failed_abort_early_tasks:
         return 0
 
+    if poll and incomplete_tasks and not completed_results:
+      self.m.time.sleep(
+          hedging_policy.poll_interval
+          if hedging_policy else DEFAULT_POLL_INTERVAL
+      )
+
     return len(to_be_relaunched) + len(incomplete_tasks)
 
   def run_tasks(
@@ -536,15 +757,26 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
       max_attempts=0,
       collect_output_dir=None,
       run_count=1,
+      hedging_policy=None,
+      max_in_flight=None,
   ):
     """Launch all tasks, retry until max_attempts reached.
 
+        In each round, retries are launched first, then the tasks with the
+        longest expected duration.
+
         Args:
           tasks (seq[Task]): tasks to execute
           max_attempts (int): maximum number of attempts per task (0 means
             DEFAULT_MAX_ATTEMPTS)
           collect_output_dir (Path or None): output directory to pass to
             api.swarming.collect()
+          hedging_policy (HedgingPolicy or None): launch duplicates of the
+            attempts running longer than usual, see HedgingPolicy.
+          max_in_flight (dict[str, int] or None): maximum number of attempts
+            running at once, keyed by Task.pool. Tasks over the budget are
+            queued and launched as soon as an attempt of their pool
+            completes, running attempts are polled rather than waited on.
         """
 
     max_attempts = max_attempts or DEFAULT_MAX_ATTEMPTS
@@ -562,6 +794,8 @@ class RetrySwarmingApi(recipe_api.RecipeApi):
               tasks=tasks,
               collect_output_dir=collect_output_dir,
               summary_presentation=presentation,
+              hedging_policy=hedging_policy,
+              max_in_flight=max_in_flight,
           ):
             break
 
@@ -65,3 +65,9 @@ class FlutterSwarmingRetryTestApi(recipe_test_api.RecipeTestApi):
         results,
         step_name=f"launch/collect.{int(iteration)}.buildbucket.collect"
     )
+
+  def poll_data(self, results, iteration=0):
+    """Mock data for polling attempts when a HedgingPolicy is used."""
+    return self.m.buildbucket.simulated_get_multi(
+        results, step_name=f"launch/collect.{int(iteration)}.poll"
+    )
@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from recipe_engine import post_process
 from recipe_engine.recipe_api import Property
 
 from PB.go.chromium.org.luci.led.job import job as job_pb2
@@ -51,6 +52,19 @@ PROPERTIES = {
             default=False,
             help="Whether to run a task that will fail and abort early",
         ),
+    "hedge":
+        Property(
+            kind=bool,
+            default=False,
+            help="Whether to hedge attempts running longer than usual.",
+        ),
+    "max_in_flight":
+        Property(
+            kind=int,
+            default=None,
+            help="Maximum number of attempts running at once. The last task "
+            "is expected to run the longest.",
+        ),
 }
 
 
@@ -140,6 +154,8 @@ def RunSteps(
     last_task_max_attempts,
     run_count,
     abort_early,
+    hedge,
+    max_in_flight,
 ):
   task_types = {
       "test": Task,
@@ -178,8 +194,25 @@ def RunSteps(
   if last_task_max_attempts:
     tasks[-1].max_attempts = last_task_max_attempts
 
+  hedging_policy = None
+  if hedge:
+    hedging_policy = api.swarming_retry.HedgingPolicy(poll_interval=1)
+    for task in tasks:
+      task.historical_durations = [0, 0, 0, 0, 0]
+
+  pools = None
+  if max_in_flight:
+    pools = {"pool": max_in_flight}
+    for task in tasks:
+      task.pool = "pool"
+    tasks[-1].expected_duration = 60
+
   api.swarming_retry.run_and_present_tasks(
-      tasks, max_attempts=max_attempts, run_count=run_count
+      tasks,
+      max_attempts=max_attempts,
+      run_count=run_count,
+      hedging_policy=hedging_policy,
+      max_in_flight=pools,
   )
 
 
@@ -367,3 +400,56 @@ def GenTests(api):  # pylint: disable=invalid-name
           iteration=1,
       )
   )
+
+  yield (
+      api.test("hedge") + api.properties(hedge=True) + test_api.poll_data([
+          test_api.incomplete_task("task", 100),
+          test_api.passed_task("task", 101),
+      ]) + api.post_process(
+          post_process.MustRun,
+          "launch/collect.0.hedge.task (attempt 1, hedge)",
+      )
+  )
+
+  yield (
+      api.test("hedge_fails_then_pass") + api.properties(hedge=True) +
+      test_api.poll_data([
+          test_api.incomplete_task("task", 100),
+          test_api.failed_task("task", 101),
+      ]) + test_api.poll_data([test_api.incomplete_task("task", 100)],
+                              iteration=1) +
+      test_api.poll_data([test_api.passed_task("task", 100)], iteration=2)
+  )
+
+  yield (
+      api.test("max_in_flight") +
+      api.properties(abort_early=True, max_in_flight=1) +
+      test_api.poll_data([test_api.passed_task("abort_early_task", 700)]) +
+      test_api.poll_data([test_api.passed_task("task", 100)], iteration=1) +
+      api.post_process(
+          post_process.DoesNotRun,
+          "launch/collect.0.launch.task (attempt 0)",
+      ) + api.post_process(
+          post_process.MustRun,
+          "launch/collect.1.launch.task (attempt 0)",
+      )
+  )
+
+  yield (
+      api.test("max_in_flight_polls_without_hedging") +
+      api.properties(abort_early=True, max_in_flight=1) +
+      test_api.poll_data([test_api.incomplete_task("abort_early_task", 700)]) +
+      test_api.poll_data([test_api.passed_task("abort_early_task", 700)],
+                         iteration=1) +
+      test_api.poll_data([test_api.passed_task("task", 100)], iteration=2) +
+      api.post_process(
+          post_process.DoesNotRun,
+          "launch/collect.0.buildbucket.collect",
+      ) + api.post_process(
+          post_process.DoesNotRun,
+          "launch/collect.1.launch.task (attempt 0)",
+      ) + api.post_process(
+          post_process.MustRun,
+          "launch/collect.2.launch.task (attempt 0)",
+      )
+  )
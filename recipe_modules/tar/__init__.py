@@ -6,5 +6,6 @@ DEPS = [
     "recipe_engine/cipd",
     "recipe_engine/context",
     "recipe_engine/path",
+    "recipe_engine/platform",
     "recipe_engine/step",
 ]
@@ -10,11 +10,18 @@ TAR_VERSION = 'git_revision:6462ccda48c8f33dce4c80c2f1533263277d4da9'
 class TarApi(recipe_api.RecipeApi):
   """Provides steps to tar and untar files."""
 
-  COMPRESSION_OPTS = ["gzip", "bzip2", "xz", "lzma"]
+  COMPRESSION_OPTS = ["gzip", "bzip2", "xz", "lzma", "zstd", "pigz"]
+
+  # Compressions that can use several cores. "zstd" uses the multi-threaded
+  # zstd filter of bsdtar and "pigz" pipes the archive through the pigz found
+  # on the PATH. Bots without pigz use the single-threaded gzip of bsdtar,
+  # which produces compatible archives.
+  MULTITHREADED_COMPRESSION_OPTS = ["zstd", "pigz"]
 
   def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
     self._tool_path = None
+    self._has_pigz = None
 
   def __call__(self, step_name, cmd):
     full_cmd = [self._bsdtar_path] + list(cmd)
@@ -29,27 +36,80 @@ class TarApi(recipe_api.RecipeApi):
       )
     return self._tool_path
 
-  def create(self, path, compression=None):
+  @property
+  def _pigz_available(self):
+    """Whether pigz is on the PATH, it is not provisioned by the recipes."""
+    if self._has_pigz is None:
+      step = self.m.step(
+          'find pigz',
+          [
+              'python3', '-c',
+              'import shutil, sys; sys.exit(shutil.which("pigz") is None)'
+          ],
+          ok_ret='any',
+          infra_step=True,
+      )
+      self._has_pigz = step.retcode == 0
+      if not self._has_pigz:
+        step.presentation.step_text = 'not found, using gzip'
+    return self._has_pigz
+
+  def create(
+      self, path, compression=None, compression_level=None, threads=None
+  ):
     """Returns TarArchive object that can be used to compress a set of files.
 
+        Files are compressed while they are archived, no uncompressed
+        intermediate archive is written to disk.
+
         Args:
           path: path of the archive file to be created.
           compression: str, one of COMPRESSION_OPTS or None to disable compression.
+          compression_level: int, compression level passed to the compressor,
+              defaults to the compressor default.
+          threads: int, number of threads used by the compressions in
+              MULTITHREADED_COMPRESSION_OPTS, defaults to all the cores.
         """
     assert not compression or compression in TarApi.COMPRESSION_OPTS, (
         "compression must be one of %s",
         TarApi.COMPRESSION_OPTS,
     )
-    return TarArchive(self.m, path, compression)
-
-  def extract(self, step_name, path, directory=None, strip_components=None):
+    assert compression or compression_level is None, (
+        "compression_level requires a compression"
+    )
+    if compression == "pigz" and not self._pigz_available:
+      compression = "gzip"
+    if compression in TarApi.MULTITHREADED_COMPRESSION_OPTS:
+      threads = self._cpu_count(threads)
+    return TarArchive(self.m, path, compression, compression_level, threads)
+
+  def _cpu_count(self, threads):
+    return int(threads or self.m.platform.cpu_count)
+
+  def extract(
+      self,
+      step_name,
+      path,
+      directory=None,
+      strip_components=None,
+      compression=None,
+      threads=None
+  ):
     """Uncompress |archive| file.
 
+        The archive is decompressed while it is extracted, no uncompressed
+        intermediate archive is written to disk.
+
         Args:
           step_name: name of the step.
           path: absolute path to archive file.
           directory: directory to extract the archive in.
           strip_components: strip number of leading components from file names.
+          compression: str, the compression used to create the archive. Only
+              needed for "pigz", other compressions are detected by bsdtar,
+              which also decompresses "pigz" archives when pigz is missing.
+          threads: int, number of threads used by pigz, defaults to all the
+              cores.
         """
     # We use long-form options whenever possible, but for options with
     # arguments, we have to use the short form. The recipe engine tests require
@@ -67,16 +127,24 @@ class TarApi(recipe_api.RecipeApi):
       cmd.extend(["-C", directory])
     if strip_components:
       cmd.extend(["--strip-components", str(int(strip_components))])
+    if compression == "pigz" and self._pigz_available:
+      cmd.append(
+          "--use-compress-program=pigz -d -p %d" % self._cpu_count(threads)
+      )
     return self(step_name, cmd)
 
 
 class TarArchive:
   """Used to gather a list of files to tar."""
 
-  def __init__(self, api, path, compression):
+  def __init__(
+      self, api, path, compression, compression_level=None, threads=None
+  ):
     self._api = api
     self._path = path
     self._compression = compression
+    self._compression_level = compression_level
+    self._threads = threads
     self._entries = {}
 
   @property
@@ -106,8 +174,7 @@ class TarArchive:
   def tar(self, step_name):
     """Step to tar all staged files."""
     cmd = ["--create", "-f", self._path]
-    if self._compression:
-      cmd.append("--%s" % self._compression)
+    cmd.extend(self._compression_args())
     for directory in sorted(self._entries):
       cmd.extend(["-C", directory] + [
           self._api.path.relpath(p, directory) for p in self._entries[directory]
@@ -116,3 +183,25 @@ class TarArchive:
     step_result = self._api.tar(step_name, cmd)
     self._api.path.mock_add_paths(self._path)
     return step_result
+
+  def _compression_args(self):
+    """Returns the bsdtar arguments selecting the compression."""
+    if not self._compression:
+      return []
+    level = self._compression_level
+    if self._compression == "pigz":
+      program = "pigz -p %d" % self._threads
+      if level is not None:
+        program += " -%d" % int(level)
+      return ["--use-compress-program=%s" % program]
+    args = ["--%s" % self._compression]
+    options = []
+    if level is not None:
+      options.append(
+          "%s:compression-level=%d" % (self._compression, int(level))
+      )
+    if self._compression == "zstd":
+      options.append("zstd:threads=%d" % self._threads)
+    if options:
+      args.append("--options=%s" % ",".join(options))
+    return args
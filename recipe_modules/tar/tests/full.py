@@ -2,6 +2,8 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from recipe_engine.post_process import DoesNotRun
+
 DEPS = [
     "flutter/tar",
     "recipe_engine/context",
@@ -28,6 +30,21 @@ def RunSteps(api):
   archive.add(temp / "sub/dir/c", temp / "sub")
   archive.tar("taring more")
 
+  # Build archives using all the cores.
+  archive = api.tar.create(
+      temp / "more.tar.zst", compression="zstd", compression_level=3
+  )
+  archive.add(temp / "a", temp)
+  archive.tar("taring with zstd")
+  archive = api.tar.create(
+      temp / "more.tgz", compression="pigz", compression_level=6, threads=4
+  )
+  archive.add(temp / "a", temp)
+  archive.tar("taring with pigz")
+  archive = api.tar.create(temp / "more.tar.xz", compression="xz")
+  archive.add(temp / "a", temp)
+  archive.tar("taring with xz")
+
   # Coverage for 'output' property.
   api.step("report", ["echo", archive.path])
 
@@ -38,6 +55,12 @@ def RunSteps(api):
       directory=temp / "output",
       strip_components=1,
   )
+  api.tar.extract(
+      "untaring with pigz",
+      temp / "more.tgz",
+      directory=temp / "output",
+      compression="pigz",
+  )
   # List untarped content.
   with api.context(cwd=temp / "output"):
     api.step("listing", ["find"])
@@ -48,3 +71,10 @@ def RunSteps(api):
 def GenTests(api):
   for platform in ("linux", "mac"):
     yield api.test(platform) + api.platform.name(platform)
+
+  yield api.test(
+      "pigz_not_found",
+      api.platform.name("linux"),
+      api.step_data("find pigz", retcode=1),
+      api.post_process(DoesNotRun, "find pigz (2)"),
+  )
@@ -16,6 +16,12 @@ MAX_CHARS = 3500
 # Default timeout for tests seconds
 TIMEOUT_SECS = 3600
 
+# The maximum number of bytes of a flaky test log attached to the flaky step.
+FLAKY_LOG_MAX_BYTES = 1024 * 1024
+
+# The flakiness status message printed at the end of the test output.
+FLAKY_MARKER = 'flaky: true'
+
 # Map between iphone identifier and generation name.
 IDENTIFIER_NAME_MAP = {
     'iPhone1,1': 'iPhone',
@@ -82,30 +88,66 @@ class PrettyFailure(recipe_api.StepFailure):
 class TestUtilsApi(recipe_api.RecipeApi):
   """Utilities to run flutter tests."""
 
-  def _truncateString(self, string):
+  def _truncateString(self, string, max_bytes=MAX_CHARS):
     """Truncate the string by lines from the end so that the output has
-    less than MAX_CHARS bytes."""
+    less than max_bytes bytes."""
     byte_count = 0
     lines = string.splitlines()
     output = []
     for line in reversed(lines):
       # +1 to account for the \n separators.
       byte_count += len(line.encode('utf-8')) + 1
-      if byte_count >= MAX_CHARS:
+      if byte_count >= max_bytes:
         break
-      output.insert(0, line)
+      output.append(line)
+    output.reverse()
     return '\n'.join(output)
 
-  def _is_flaky(self, output):
-    """Check if test step is flaky"""
-    lines = output.splitlines()
-    lines.reverse()
-    # The flakiness status message `flaky: true` is expected to be located at the
-    # end of the stdout file. Check last 10 lines to make sure it is covered if existing.
-    for line in lines[:10]:
-      if 'flaky: true' in line:
-        return True
-    return False
+  def read_tail(
+      self,
+      step_name,
+      path,
+      max_bytes=MAX_CHARS,
+      marker=None,
+      marker_lines=10,
+      test_data='',
+  ):
+    """Reads the end of a file, seeking from its end.
+
+    Only the last blocks of the file are read, so this is safe to use on
+    logs of any size.
+
+    Args:
+      step_name(str): The name of the step.
+      path(Path): The file to read.
+      max_bytes(int): The tail contains the last whole lines of the file
+        fitting in less than max_bytes bytes.
+      marker(str): A string to look for in the last marker_lines lines.
+      marker_lines(int): The number of lines searched for the marker.
+      test_data(str): The file content to simulate in tests.
+
+    Returns(dict): The 'tail' str, whether the 'marker_found' and the 'size'
+      of the file in bytes.
+    """
+    cmd = ['python3', self.resource('tail.py'), '--max-bytes', str(max_bytes)]
+    if marker:
+      cmd += ['--marker', marker, '--marker-lines', str(marker_lines)]
+    cmd.append(path)
+    test_data = test_data or ''
+    return self.m.step(
+        step_name,
+        cmd,
+        stdout=self.m.json.output(),
+        infra_step=True,
+        step_test_data=lambda: self.m.json.test_api.output_stream({
+            'tail': self._truncateString(test_data, max_bytes),
+            'marker_found': bool(marker) and any(
+                marker in line
+                for line in test_data.splitlines()[-marker_lines:]
+            ),
+            'size': len(test_data.encode('utf-8')),
+        }),
+    ).stdout
 
   #def is_devicelab_bot(self):
   #  """Whether the current bot is a devicelab bot or not."""
@@ -153,24 +195,27 @@ class TestUtilsApi(recipe_api.RecipeApi):
             infra_step=infra_step,
             timeout=timeout_secs,
         )
-        # Read logs to analyze flakiness.
-        logs = self.m.file.read_text('read_logs', logs_file)
-        step_stdout = self.m.properties.get(
-            'fake_data'
-        ) if self._test_data.enabled else logs
-        if self._is_flaky(step_stdout):
+        # Read the end of the logs to analyze flakiness.
+        logs = self.read_tail(
+            'read_logs',
+            logs_file,
+            max_bytes=FLAKY_LOG_MAX_BYTES,
+            marker=FLAKY_MARKER,
+            test_data=self.m.properties.get('fake_data'),
+        )
+        if logs['marker_found']:
           test_run_status = 'flaky'
-          self.flaky_step(step_name, logs)
+          self.flaky_step(step_name, logs['tail'])
         else:
           test_run_status = 'success'
       except self.m.step.StepFailure as f:
         result = f.result
-        logs = self.m.file.read_text('read_logs', logs_file)
         # Truncate stdout
-        result_stdout = self.m.properties.get(
-            'fake_data'
-        ) if self._test_data.enabled else logs
-        truncated_stdout = self._truncateString(result_stdout)
+        truncated_stdout = self.read_tail(
+            'read_logs',
+            logs_file,
+            test_data=self.m.properties.get('fake_data'),
+        )['tail']
         raise PrettyFailure(
             '\n\n```\n%s\n```\n' % (truncated_stdout),
             result=result,
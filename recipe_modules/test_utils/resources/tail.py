@@ -0,0 +1,85 @@
+# Copyright 2024 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Reads the end of a file without loading the whole file in memory.
+
+Prints a json dict with:
+  tail: the last whole lines of the file, less than --max-bytes in total.
+  marker_found: whether --marker is in one of the last --marker-lines lines.
+  size: the size of the file in bytes.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BLOCK_SIZE = 64 * 1024
+
+
+def read_end(path, max_bytes, min_lines):
+  """Reads blocks backwards until |max_bytes| and |min_lines| are covered.
+
+  Returns:
+    (bytes read, whether the start of the file was reached, file size).
+  """
+  with open(path, 'rb') as f:
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    position = size
+    blocks = []
+    read = 0
+    newlines = 0
+    while position > 0 and (read < max_bytes or newlines <= min_lines):
+      length = min(BLOCK_SIZE, position)
+      position -= length
+      f.seek(position)
+      block = f.read(length)
+      blocks.append(block)
+      read += len(block)
+      newlines += block.count(b'\n')
+  return b''.join(reversed(blocks)), position == 0, size
+
+
+def tail_lines(lines, max_bytes):
+  """Returns the last |lines| fitting in less than |max_bytes|."""
+  byte_count = 0
+  output = []
+  for line in reversed(lines):
+    # +1 to account for the \n separators.
+    byte_count += len(line.encode('utf-8')) + 1
+    if byte_count >= max_bytes:
+      break
+    output.append(line)
+  output.reverse()
+  return '\n'.join(output)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--max-bytes', type=int, required=True)
+  parser.add_argument('--marker')
+  parser.add_argument('--marker-lines', type=int, default=10)
+  parser.add_argument('path')
+  args = parser.parse_args()
+
+  data, at_start, size = read_end(
+      args.path, args.max_bytes, args.marker_lines if args.marker else 0
+  )
+  lines = data.decode('utf-8', 'replace').splitlines()
+  if not at_start and lines:
+    # The first line was cut by the seek.
+    lines = lines[1:]
+  marker_found = bool(args.marker) and any(
+      args.marker in line for line in lines[-args.marker_lines:]
+  )
+  json.dump({
+      'tail': tail_lines(lines, args.max_bytes),
+      'marker_found': marker_found,
+      'size': size,
+  }, sys.stdout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
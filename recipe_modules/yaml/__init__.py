@@ -1,5 +1,6 @@
 DEPS = [
     'recipe_engine/file',
     'recipe_engine/json',
+    'recipe_engine/path',
     'recipe_engine/step',
 ]
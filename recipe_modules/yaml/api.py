@@ -2,12 +2,22 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
+
 from recipe_engine import recipe_api
 
 
 class YamlApi(recipe_api.RecipeApi):
   """Provides utilities to parse yaml files."""
 
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    # Digests of the yaml contents already converted to json in this build.
+    self._cached_digests = set()
+
+  def _cache_path(self, digest):
+    return self.m.path.cleanup_dir / 'yaml_cache' / f'{digest}.json'
+
   def read(self, step_name, file_path, json_place_holder):
     """Reads a yaml file.
 
@@ -17,6 +27,10 @@ class YamlApi(recipe_api.RecipeApi):
     change this behavior to be inline if it becomes easier to specify
     vpython3 packages dependencies in a recipe module.
 
+    The converted json is cached in the cleanup directory keyed by the
+    sha256 of the yaml content, so reading the same content again in the
+    same build does not start vpython3.
+
     Args:
       step_name: (str) the name of the step for reading the yaml.
       file_path: (str) the path to the yaml file.
@@ -27,12 +41,18 @@ class YamlApi(recipe_api.RecipeApi):
     with self.m.step.nest(step_name) as presentation:
       content = self.m.file.read_text('read', file_path)
       presentation.logs['yaml'] = content
-      return self.m.step(
+      digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+      cache_path = self._cache_path(digest)
+      if digest in self._cached_digests:
+        return self.m.json.read('parse (cached)', cache_path)
+      result = self.m.step(
           'parse', [
               'vpython3',
               self.resource('parse_yaml.py'), '--yaml_file', file_path,
               '--json_file',
-              self.m.json.output()
+              self.m.json.output(), '--cache_file', cache_path
           ],
           infra_step=True
       )
+      self._cached_digests.add(digest)
+      return result
@@ -7,6 +7,7 @@ DEPS = [
     'recipe_engine/assertions',
     'recipe_engine/file',
     'recipe_engine/json',
+    'recipe_engine/properties',
     'recipe_engine/raw_io',
 ]
 
@@ -20,6 +21,11 @@ tasks:
 def RunSteps(api):
   result = api.yaml.read('yaml', api.resource('sample.yaml'), api.json.output())
   api.assertions.assertEqual(result.json.output, {'key': 'value'})
+  if api.properties.get('read_twice'):
+    result = api.yaml.read(
+        'yaml again', api.resource('sample.yaml'), api.json.output()
+    )
+    api.assertions.assertEqual(result.json.output, {'key': 'value'})
 
 
 def GenTests(api):
@@ -34,3 +40,14 @@ def GenTests(api):
       ),
       status='INFRA_FAILURE'
   )
+  yield api.test(
+      'cached', api.properties(read_twice=True),
+      api.step_data('yaml.parse', api.json.output({'key': 'value'})),
+      api.step_data('yaml.read', api.file.read_text(text_content=YAML_CONTENT)),
+      api.step_data(
+          'yaml again.read', api.file.read_text(text_content=YAML_CONTENT)
+      ),
+      api.step_data(
+          'yaml again.parse (cached)', api.json.output({'key': 'value'})
+      )
+  )
@@ -10,19 +10,30 @@
 
 import argparse
 import json
+import os
 import sys
 import yaml
 
+# The libyaml based loader is several times faster, it is only missing when
+# pyyaml was built without libyaml.
+LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 def main():
   parser = argparse.ArgumentParser()
   parser.add_argument('--yaml_file')
   parser.add_argument('--json_file')
+  parser.add_argument('--cache_file')
   args = parser.parse_args()
 
   with open(args.yaml_file) as f:
-    with open(args.json_file, 'w+') as j:
-      json.dump(yaml.safe_load(f), j)
+    content = json.dumps(yaml.load(f, Loader=LOADER))
+  with open(args.json_file, 'w+') as j:
+    j.write(content)
+  if args.cache_file:
+    os.makedirs(os.path.dirname(args.cache_file), exist_ok=True)
+    with open(args.cache_file, 'w') as j:
+      j.write(content)
 
 
 if __name__ == '__main__':
@@ -8,7 +8,14 @@ from recipe_engine import recipe_api
 class ZipApi(recipe_api.RecipeApi):
   """Provides steps to zip and unzip files."""
 
-  def make_package(self, root, output):
+  def make_package(
+      self,
+      root,
+      output,
+      compression_level=1,
+      store_compressed=False,
+      parallel=False
+  ):
     """Returns ZipPackage object that can be used to compress a set of files.
 
     Usage:
@@ -21,13 +28,21 @@ class ZipApi(recipe_api.RecipeApi):
       root: a directory that would become root of a package, all files added to
           an archive will have archive paths relative to this directory.
       output: path to a zip file to create.
+      compression_level (int): deflate level from 0 to 9, 0 stores every file
+          without compression.
+      store_compressed (bool): If True, already compressed files such as jars
+          and zips are stored without compression.
+      parallel (bool): If True, files are compressed concurrently on all the
+          available cores.
 
     Returns:
       ZipPackage object.
     """
-    return ZipPackage(self.m, root, output)
+    return ZipPackage(
+        self.m, root, output, compression_level, store_compressed, parallel
+    )
 
-  def directory(self, step_name, directory, output):
+  def directory(self, step_name, directory, output, **kwargs):
     """Step to compress a single directory.
 
     Args:
@@ -36,10 +51,14 @@ class ZipApi(recipe_api.RecipeApi):
           an archive, i.e. |directory|/file.txt would be named 'file.txt' in
           the archive.
       output: path to a zip file to create.
+      kwargs: compression options, see make_package.
+
+    Returns:
+      The step result, its json.output maps archive names to sha256 digests.
     """
-    pkg = self.make_package(directory, output)
+    pkg = self.make_package(directory, output, **kwargs)
     pkg.add_directory(directory)
-    pkg.zip(step_name)
+    return pkg.zip(step_name)
 
   def namelist(self, step_name, zip_file):
     """Step to get the name list of |zip_file|.
@@ -59,13 +78,21 @@ class ZipApi(recipe_api.RecipeApi):
     )
     return names_step.stdout or []
 
-  def unzip(self, step_name, zip_file, output, quiet=False):
+  def unzip(
+      self,
+      step_name,
+      zip_file,
+      output,
+      quiet=False,
+      incremental=False,
+      parallel=None
+  ):
     """Step to uncompress |zip_file| into |output| directory.
 
     Zip package will be unpacked to |output| so that root of an archive is in
     |output|, i.e. archive.zip/file.txt will become |output|/file.txt.
 
-    Step will FAIL if |output| already exists.
+    Step will FAIL if |output| already exists, unless |incremental| is True.
 
     Args:
       step_name: display name of a step.
@@ -73,12 +100,18 @@ class ZipApi(recipe_api.RecipeApi):
       output: path to a directory to unpack to, it should NOT exist.
       quiet (bool): If True, print terse output instead of the name
           of each unzipped file.
+      incremental (bool): If True, |output| may already exist and the files
+          whose size and CRC match the archive are not extracted again.
+      parallel (bool): If True, members are extracted concurrently on all
+          the available cores. Defaults to True on Windows only.
     """
     # TODO(vadimsh): Use 7zip on Windows if available?
     script_input = {
         'output': str(output),
         'zip_file': str(zip_file),
         'quiet': quiet,
+        'incremental': incremental,
+        'parallel': parallel,
     }
     self.m.step(
         step_name, ['python3', self.resource('unzip.py')],
@@ -89,10 +122,21 @@ class ZipApi(recipe_api.RecipeApi):
 class ZipPackage(object):
   """Used to gather a list of files to zip."""
 
-  def __init__(self, api, root, output):
+  def __init__(
+      self,
+      api,
+      root,
+      output,
+      compression_level=1,
+      store_compressed=False,
+      parallel=False
+  ):
     self._api = api
     self._root = root
     self._output = output
+    self._compression_level = compression_level
+    self._store_compressed = store_compressed
+    self._parallel = parallel
     self._entries = []
 
   @property
@@ -131,14 +175,27 @@ class ZipPackage(object):
     })
 
   def zip(self, step_name):
-    """Step to zip all staged files."""
+    """Step to zip all staged files.
+
+    Returns:
+      The step result, its json.output maps the archive name of every zipped
+      file to its sha256 digest.
+    """
+    assert 0 <= self._compression_level <= 9, self._compression_level
     script_input = {
         'entries': self._entries,
         'output': str(self._output),
         'root': str(self._root),
+        'level': self._compression_level,
+        'store_compressed': self._store_compressed,
+        'parallel': self._parallel,
     }
     step_result = self._api.step(
-        step_name, ['python3', self._api.zip.resource('zip.py')],
+        step_name, [
+            'python3',
+            self._api.zip.resource('zip.py'),
+            self._api.json.output(),
+        ],
         stdin=self._api.json.input(script_input)
     )
     self._api.path.mock_add_paths(self._output)
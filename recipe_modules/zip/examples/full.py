@@ -31,11 +31,29 @@ def RunSteps(api):
   package.add_directory(package.root / 'sub')
   package.zip('zipping more')
 
+  # Build a zip deflating files concurrently and storing compressed ones.
+  api.zip.directory(
+      'zipping in parallel',
+      temp,
+      temp / 'parallel.zip',
+      compression_level=6,
+      store_compressed=True,
+      parallel=True,
+  )
+
   # Coverage for 'output' property.
   api.step('report', ['echo', package.output])
 
   # Unzip the package.
   api.zip.unzip('unzipping', temp / 'output.zip', temp / 'output', quiet=True)
+  # Unzip again on top of the existing tree, skipping unchanged files.
+  api.zip.unzip(
+      'unzipping incrementally',
+      temp / 'output.zip',
+      temp / 'output',
+      incremental=True,
+      parallel=True,
+  )
   # List unzipped content.
   with api.context(cwd=temp / 'output'):
     api.step('listing', ['find'])
@@ -6,12 +6,18 @@
 recipe module internally. Should not be used elsewhere.
 """
 
+import concurrent.futures
 import json
 import os
 import shutil
+import stat
 import subprocess
 import sys
+import threading
 import zipfile
+import zlib
+
+BUFFER_SIZE = 1 << 20  # 1MB
 
 
 def unzip_with_subprocess(zip_file, output, quiet):
@@ -36,7 +42,106 @@ def unzip_with_subprocess(zip_file, output, quiet):
   return subprocess.call(args=args, cwd=output)
 
 
-def unzip_with_python(zip_file, output):
+def file_crc(path):
+  crc = 0
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(BUFFER_SIZE), b''):
+      crc = zlib.crc32(chunk, crc)
+  return crc
+
+
+def member_mode(info):
+  return info.external_attr >> 16
+
+
+def is_symlink(info):
+  """Whether |info| is extracted as a symlink.
+
+  Windows bots can not create symlinks without admin rights, the members
+  are written as regular files holding the link target there, like
+  zipfile.extract does.
+  """
+  return sys.platform != 'win32' and stat.S_ISLNK(member_mode(info))
+
+
+def member_parts(info):
+  """Returns the path components of |info|, accepting '\\' separators."""
+  name = info.filename.replace('\\', '/')
+  parts = [p for p in name.split('/') if p not in ('', '.')]
+  if parts and os.path.splitdrive(parts[0])[0]:
+    # Drop drive letters, e.g. C:, like zipfile does.
+    parts = parts[1:]
+  return parts
+
+
+def is_dir(info):
+  return info.filename.endswith(('/', '\\'))
+
+
+def is_up_to_date(info, target):
+  """Whether |target| already has the size and CRC of member |info|."""
+  if is_symlink(info) or not os.path.isfile(target) or os.path.islink(target):
+    return False
+  return (
+      os.path.getsize(target) == info.file_size and
+      file_crc(target) == info.CRC
+  )
+
+
+class Extractor(object):
+  """Extracts members of an archive, each thread using its own handle."""
+
+  def __init__(self, zip_file, output):
+    self._zip_file = zip_file
+    self._output = os.path.realpath(output)
+    self._output_prefix = os.path.join(self._output, '')
+    self._local = threading.local()
+
+  def _archive(self):
+    if not hasattr(self._local, 'archive'):
+      self._local.archive = zipfile.ZipFile(self._zip_file)
+    return self._local.archive
+
+  def target(self, info):
+    """Returns the destination of |info|, refusing paths outside output."""
+    parts = member_parts(info)
+    assert '..' not in parts, info.filename
+    target = os.path.join(self._output, *parts)
+    parent = os.path.realpath(os.path.dirname(target))
+    assert (
+        parent == self._output or parent.startswith(self._output_prefix)
+    ), info.filename
+    return target
+
+  def extract(self, info, incremental):
+    """Extracts |info|, returns False if it was skipped as up to date."""
+    target = self.target(info)
+    if incremental and is_up_to_date(info, target):
+      return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.islink(target):
+      os.remove(target)
+    archive = self._archive()
+    if is_symlink(info):
+      if os.path.lexists(target):
+        os.remove(target)
+      os.symlink(archive.read(info).decode('utf-8'), target)
+      return True
+    with archive.open(info) as src, open(target, 'wb') as dst:
+      shutil.copyfileobj(src, dst, BUFFER_SIZE)
+    mode = member_mode(info) & 0o7777
+    if mode and sys.platform != 'win32':
+      os.chmod(target, mode)
+    return True
+
+  def close(self):
+    # Only the handle of the calling thread can be reached, the others are
+    # closed when the worker threads are garbage collected.
+    if hasattr(self._local, 'archive'):
+      self._local.archive.close()
+
+
+def unzip_with_python(zip_file, output, incremental=False, workers=1):
   """Unzips an archive using 'zipfile' python module.
 
   Works everywhere where python works (Windows and Posix).
@@ -44,14 +149,45 @@ def unzip_with_python(zip_file, output):
   Args:
     zip_file: absolute path to an archive to unzip.
     output: existing directory to unzip to.
+    incremental (bool): If True, members whose size and CRC already match the
+        file on disk are not extracted again.
+    workers (int): number of threads extracting members concurrently.
 
   Returns:
     Exit code (0 on success).
   """
   with zipfile.ZipFile(zip_file) as zip_file_obj:
-    for name in zip_file_obj.namelist():
-      print('Extracting %s' % name)
-      zip_file_obj.extract(name, output)
+    infos = zip_file_obj.infolist()
+  extractor = Extractor(zip_file, output)
+  members = []
+  for info in infos:
+    if is_dir(info):
+      os.makedirs(extractor.target(info), exist_ok=True)
+    else:
+      members.append(info)
+  # Start with the largest members so a big file does not end up last.
+  members.sort(key=lambda info: info.file_size, reverse=True)
+
+  extracted = 0
+  extracted_bytes = 0
+  try:
+    with concurrent.futures.ThreadPoolExecutor(max(1, workers)) as pool:
+      futures = {
+          pool.submit(extractor.extract, info, incremental): info
+          for info in members
+      }
+      for future in concurrent.futures.as_completed(futures):
+        if future.result():
+          extracted += 1
+          extracted_bytes += futures[future].file_size
+  finally:
+    extractor.close()
+  print(
+      'Extracted %d files (%.1f MB), %d already up to date.' % (
+          extracted, extracted_bytes / (1024.0 * 1024.0),
+          len(members) - extracted
+      )
+  )
   return 0
 
 
@@ -61,28 +197,38 @@ def main():
   output = data['output']
   zip_file = data['zip_file']
   quiet = data['quiet']
+  incremental = data.get('incremental', False)
+  parallel = data.get('parallel')
+  if parallel is None:
+    # Extraction on Windows goes through zipfile, spread it over all cores.
+    parallel = sys.platform == 'win32'
 
   # Archive path should exist and be an absolute path to a file.
   assert os.path.exists(zip_file), zip_file
   assert os.path.isfile(zip_file), zip_file
 
-  # Output path should be an absolute path, and should NOT exist.
+  # Output path should be an absolute path, and should NOT exist unless the
+  # archive is extracted incrementally on top of it.
   assert os.path.isabs(output), output
-  assert not os.path.exists(output), output
+  existed = os.path.exists(output)
+  assert incremental or not existed, output
 
   print('Unzipping %s...' % zip_file)
   exit_code = -1
   try:
-    os.makedirs(output)
-    if sys.platform == 'win32':
-      # Used on Windows, since there's no builtin 'unzip' utility there.
-      exit_code = unzip_with_python(zip_file, output)
+    os.makedirs(output, exist_ok=True)
+    if sys.platform == 'win32' or incremental or parallel:
+      # Used on Windows, since there's no builtin 'unzip' utility there, and
+      # whenever incremental or concurrent extraction is requested.
+      workers = (os.cpu_count() or 1) if parallel else 1
+      exit_code = unzip_with_python(zip_file, output, incremental, workers)
     else:
       # On mac and linux 'unzip' utility handles symlink and file modes.
       exit_code = unzip_with_subprocess(zip_file, output, quiet)
   finally:
-    # On non-zero exit code or on unexpected exception, clean up.
-    if exit_code:
+    # On non-zero exit code or on unexpected exception, clean up. A tree that
+    # existed before is kept, the next incremental run will repair it.
+    if exit_code and not existed:
       shutil.rmtree(output, ignore_errors=True)
   return exit_code
 
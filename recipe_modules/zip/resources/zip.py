@@ -4,141 +4,273 @@
 
 """Standalone python script to zip a set of files. Intended to be used by 'zip'
 recipe module internally. Should not be used elsewhere.
+
+Every file is read once: its sha256 digest is computed while it is being
+compressed, and the digests are written as a JSON manifest to the path passed
+as the first argument.
 """
 
-import json
+import concurrent.futures
 import hashlib
+import json
 import os
-import subprocess
+import shutil
+import stat
 import sys
+import tempfile
+import time
 import zipfile
+import zlib
+
+BUFFER_SIZE = 1 << 20  # 1MB
+
+# Files with these extensions are already compressed, deflating them again
+# costs CPU time without reducing their size.
+COMPRESSED_EXTENSIONS = (
+    '.7z',
+    '.aab',
+    '.aar',
+    '.apk',
+    '.bz2',
+    '.dmg',
+    '.gz',
+    '.ipa',
+    '.jar',
+    '.jpeg',
+    '.jpg',
+    '.png',
+    '.tgz',
+    '.xz',
+    '.zip',
+    '.zst',
+)
 
 
-def zip_with_subprocess(root, output, entries):
-  """Zips set of files and directories using 'zip' utility.
+class Entry(object):
+  """A file, directory or symlink to add to the archive."""
 
-  Works only on Linux and Mac, uses system 'zip' program.
+  def __init__(self, path, archive_name):
+    self.path = path
+    self.archive_name = archive_name.replace(os.path.sep, '/')
+    self.stat = os.lstat(path)
+
+  @property
+  def is_dir(self):
+    return stat.S_ISDIR(self.stat.st_mode)
+
+  @property
+  def is_link(self):
+    return stat.S_ISLNK(self.stat.st_mode)
+
+  def zip_info(self):
+    name = self.archive_name + '/' if self.is_dir else self.archive_name
+    # Zip timestamps can not predate 1980.
+    date_time = max(
+        time.localtime(self.stat.st_mtime)[:6], (1980, 1, 1, 0, 0, 0)
+    )
+    info = zipfile.ZipInfo(name, date_time)
+    if not self.is_dir and not self.is_link:
+      info.file_size = self.stat.st_size
+    # Keep the file type so symlinks are restored as symlinks.
+    info.external_attr = (self.stat.st_mode & 0xFFFF) << 16
+    if self.is_dir:
+      info.external_attr |= 0x10  # MS-DOS directory flag.
+    return info
+
+
+def collect_entries(root, output, entries):
+  """Expands the entries described in zip/api.py into Entry objects.
 
   Args:
     root: absolute path to a directory that will become a root of the archive.
-    output: absolute path to a destination archive.
+    output: absolute path to a destination archive, never added to itself.
     entries: list of dicts, describing what to zip, see zip/api.py.
-
-  Returns:
-    Exit code (0 on success).
   """
-  # Collect paths relative to |root| of all items we'd like to zip.
-  items_to_zip = []
+  collected = []
+  seen = set()
+
+  def add(path, archive_name=None):
+    assert path.startswith(root), path
+    if path == output:
+      return
+    if archive_name is None:
+      archive_name = path[len(root):]
+    if not archive_name or archive_name in seen:
+      return
+    seen.add(archive_name)
+    collected.append(Entry(path, archive_name))
+
   for entry in entries:
     tp = entry['type']
     path = entry['path']
     if tp == 'file':
       # File must exist and be inside |root|.
       assert os.path.isfile(path), path
-      assert path.startswith(root), path
-      file_path = path[len(root):]
-      hash_file(file_path)
-      items_to_zip.append(file_path)
-    elif entry['type'] == 'dir':
-      # Append trailing '/'.
-      path = path.rstrip(os.path.sep) + os.path.sep
+      add(path, entry.get('archive_name'))
+    elif tp == 'dir':
       # Directory must exist and be inside |root| or be |root| itself.
+      path = path.rstrip(os.path.sep) + os.path.sep
       assert os.path.isdir(path), path
-      assert path.startswith(root), path
-      dir_path = path[len(root):] or '.'
-      walk_dir_and_do(path, lambda p: hash_file(p))
-      items_to_zip.append(dir_path)
+      if path != root:
+        add(path.rstrip(os.path.sep))
+      for cur, dirs, files in os.walk(path):
+        for name in sorted(dirs) + sorted(files):
+          add(os.path.join(cur, name))
     else:
       raise AssertionError('Invalid entry type: %s' % (tp,))
+  return collected
 
-  # Invoke 'zip' in |root| directory, passing all relative paths via stdin.
-  proc = subprocess.Popen(
-      args=['zip', '-1', '--recurse-paths', '--symlinks', '-@', output],
-      stdin=subprocess.PIPE,
-      cwd=root
-  )
-  items_to_zip_bytes = []
-  for item in items_to_zip:
-    items_to_zip_bytes.append(
-        item if isinstance(item, bytes) else bytes(item, 'UTF-8')
-    )
 
-  proc.communicate(b'\n'.join(items_to_zip_bytes))
-  return proc.returncode
+def compress_type_for(entry, level, store_compressed):
+  if level == 0 or entry.is_dir or entry.is_link:
+    return zipfile.ZIP_STORED
+  if store_compressed and entry.archive_name.lower().endswith(
+      COMPRESSED_EXTENSIONS):
+    return zipfile.ZIP_STORED
+  return zipfile.ZIP_DEFLATED
 
 
-def walk_dir_and_do(directory_path, callback):
-  for cur, _, files in os.walk(directory_path):
-    for name in files:
-      callback(os.path.join(cur, name))
+def write_streaming(zip_file, entry, compress_type, level):
+  """Compresses |entry| into |zip_file| and returns its sha256 digest."""
+  info = entry.zip_info()
+  info.compress_type = compress_type
+  info._compresslevel = level  # pylint: disable=protected-access
+  if entry.is_dir:
+    zip_file.writestr(info, b'')
+    return None
+  if entry.is_link:
+    zip_file.writestr(info, os.readlink(entry.path).encode('utf-8'))
+    return None
+  sha = hashlib.sha256()
+  force_zip64 = entry.stat.st_size > zipfile.ZIP64_LIMIT
+  with open(entry.path, 'rb') as src, zip_file.open(
+      info, 'w', force_zip64=force_zip64) as dst:
+    for chunk in iter(lambda: src.read(BUFFER_SIZE), b''):
+      sha.update(chunk)
+      dst.write(chunk)
+  return sha.hexdigest()
+
 
+def deflate_to_temp(entry, level, temp_dir):
+  """Deflates |entry| into a temporary file in a single read pass.
 
-def hash_file(file_path):
-  BUFFER_SIZE = 1 << 16  # 64kb
+  Returns:
+    (sha256 hexdigest, crc32, uncompressed size, temporary file path).
+  """
   sha = hashlib.sha256()
-  with open(file_path, 'rb') as f:
-    data = f.read(BUFFER_SIZE)
-    while data:
-      sha.update(data)
-      data = f.read(BUFFER_SIZE)
-  digest = sha.hexdigest()
-  print('sha256 digest for %s is:\n%s\n' % (file_path, digest))
+  crc = 0
+  size = 0
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+  fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+  with open(entry.path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+    for chunk in iter(lambda: src.read(BUFFER_SIZE), b''):
+      sha.update(chunk)
+      crc = zlib.crc32(chunk, crc)
+      size += len(chunk)
+      dst.write(compressor.compress(chunk))
+    dst.write(compressor.flush())
+  return sha.hexdigest(), crc, size, temp_path
 
 
-def zip_with_python(root, output, entries):
-  """Zips set of files and directories using 'zipfile' python module.
+def write_deflated(zip_file, entry, deflated):
+  """Appends an entry deflated by deflate_to_temp to |zip_file|."""
+  _, crc, size, temp_path = deflated
+  info = entry.zip_info()
+  info.compress_type = zipfile.ZIP_DEFLATED
+  info.CRC = crc
+  info.file_size = size
+  info.compress_size = os.path.getsize(temp_path)
+  zip64 = (
+      info.file_size > zipfile.ZIP64_LIMIT or
+      info.compress_size > zipfile.ZIP64_LIMIT
+  )
+  # zipfile has no API to add data that is already compressed, so the local
+  # header is written the same way ZipFile.write does it.
+  # pylint: disable=protected-access
+  info.header_offset = zip_file.fp.tell()
+  zip_file._writecheck(info)
+  zip_file.fp.write(info.FileHeader(zip64))
+  with open(temp_path, 'rb') as src:
+    shutil.copyfileobj(src, zip_file.fp, BUFFER_SIZE)
+  os.remove(temp_path)
+  zip_file.filelist.append(info)
+  zip_file.NameToInfo[info.filename] = info
+  zip_file.start_dir = zip_file.fp.tell()
+
 
-  Works everywhere where python works (Windows and Posix).
+def zip_entries(output, entries, level, store_compressed, parallel):
+  """Zips |entries| into |output|.
 
   Args:
-    root: absolute path to a directory that will become a root of the archive.
     output: absolute path to a destination archive.
-    entries: list of dicts, describing what to zip, see zip/api.py.
+    entries: list of Entry objects.
+    level: deflate compression level, 0 stores every file.
+    store_compressed: whether to store already compressed files.
+    parallel: whether to deflate several files concurrently.
 
   Returns:
-    Exit code (0 on success).
+    A dict mapping the archive name of each file to its sha256 digest.
   """
-  with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED,
-                       allowZip64=True) as zip_file:
-
-    def add(path, archive_name):
-      assert path.startswith(root), path
-      # Do not add itself to archive.
-      if path == output:
-        return
-      if archive_name is None:
-        archive_name = path[len(root):]
-      print('Adding %s' % archive_name)
-      hash_file(path)
-      zip_file.write(path, archive_name)
-
-    for entry in entries:
-      tp = entry['type']
-      path = entry['path']
-      if tp == 'file':
-        add(path, entry.get('archive_name'))
-      elif tp == 'dir':
-        walk_dir_and_do(path, lambda p: add(p, None))
-      else:
-        raise AssertionError('Invalid entry type: %s' % (tp,))
-  return 0
-
-
-def use_python_zip(entries):
-  if sys.platform == 'win32':
-    return True
-  for entry in entries:
-    if entry.get('archive_name') is not None:
-      return True
-  return False
+  manifest = {}
+  with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+                       compresslevel=level) as zip_file:
+    if not parallel:
+      for entry in entries:
+        digest = write_streaming(
+            zip_file, entry, compress_type_for(entry, level, store_compressed),
+            level
+        )
+        if digest:
+          manifest[entry.archive_name] = digest
+      return manifest
+
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(output))
+    workers = os.cpu_count() or 1
+    try:
+      with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        # Deflate ahead of the writer but bound the number of pending
+        # temporary files. zlib releases the GIL while compressing.
+        pending = {}
+        next_index = 0
+
+        def schedule():
+          nonlocal next_index
+          while next_index < len(entries) and len(pending) < 2 * workers:
+            entry = entries[next_index]
+            if compress_type_for(entry, level,
+                                 store_compressed) == zipfile.ZIP_DEFLATED:
+              pending[next_index] = pool.submit(
+                  deflate_to_temp, entry, level, temp_dir
+              )
+            next_index += 1
+
+        for index, entry in enumerate(entries):
+          schedule()
+          future = pending.pop(index, None)
+          if future is None:
+            digest = write_streaming(
+                zip_file, entry, zipfile.ZIP_STORED, level
+            )
+          else:
+            deflated = future.result()
+            write_deflated(zip_file, entry, deflated)
+            digest = deflated[0]
+          if digest:
+            manifest[entry.archive_name] = digest
+    finally:
+      shutil.rmtree(temp_dir, ignore_errors=True)
+  return manifest
 
 
 def main():
   # See zip/api.py, def zip(...) for format of |data|.
   data = json.load(sys.stdin)
-  entries = data['entries']
+  manifest_path = sys.argv[1] if len(sys.argv) > 1 else None
   output = data['output']
   root = data['root'].rstrip(os.path.sep) + os.path.sep
+  level = data.get('level', 1)
+  store_compressed = data.get('store_compressed', False)
+  parallel = data.get('parallel', False)
 
   # Archive root directory should exist and be an absolute path.
   assert os.path.exists(root), root
@@ -150,14 +282,12 @@ def main():
   print('Zipping %s...' % output)
   exit_code = -1
   try:
-    if use_python_zip(entries):
-      # Used on Windows, since there's no builtin 'zip' utility there, and when
-      # an explicit archive_name is set, since there's no way to do that with
-      # the native zip utility without filesystem shenanigans
-      exit_code = zip_with_python(root, output, entries)
-    else:
-      # On mac and linux 'zip' utility handles symlink and file modes.
-      exit_code = zip_with_subprocess(root, output, entries)
+    entries = collect_entries(root, output, data['entries'])
+    manifest = zip_entries(output, entries, level, store_compressed, parallel)
+    if manifest_path:
+      with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
+    exit_code = 0
   finally:
     # On non-zero exit code or on unexpected exception, clean up.
     if exit_code:
@@ -165,8 +295,10 @@ def main():
         os.remove(output)
       except:  # pylint: disable=bare-except
         pass
-  if not exit_code:
-    print('Archive size: %.1f KB' % (os.stat(output).st_size / 1024.0,))
+  print(
+      'Zipped %d files, archive size: %.1f KB' %
+      (len(manifest), os.stat(output).st_size / 1024.0)
+  )
   return exit_code
 
 
@@ -158,11 +158,13 @@ def RunSteps(api):
 
       test_runner_command = _runner_command(api, env, runner_params)
       try:
-        test_status = api.test_utils.run_test(
-            'run %s' % task_name,
-            test_runner_command,
-            timeout_secs=test_timeout_secs,
-        )
+        # Logs are uploaded while the test runs so they survive a timeout.
+        with api.logs_util.streaming_upload_logs(task_name):
+          test_status = api.test_utils.run_test(
+              'run %s' % task_name,
+              test_runner_command,
+              timeout_secs=test_timeout_secs,
+          )
       finally:
         debug_after_failure(api, task_name)
 
@@ -190,8 +192,7 @@ def RunSteps(api):
 
 
 def debug_after_failure(api, task_name):
-  """Upload logs and collect OS debug info."""
-  api.logs_util.upload_logs(task_name)
+  """Collect OS debug info."""
   # This is to clean up leaked processes.
   api.os_utils.kill_processes()
   # Collect memory/cpu/process after task execution.
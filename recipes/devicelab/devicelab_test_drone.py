@@ -147,11 +147,13 @@ def run_test(api, task_name, runner_params):
   test_runner_command.extend(runner_params)
   test_status = ''
   try:
-    test_status = api.test_utils.run_test(
-        'run %s' % task_name,
-        test_runner_command,
-        timeout_secs=MAX_TIMEOUT_SECS
-    )
+    # Logs are uploaded while the test runs so they survive a timeout.
+    with api.logs_util.streaming_upload_logs(task_name):
+      test_status = api.test_utils.run_test(
+          'run %s' % task_name,
+          test_runner_command,
+          timeout_secs=MAX_TIMEOUT_SECS
+      )
   finally:
     debug_after_failure(api, task_name)
 
@@ -173,8 +175,7 @@ def download_artifact(api, artifact, artifact_destination_dir):
 
 
 def debug_after_failure(api, task_name):
-  """Upload logs and collect OS debug info."""
-  api.logs_util.upload_logs(task_name)
+  """Collect OS debug info."""
   # This is to clean up leaked processes.
   api.os_utils.kill_processes()
   # Collect memory/cpu/process after task execution.
@@ -27,8 +27,11 @@ this recipe in the builds property:
 """
 import contextlib
 import copy
+import itertools
 import re
 
+from recipe_engine import post_process
+
 DEPS = [
     'depot_tools/depot_tools',
     'flutter/archives',
@@ -50,6 +53,7 @@ DEPS = [
     'recipe_engine/cas',
     'recipe_engine/context',
     'recipe_engine/file',
+    'recipe_engine/futures',
     'recipe_engine/path',
     'recipe_engine/platform',
     'recipe_engine/properties',
@@ -123,61 +127,149 @@ def _should_run_test(api, test):
   return regex.match(branch)
 
 
+def _can_run_in_parallel(test):
+  """Whether a local test may run concurrently with other tests.
+
+  Tests entering contexts are exclusive: contexts like osx_sdk or avd set up
+  state that is global to the bot.
+  """
+  return (
+      test.get('parallel') and not test.get('exclusive') and
+      not test.get('contexts')
+  )
+
+
 def run_tests(api, tests, checkout, env, env_prefixes):
-  """Runs sub-build tests."""
+  """Runs sub-build tests.
+
+  Tests run in the order of the configuration. Consecutive tests that can
+  run in parallel, see _can_run_in_parallel, run concurrently.
+  """
   # Run local tests in the builder to optimize resource usage.
-  for test in tests:
-    if not _should_run_test(api, test):
+  tests = [test for test in tests if _should_run_test(api, test)]
+  for parallel, group in itertools.groupby(tests, key=_can_run_in_parallel):
+    group = list(group)
+    if parallel and len(group) > 1:
+      run_tests_in_parallel(
+          api, group, checkout, env, env_prefixes, api.platform.cpu_count
+      )
       continue
-    # Copy and expand env, env_prefixes. This is required to
-    # add configuration env variables.
-    test_deps = test.get('test_dependencies', [])
-    api.flutter_deps.required_deps(env, env_prefixes, test_deps)
+    for test in group:
+      # Copy and expand env, env_prefixes. This is required to
+      # add configuration env variables.
+      test_deps = test.get('test_dependencies', [])
+      api.flutter_deps.required_deps(env, env_prefixes, test_deps)
+      tmp_env = copy.deepcopy(env)
+      tmp_env.update(test.get('env', {}))
+      run_test(api, test, checkout, tmp_env, env_prefixes)
+
+
+def run_tests_in_parallel(api, tests, checkout, env, env_prefixes, cpu_budget):
+  """Runs hermetic local tests concurrently.
+
+  Tests are started in order as long as the sum of their `cpus` (1 by default)
+  fits in the cpu budget. Each test gets its own FLUTTER_LOGS_DIR and copies
+  of env and env_prefixes, and keeps the retry semantics of sequential tests.
+  Failures are aggregated and raised once every test completed.
+
+  Args:
+    tests: (list(dict)) local test configurations marked as `parallel`.
+    checkout: (Path) the engine checkout.
+    env: (dict) a dictionary with environment variables to set.
+    env_prefixes: (dict) a dictionary with lists of values associated to env
+        variables with priority based on the order.
+    cpu_budget: (int) the number of cpus the tests can use at once.
+  """
+  # Dependencies are installed upfront, they share the env dictionaries.
+  for test in tests:
+    api.flutter_deps.required_deps(
+        env, env_prefixes, test.get('test_dependencies', [])
+    )
+  test_envs = []
+  for test in tests:
     tmp_env = copy.deepcopy(env)
     tmp_env.update(test.get('env', {}))
-    # Run tests within a exitStack context
-    with contextlib.ExitStack() as exit_stack:
-      logs_override = test.get('upload_logs') or {}
-      name = logs_override.get('name') or test.get('name')
-      uuid = logs_override.get('uuid')
-
-      api.flutter_deps.enter_contexts(
-          exit_stack, test.get('contexts', []), tmp_env, env_prefixes
-      )
-      command = [test.get('language')] if test.get('language') else []
-      # Ideally local tests should be completely hermetic and in theory we can run
-      # them in parallel using futures. I haven't found a flutter engine
-      # configuration with more than one local test but once we find it we
-      # should run the list of tests using parallelism.
-      # TODO(godofredoc): Optimize to run multiple local tests in parallel.
-      command.append(checkout / test.get('script'))
-      command.extend(test.get('parameters', []))
-      step_name = api.test_utils.test_step_name(test.get('name'))
-      test_timeout_secs = test.get(
-          'test_timeout_secs', DEFAULT_TEST_TIMEOUT_SECS
+    test_envs.append((tmp_env, copy.deepcopy(env_prefixes)))
+
+  def _run(test, tmp_env, tmp_env_prefixes, logs_path):
+    with api.step.nest(test.get('name')):
+      run_test(
+          api, test, checkout, tmp_env, tmp_env_prefixes, logs_path=logs_path
       )
 
-      # pylint: disable=cell-var-from-loop
-      def run_test():
-        # Replace MAGIC_ENVS
-        updated_command = api.os_utils.replace_magic_envs(command, tmp_env)
-        return api.step(step_name, updated_command, timeout=test_timeout_secs)
+  running = {}
+  failures = []
 
-      # Rerun test step 3 times by default if failing.
-      # TODO(keyonghan): notify tree gardener for test failures/flakes:
-      # https://github.com/flutter/flutter/issues/89308
-      api.logs_util.initialize_logs_collection(tmp_env)
+  def _wait_for_one():
+    for future in api.futures.wait(list(running), count=1):
+      test = running.pop(future)
       try:
-        # Run within another context to make the logs env variable available to
-        # test scripts.
-        with api.context(env=tmp_env, env_prefixes=env_prefixes):
-          api.retry.wrap(
-              run_test,
-              max_attempts=test.get('max_attempts', 3),
-              step_name=step_name
-          )
-      finally:
-        api.logs_util.upload_logs(name, uuid=uuid)
+        future.result()
+      except api.step.StepFailure:
+        failures.append(test.get('name'))
+
+  with api.step.nest('run parallel tests') as presentation:
+    for test, (tmp_env, tmp_env_prefixes) in zip(tests, test_envs):
+      cpus = min(test.get('cpus', 1), cpu_budget)
+      while running and sum(
+          min(t.get('cpus', 1), cpu_budget) for t in running.values()
+      ) + cpus > cpu_budget:
+        _wait_for_one()
+      logs_path = api.path.mkdtemp('flutter_logs_dir')
+      future = api.futures.spawn(
+          _run, test, tmp_env, tmp_env_prefixes, logs_path
+      )
+      running[future] = test
+    while running:
+      _wait_for_one()
+    presentation.step_summary_text = '%d passed, %d failed' % (
+        len(tests) - len(failures), len(failures)
+    )
+    if failures:
+      presentation.status = api.step.FAILURE
+      raise api.step.StepFailure(
+          'Failed local tests: %s' % ', '.join(sorted(failures))
+      )
+
+
+def run_test(api, test, checkout, tmp_env, env_prefixes, logs_path=None):
+  """Runs a single local test with retries and uploads its logs."""
+  # Run tests within a exitStack context
+  with contextlib.ExitStack() as exit_stack:
+    logs_override = test.get('upload_logs') or {}
+    name = logs_override.get('name') or test.get('name')
+    uuid = logs_override.get('uuid')
+
+    api.flutter_deps.enter_contexts(
+        exit_stack, test.get('contexts', []), tmp_env, env_prefixes
+    )
+    command = [test.get('language')] if test.get('language') else []
+    command.append(checkout / test.get('script'))
+    command.extend(test.get('parameters', []))
+    step_name = api.test_utils.test_step_name(test.get('name'))
+    test_timeout_secs = test.get('test_timeout_secs', DEFAULT_TEST_TIMEOUT_SECS)
+
+    def run_test_step():
+      # Replace MAGIC_ENVS
+      updated_command = api.os_utils.replace_magic_envs(command, tmp_env)
+      return api.step(step_name, updated_command, timeout=test_timeout_secs)
+
+    # Rerun test step 3 times by default if failing.
+    # TODO(keyonghan): notify tree gardener for test failures/flakes:
+    # https://github.com/flutter/flutter/issues/89308
+    api.logs_util.initialize_logs_collection(tmp_env, logs_path=logs_path)
+    # Logs are uploaded while the test runs so they survive a timeout.
+    with api.logs_util.streaming_upload_logs(
+        name, uuid=uuid, logs_path=logs_path
+    ):
+      # Run within another context to make the logs env variable available to
+      # test scripts.
+      with api.context(env=tmp_env, env_prefixes=env_prefixes):
+        api.retry.wrap(
+            run_test_step,
+            max_attempts=test.get('max_attempts', 3),
+            step_name=step_name
+        )
 
 
 def Build(api, checkout, env, env_prefixes, outputs, build):
@@ -237,22 +329,44 @@ def Build(api, checkout, env, env_prefixes, outputs, build):
     run_tests(api, tests, checkout, env, env_prefixes)
     api.flutter_bcid.report_stage('upload')
     for archive_config in archives:
-      outputs[archive_config['name']] = Archive(api, checkout, archive_config)
+      outputs[archive_config['name']] = Archive(
+          api,
+          checkout,
+          archive_config,
+          batch_upload=build.get('batch_upload_artifacts', False),
+      )
     api.flutter_bcid.report_stage('upload-complete')
-    # Allow time for the provenance to upload so it can be validated
-    api.time.sleep(60)
-    for archive_config in archives:
-      if api.flutter_bcid.is_official_build():
-        Verify(api, checkout, archive_config)
+    if build.get('pipelined_verification', False):
+      # Provenance availability is polled with backoff while verifying.
+      paths = []
+      for archive_config in archives:
+        paths.extend(api.archives.engine_v2_gcs_paths(checkout, archive_config))
+      api.flutter_bcid.verify_provenances(paths)
+    else:
+      # Allow time for the provenance to upload so it can be validated
+      api.time.sleep(60)
+      for archive_config in archives:
+        if api.flutter_bcid.is_official_build():
+          Verify(api, checkout, archive_config)
   # Archive full build. This is inefficient but necessary for global generators.
   if build.get('cas_archive', True):
+    use_manifest = build.get('cas_archive_manifest', False)
     full_build_hash = api.shard_util.archive_full_build(
-        checkout / 'out' / build.get('name'), build.get('name')
+        checkout / 'out' / build.get('name'),
+        build.get('name'),
+        hardlink=use_manifest,
     )
     outputs['full_build'] = full_build_hash
+    if use_manifest:
+      outputs['full_build_manifest'] = (
+          api.shard_util.archive_full_build_manifest(
+              checkout / 'out' / build.get('name'),
+              build.get('name'),
+          )
+      )
 
 
-def Archive(api, checkout, archive_config):
+def Archive(api, checkout, archive_config, batch_upload=False):
   paths = api.archives.engine_v2_gcs_paths(checkout, archive_config)
   # Sign artifacts if running on mac and a release candidate branch.
   is_release_branch = api.repo_util.is_release_candidate_branch(
@@ -265,6 +379,10 @@ def Archive(api, checkout, archive_config):
         if api.signing.requires_signing(path.local)
     ]
     api.signing.code_sign(signing_paths)
+  if batch_upload:
+    for path in api.archives.upload_artifacts(paths):
+      api.flutter_bcid.upload_provenance(path.local, path.remote)
+    return
   for path in paths:
     api.archives.upload_artifact(path.local, path.remote)
     api.flutter_bcid.upload_provenance(path.local, path.remote)
@@ -395,6 +513,90 @@ def GenTests(api):
           build_number=123,
       ),
   )
+  yield api.test(
+      'batch_upload_artifacts',
+      api.properties(
+          build={
+              **build,
+              'batch_upload_artifacts': True,
+              'cas_archive_manifest': True,
+          },
+          no_goma=True,
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='linux-host',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          revision='abcd' * 10,
+          build_number=123,
+      ),
+  )
+  parallel_build = copy.deepcopy(build)
+  parallel_build['tests'] = [{
+      'name': 'parallel_test_%d' % i,
+      'script': 'myscript.sh',
+      'parameters': ['${FLUTTER_LOGS_DIR}'],
+      'type': 'local',
+      'parallel': True,
+      'cpus': cpus,
+  } for i, cpus in enumerate((2, 4, 100))] + [{
+      'name': 'context_test',
+      'script': 'myscript.sh',
+      'type': 'local',
+      'parallel': True,
+      'contexts': ['metric_center_token'],
+  }, {
+      'name': 'exclusive_test',
+      'script': 'myscript.sh',
+      'type': 'local',
+      'parallel': True,
+      'exclusive': True,
+  }]
+  yield api.test(
+      'parallel_local_tests',
+      api.properties(build=parallel_build, no_goma=True),
+      api.platform('linux', 64),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='linux-host',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          revision='abcd' * 10,
+          build_number=123,
+      ),
+      # Tests entering contexts run on their own.
+      api.post_process(post_process.MustRun, 'test: context_test'),
+  )
+  yield api.test(
+      'parallel_local_tests_failure',
+      api.properties(build=parallel_build, no_goma=True),
+      api.platform('linux', 64),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='linux-host',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          revision='abcd' * 10,
+          build_number=123,
+      ),
+      api.step_data(
+          'run parallel tests.parallel_test_0.test: parallel_test_0',
+          retcode=1
+      ),
+      api.step_data(
+          'run parallel tests.parallel_test_0.test: parallel_test_0 (2)',
+          retcode=1
+      ),
+      api.step_data(
+          'run parallel tests.parallel_test_0.test: parallel_test_0 (3)',
+          retcode=1
+      ),
+      status='FAILURE',
+  )
   yield api.test(
       'config_file',
       api.properties(no_goma=True, config_name='abc'),
@@ -497,6 +699,33 @@ def GenTests(api):
           stdout=api.raw_io.output_text(fake_bcid_response_success)
       ),
   )
+  yield api.test(
+      'dart-internal-flutter-pipelined-verification',
+      api.properties(
+          build={
+              **build, 'pipelined_verification': True
+          }, no_goma=True
+      ),
+      api.buildbucket.ci_build(
+          project='dart-internal',
+          bucket='flutter',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+      ),
+      api.step_data(
+          'Verify {0} provenance.verify {0} provenance'
+          .format(artifacts_location),
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+      api.step_data(
+          'Verify {0} provenance.verify {0} provenance'.format(jar_location),
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+      api.step_data(
+          'Verify {0} provenance.verify {0} provenance'.format(pom_location),
+          stdout=api.raw_io.output_text(fake_bcid_response_success)
+      ),
+  )
   test_if_build = {
       "name":
           "flutter/build",
@@ -38,7 +38,12 @@ def RunSteps(api):
       if api.path.exists(p):
         api.file.rmtree(f'Removing path {p} from archive', p)
 
-    api.cache.write(cache_name, paths, cache_ttl)
+    api.cache.write(
+        cache_name,
+        paths,
+        cache_ttl,
+        manifest=api.properties.get('cache_manifest', False),
+    )
 
 
 def GenTests(api):
@@ -50,3 +55,16 @@ def GenTests(api):
           stdout=api.json.output({}),
       )
   )
+  yield api.test(
+      'manifest',
+      api.properties(
+          cache_root='cache',
+          cache_name='builder',
+          cache_paths=['builder', 'git'],
+          cache_manifest=True,
+      ),
+      api.step_data(
+          'gsutil cat',
+          stdout=api.json.output({}),
+      ),
+  )
@@ -12,6 +12,8 @@
 # to be ready and then spawn subbuilds to run expensive tests using
 # engine_v2/tester.py.
 
+from recipe_engine import post_process
+
 from RECIPE_MODULES.flutter.flutter_bcid.api import BcidStage
 
 DEPS = [
@@ -113,11 +115,58 @@ def RunSteps(api):
         builds, presentation, branch=current_branch
     )
 
+  # Launch each test as soon as its dependencies are ready instead of waiting
+  # for every build to complete.
+  flag_stream_tests = (luci_flags.get('stream_tests') or
+                       False) and not api.flutter_bcid.is_official_build()
+  test_tasks = None
+
+  # Poll sub-builds frequently at first and back off while they keep running,
+  # optionally canceling the remaining builds as soon as one of them fails.
+  flag_adaptive_collect = luci_flags.get('adaptive_collect') or False
+  flag_fail_fast_builds = luci_flags.get('fail_fast_builds') or False
+  # Adaptive collection displays each sub-build as soon as it completes.
+  display_completed = None
+  if flag_adaptive_collect:
+    display_completed = lambda result: api.display_util.display_subbuilds(
+        step_name='display %s' % result.build_name,
+        subbuilds={result.build_id: result},
+    )
+
   # Builds will take some time to come back; see if we want to do some other work while we wait.
   flag_delay_collect_builds = luci_flags.get('delay_collect_builds') or False
-  if not flag_delay_collect_builds:
+  if flag_stream_tests:
+    for d in tests:
+      d['parent_commit'] = parent_commit
+    with api.step.nest('collect builds') as presentation:
+      build_results, test_tasks = (
+          api.shard_util.collect_builds_and_schedule_tests(
+              tasks, tests, presentation
+          )
+      )
+
+    try:
+      api.display_util.display_subbuilds(
+          step_name='display builds',
+          subbuilds=build_results,
+          raise_on_failure=True,
+      )
+    except api.step.StepFailure:
+      # Tests launched before a build failed would otherwise keep running
+      # unattended.
+      if test_tasks:
+        api.shard_util.cancel_builds(
+            test_tasks, 'Canceled after a build failed'
+        )
+      raise
+  elif not flag_delay_collect_builds:
     with api.step.nest('collect builds') as presentation:
-        build_results = api.shard_util.collect(tasks)
+        build_results = api.shard_util.collect(
+            tasks,
+            adaptive=flag_adaptive_collect,
+            on_completed=display_completed,
+            fail_fast=flag_fail_fast_builds,
+        )
 
     api.display_util.display_subbuilds(
         step_name='display builds',
@@ -154,9 +203,14 @@ def RunSteps(api):
       # out folder.
       api.file.rmtree('Clobber build output', full_engine_checkout / 'src/out')
 
-  if flag_delay_collect_builds:
+  if flag_delay_collect_builds and not flag_stream_tests:
     with api.step.nest('collect builds') as presentation:
-        build_results = api.shard_util.collect(tasks)
+        build_results = api.shard_util.collect(
+            tasks,
+            adaptive=flag_adaptive_collect,
+            on_completed=display_completed,
+            fail_fast=flag_fail_fast_builds,
+        )
 
     api.display_util.display_subbuilds(
         step_name='display builds',
@@ -173,25 +227,51 @@ def RunSteps(api):
     api.file.rmtree('Clobber build download folder', out_builds_path)
 
     flag_parallel_download_builds = luci_flags.get('parallel_download_builds') or False
+    flag_digest_store_download_builds = luci_flags.get(
+        'digest_store_download_builds'
+    ) or False
 
-    api.shard_util.download_full_builds(build_results, out_builds_path, flag_parallel_download_builds)
+    api.shard_util.download_full_builds(
+        build_results,
+        out_builds_path,
+        flag_parallel_download_builds,
+        use_digest_store=flag_digest_store_download_builds,
+        paths=_generator_inputs(generators),
+        max_concurrency=luci_flags.get('download_builds_concurrency'),
+    )
     with api.step.nest('Global generators') as presentation, api.osx_sdk('ios'):
       if 'tasks' in generators:
         api.flutter_bcid.report_stage(BcidStage.COMPILE.value)
         _run_global_generators(
             api, generators, full_engine_checkout, env, env_prefixes
         )
-        _archive(api, archives, full_engine_checkout, env, env_prefixes)
+        _archive(
+            api,
+            archives,
+            full_engine_checkout,
+            env,
+            env_prefixes,
+            batch_upload=luci_flags.get('batch_upload_artifacts') or False,
+        )
 
   # Run tests
   if not api.flutter_bcid.is_official_build():
-    with api.step.nest('launch tests') as presentation:
-      for d in tests:
-        d['parent_commit'] = parent_commit
-      tasks = api.shard_util.schedule_tests(tests, build_results, presentation)
+    if test_tasks is not None:
+      tasks = test_tasks
+    else:
+      with api.step.nest('launch tests') as presentation:
+        for d in tests:
+          d['parent_commit'] = parent_commit
+        tasks = api.shard_util.schedule_tests(
+            tests, build_results, presentation
+        )
 
     with api.step.nest('collect tests') as presentation:
-      test_results = api.shard_util.collect(tasks)
+      test_results = api.shard_util.collect(
+          tasks,
+          adaptive=flag_adaptive_collect,
+          on_completed=display_completed,
+      )
 
     api.display_util.display_subbuilds(
         step_name='display tests',
@@ -200,13 +280,38 @@ def RunSteps(api):
     )
 
 
-def _archive(api, archives, full_engine_checkout, env, env_prefixes):
+def _generator_inputs(generators):
+  """Returns the sub-build output paths read by the global generators.
+
+  Generator tasks can declare the paths relative to the out folder they read
+  using `inputs`, e.g. `["ios_debug/Flutter.framework"]`. If any of the tasks
+  does not declare its inputs all the sub-build outputs are needed.
+
+  Args:
+    generators: (dict) global generator configurations.
+
+  Returns:
+    A sorted list of paths or None if every sub-build output is needed.
+  """
+  inputs = set()
+  for generator_task in generators.get('tasks', []):
+    if 'inputs' not in generator_task:
+      return None
+    inputs.update(generator_task['inputs'])
+  return sorted(inputs)
+
+
+def _archive(
+    api, archives, full_engine_checkout, env, env_prefixes, batch_upload=False
+):
   """Proces global archives.
 
   Args:
     api: Object point to all the imported modules of this build.
     archives: List of global archive configurations.
     full_engine_path: Path to a gclient engine checkout.
+    batch_upload: Whether to upload all the archives with one transfer per
+      bucket.
   """
   if not archives:
     return
@@ -236,9 +341,13 @@ def _archive(api, archives, full_engine_checkout, env, env_prefixes):
     ]
     with api.context(env=env, env_prefixes=env_prefixes):
       api.signing.code_sign(signing_paths)
-  for archive in files_to_archive:
-    api.archives.upload_artifact(archive.local, archive.remote)
-    api.flutter_bcid.upload_provenance(archive.local, archive.remote)
+  if batch_upload:
+    for archive in api.archives.upload_artifacts(files_to_archive):
+      api.flutter_bcid.upload_provenance(archive.local, archive.remote)
+  else:
+    for archive in files_to_archive:
+      api.archives.upload_artifact(archive.local, archive.remote)
+      api.flutter_bcid.upload_provenance(archive.local, archive.remote)
   api.flutter_bcid.report_stage(BcidStage.UPLOAD_COMPLETE.value)
 
 
@@ -701,3 +810,270 @@ def GenTests(api):
           .output_text('12345abcde12345abcde12345abcde12345abcde\n')
       )
   )
+
+  streamed_build = api.shard_util.try_build_message(
+      build_id=8945511751514863188,
+      builder="ios_debug",
+      output_props={"cas_output_hash": {"ios_debug": "bcd"}},
+      status="SUCCESS",
+  )
+  streamed_test = api.shard_util.try_build_message(
+      build_id=8945511751514863189,
+      builder="felt_test",
+      status="SUCCESS",
+  )
+  yield api.test(
+      'stream_tests',
+      api.platform.name('linux'),
+      api.properties(
+          config_name='config_name',
+          luci_flags={
+              "stream_tests": True,
+          }
+      ),
+      api.monorepo.ci_build(),
+      api.step_data(
+          'Read build config file',
+          api.file.read_json({
+              'builds': builds,
+              'tests': [{
+                  'name': 'felt_test',
+                  'dependencies': ['ios_debug'],
+              }],
+          })
+      ),
+      api.shard_util.streaming_build_steps(
+          subbuilds=[streamed_build],
+          collect_step="collect builds",
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_build],
+          launch_step="launch builds.schedule",
+      ),
+      api.shard_util.child_build_steps(
+          subbuilds=[streamed_test],
+          launch_step="collect builds.schedule",
+          collect_step="collect tests",
+      ),
+  )
+
+  failed_streamed_build = api.shard_util.try_build_message(
+      build_id=8945511751514863188,
+      builder="ios_debug",
+      status="FAILURE",
+  )
+  yield api.test(
+      'stream_tests_build_failure',
+      api.platform.name('linux'),
+      api.properties(
+          config_name='config_name',
+          luci_flags={
+              "stream_tests": True,
+          }
+      ),
+      api.monorepo.ci_build(),
+      api.step_data(
+          'Read build config file',
+          api.file.read_json({
+              'builds': builds,
+              'tests': [{
+                  'name': 'felt_test',
+                  'dependencies': [],
+              }],
+          })
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_build],
+          launch_step="launch builds.schedule",
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_test],
+          launch_step="collect builds.schedule",
+      ),
+      api.shard_util.streaming_build_steps(
+          subbuilds=[failed_streamed_build],
+          collect_step="collect builds",
+      ),
+      api.post_process(post_process.MustRun, 'cancel 1 remaining build'),
+      status='FAILURE',
+  )
+
+  yield api.test(
+      'stream_tests_unknown_dependency',
+      api.platform.name('linux'),
+      api.properties(
+          config_name='config_name',
+          luci_flags={
+              "stream_tests": True,
+          }
+      ),
+      api.monorepo.ci_build(),
+      api.step_data(
+          'Read build config file',
+          api.file.read_json({
+              'builds': builds,
+              'tests': [{
+                  'name': 'felt_test',
+                  'dependencies': ['not_a_build'],
+              }],
+          })
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_build],
+          launch_step="launch builds.schedule",
+      ),
+      status='FAILURE',
+  )
+
+  yield api.test(
+      'adaptive_collect',
+      api.platform.name('linux'),
+      api.properties(
+          config_name='config_name',
+          luci_flags={
+              "adaptive_collect": True,
+              "fail_fast_builds": True,
+          }
+      ),
+      api.monorepo.ci_build(),
+      api.step_data(
+          'Read build config file',
+          api.file.read_json({
+              'builds': builds,
+              'tests': [{
+                  'name': 'felt_test',
+                  'dependencies': ['ios_debug'],
+              }],
+          })
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_build],
+          launch_step="launch builds.schedule",
+      ),
+      api.shard_util.streaming_build_steps(
+          subbuilds=[streamed_build],
+          collect_step="collect builds",
+      ),
+      api.shard_util.schedule_build_steps(
+          subbuilds=[streamed_test],
+          launch_step="launch tests.schedule",
+      ),
+      api.shard_util.streaming_build_steps(
+          subbuilds=[streamed_test],
+          collect_step="collect tests",
+      ),
+      api.post_process(
+          post_process.MustRun, 'collect builds.display ios_debug.ios_debug'
+      ),
+  )
+
+  yield api.test(
+      'digest_store_download_builds', api.platform.name('mac'),
+      api.properties(
+          builds=builds,
+          tests=[],
+          generators=generators,
+          archives=archives,
+          config_name='config_name',
+          is_fusion='true',
+          luci_flags={
+            "digest_store_download_builds": True,
+          }
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='prod-builder',
+          git_repo='https://flutter.googlesource.com/mirrors/flutter',
+          git_ref='refs/heads/main',
+          revision='a' * 40,
+          build_number=123,
+      ),
+      api.shard_util.child_build_steps(
+          subbuilds=[try_subbuild1],
+          launch_step="launch builds.schedule",
+          collect_step="collect builds",
+      ),
+      api.step_data(
+          'Global generators.git rev-parse',
+          stdout=api.raw_io
+          .output_text('12345abcde12345abcde12345abcde12345abcde\n')
+      )
+  )
+
+  generators_with_inputs = {
+      "tasks": [{
+          "language": "python3",
+          "name": "Debug-FlutterMacOS.framework",
+          "inputs": ["builder-subbuild1/FlutterMacOS.framework"],
+          "script": "flutter/sky/tools/create_macos_framework.py",
+          "type": "local"
+      }]
+  }
+  yield api.test(
+      'selective_download_builds', api.platform.name('mac'),
+      api.properties(
+          builds=builds,
+          tests=[],
+          generators=generators_with_inputs,
+          archives=archives,
+          config_name='config_name',
+          is_fusion='true',
+          luci_flags={
+            "digest_store_download_builds": True,
+            "parallel_download_builds": True,
+            "download_builds_concurrency": 2,
+          }
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='prod-builder',
+          git_repo='https://flutter.googlesource.com/mirrors/flutter',
+          git_ref='refs/heads/main',
+          revision='a' * 40,
+          build_number=123,
+      ),
+      api.shard_util.child_build_steps(
+          subbuilds=[try_subbuild1],
+          launch_step="launch builds.schedule",
+          collect_step="collect builds",
+      ),
+      api.step_data(
+          'Global generators.git rev-parse',
+          stdout=api.raw_io
+          .output_text('12345abcde12345abcde12345abcde12345abcde\n')
+      )
+  )
+
+  yield api.test(
+      'batch_upload_artifacts', api.platform.name('mac'),
+      api.properties(
+          builds=builds,
+          tests=[],
+          generators=generators,
+          archives=archives,
+          luci_flags={
+            "batch_upload_artifacts": True,
+          }
+      ),
+      api.buildbucket.ci_build(
+          project='flutter',
+          bucket='prod',
+          builder='prod-builder',
+          git_repo='https://flutter.googlesource.com/mirrors/engine',
+          git_ref='refs/heads/main',
+          revision='a' * 40,
+          build_number=123,
+      ),
+      api.shard_util.child_build_steps(
+          subbuilds=[try_subbuild1],
+          launch_step="launch builds.schedule",
+          collect_step="collect builds",
+      ),
+      api.step_data(
+          'Global generators.git rev-parse',
+          stdout=api.raw_io
+          .output_text('12345abcde12345abcde12345abcde12345abcde\n')
+      )
+  )
@@ -97,7 +97,8 @@ def run_tests(api, test, checkout, env, env_prefixes):
       return api.step(step_name, command, timeout=test_timeout_secs)
 
     api.logs_util.initialize_logs_collection(env)
-    try:
+    # Logs are uploaded while the test runs so they survive a timeout.
+    with api.logs_util.streaming_upload_logs(task.get('name')):
       # Run within another context to make the logs env variable available to
       # test scripts.
       with contextlib.ExitStack() as exit_stack:
@@ -110,8 +111,6 @@ def run_tests(api, test, checkout, env, env_prefixes):
               step_name=task.get('name'),
               max_attempts=task.get('max_attempts', 3)
           )
-    finally:
-      api.logs_util.upload_logs(task.get('name'))
   # This is to clean up leaked processes.
   api.os_utils.kill_processes()
   # Collect memory/cpu/process after task execution.
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Copyright 2024 The Flutter Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Micro-benchmark of relativize_args.py over a clang command line.
+
+Usage: scripts/relativize_args_benchmark.py [--flags N] [--repeat N]
+
+Builds a compile command shaped like the engine ones, with N include and
+define flags under the current directory, and times relativize_command with
+cold caches, as for the first command of an interpreter, and warm caches, as
+for the following commands of a --batch run. The uncached baseline stats and
+computes the relative path of every absolute token.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'recipe_modules', 'rbe', 'resources'
+    )
+)
+
+import relativize_args  # pylint: disable=wrong-import-position
+
+
+def clang_command(root, flags):
+  """Returns a clang compile command with |flags| include and define flags."""
+  out = os.path.join(root, 'out', 'host_debug')
+  command = [
+      os.path.join(root, 'buildtools', 'linux-x64', 'clang', 'bin', 'clang++'),
+      '-MD',
+      '-MF',
+      os.path.join(out, 'obj', 'flutter', 'shell', 'common', 'engine.o.d'),
+      '--sysroot=' + os.path.join(root, 'build', 'linux', 'sysroot'),
+      '-fprofile-list=' + os.path.join(root, 'build', 'profile.list'),
+      '-Wl,--version-script=' + os.path.join(root, 'build', 'exports.lst'),
+  ]
+  for i in range(flags // 2):
+    directory = os.path.join(root, 'third_party', 'lib%d' % (i % 50), 'include')
+    command.append('-I' + os.path.join(directory, 'sub%d' % i))
+    command.append('-DFLUTTER_DEFINE_%d=%d' % (i, i))
+  command += [
+      '-isystem' + os.path.join(root, 'third_party', 'libcxx', 'include'),
+      '-c',
+      os.path.join(root, 'flutter', 'shell', 'common', 'engine.cc'),
+      '-o',
+      os.path.join(out, 'obj', 'flutter', 'shell', 'common', 'engine.o'),
+  ]
+  return command, Path(out)
+
+
+def uncached_relativize_path(arg, start):
+  """relativize_args.relativize_path without the memoization."""
+  for flag in ('-I', '-L', '-isystem'):
+    if arg.startswith(flag):
+      return flag + uncached_relativize_path(arg[len(flag):], start)
+  path = Path(arg)
+  if path.is_absolute() and relativize_args.greatest_path_parent(path).exists():
+    return os.path.relpath(arg, start=start)
+  return arg
+
+
+def clear_caches():
+  relativize_args._path_root_exists.cache_clear()
+  relativize_args._relative_dir.cache_clear()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--flags', type=int, default=2000)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  command, working_dir = clang_command(os.getcwd(), args.flags)
+
+  def uncached():
+    start = working_dir.absolute()
+    for token in command:
+      relativize_args.lexically_rewrite_token(
+          token, lambda x: uncached_relativize_path(x, start)
+      )
+
+  def cold():
+    clear_caches()
+    relativize_args.relativize_command(command, working_dir)
+
+  def warm():
+    relativize_args.relativize_command(command, working_dir)
+
+  print('%d tokens, best of %d runs:' % (len(command), args.repeat))
+  for name, fn in (('uncached', uncached), ('cold caches', cold),
+                   ('warm caches', warm)):
+    best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+    print('  %-12s %8.2f ms' % (name, best * 1000))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())